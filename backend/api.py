@@ -1,42 +1,105 @@
-from flask import Flask, request, jsonify, send_file, render_template
+from flask import Flask, Response, request, jsonify, send_file, render_template, stream_with_context
 from flask_cors import CORS
-import re
+from werkzeug.datastructures import FileStorage
 from io import BytesIO
-import nltk
+from itertools import chain
 from datetime import datetime
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import threading
+import time
 from dotenv import load_dotenv
 
-# Download NLTK data if not already present
-try:
-    from nltk.corpus import stopwords
-    stopwords.words("english")
-except LookupError:
-    print("Downloading NLTK stopwords...")
-    nltk.download('stopwords', quiet=True)
-    from nltk.corpus import stopwords
-
-from nltk.stem.porter import PorterStemmer
-import matplotlib.pyplot as plt
-import pandas as pd
-import pickle
 import base64
+from bson import ObjectId
+from model_loader import load_models, get_models, model_status
+from inference import sparse_predict_proba
+from text_processing import normalize_text, preload as preload_text_processing
+from bulk import (predict_chunk, predict_corpus, predict_texts, iter_upload_predictions,
+                  stream_predictions, SentimentSummary)
+from ingest import UPLOAD_MIME_TYPES, DecompressRequestMiddleware, is_supported_upload, read_reviews
+from batching import MicroBatcher, MICRO_BATCHING_ENABLED
+from prediction_cache import get_prediction_cache
+from pagination import keyset_page
+from content_encoding import negotiate_content_encoding, encode_stream
+from user_export import (USER_DATA_BATCH_SIZE, USER_DATA_MIME_TYPES, parse_fields, parse_date, user_data_query,
+                         user_data_projection, iter_user_data)
+from charts import CHART_FORMATS, CHART_MIME_TYPES, chart_spec, distribution_counts, render_chart, preload as preload_charts
+from output_formats import (OUTPUT_FORMATS, negotiate_output_format, format_available, create_writer,
+                            output_mimetype, output_filename)
+from bulk_storage import create_bulk_session, save_bulk_reviews, finish_bulk_session, build_bulk_review_docs
+from worker_memory import process_memory
+from jobs import (JOBS_AVAILABLE, TERMINAL_STATUSES, create_job, get_job, open_job_result,
+                  serialize_job, start_job_recovery)
 
 # Import database and auth modules
 try:
     from database import users_collection, reviews_collection, analysis_sessions_collection
-    from auth import require_auth, optional_auth
+    from auth import require_auth, require_metrics_token, auth_cache_stats, get_user_info_from_clerk
+    from clerk_profiles import profile_stats
+    from bulk_writer import get_bulk_writer
+    from write_behind import get_write_behind
+    from users import get_or_create_user, refresh_user, user_cache_stats
+    from user_stats import (DATA_VERSION_FIELD, get_data_version, get_user_stats as read_user_stats, mark_stats_stale,
+                            review_increments)
     DB_AVAILABLE = True
 except ImportError as e:
     print(f"⚠️ Warning: Database modules not available: {e}")
     DB_AVAILABLE = False
 
-STOPWORDS = set(stopwords.words("english"))
-
 load_dotenv()
 
+# Maximum number of texts accepted by /predict/batch in one request
+BATCH_MAX_TEXTS = int(os.getenv("BATCH_MAX_TEXTS", 1000))
+
+# Server-Sent Events polling for bulk job progress
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", 1))
+JOB_EVENTS_MAX_SECONDS = int(os.getenv("JOB_EVENTS_MAX_SECONDS", 300))
+
+# How long session reads wait for the session's queued background writes before answering "pending"
+SESSION_FLUSH_TIMEOUT_S = float(os.getenv("SESSION_FLUSH_TIMEOUT_S", 2))
+
+# Request headers the /api/user-data body depends on (format negotiation and content encoding)
+USER_DATA_VARY = ("Accept", "Accept-Encoding")
+
+# Load model artifacts once per worker so requests don't unpickle them
+try:
+    load_models()
+except Exception as e:
+    print(f"⚠️ Warning: Models not loaded at startup, will retry on first request: {e}")
+
+# Set by gunicorn_config.py when the app is imported once in the master and forked into workers
+PRELOAD_APP = os.getenv("PRELOAD_APP", "").lower() in ("1", "true", "yes")
+
+# This module and its helpers import pandas, nltk and matplotlib only where they are used, but
+# load_models() above already pulls in pandas, scipy and sklearn while unpickling the artifacts.
+# Finish importing the rest off the boot path so the first request doesn't pay for it; a
+# preloading master imports them before forking so the workers share them.
+if PRELOAD_APP:
+    preload_text_processing()
+    preload_charts()
+elif os.getenv("PRELOAD_IMPORTS", "true").lower() in ("1", "true", "yes"):
+    threading.Thread(target=preload_text_processing, name="preload-imports", daemon=True).start()
+
+# Pick up bulk jobs left behind by recycled workers (started by post_fork in each preloaded worker,
+# since threads don't survive the fork)
+if not PRELOAD_APP:
+    start_job_recovery()
+
+# Buffers single-prediction review inserts and user counter updates off the request path
+write_behind = get_write_behind(reviews_collection, users_collection) if DB_AVAILABLE else None
+
+# Optional scheduler that coalesces concurrent single-text predictions
+prediction_batcher = MicroBatcher(lambda texts: predict_texts(*get_models(), texts)) if MICRO_BATCHING_ENABLED else None
+
 app = Flask(__name__)
 
+# Clients may gzip/deflate large uploads (Content-Encoding); decode them before form parsing
+app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app)
+
 # Configure CORS for production
 # Get allowed origins from environment or default to all for development
 allowed_origins = os.getenv("CORS_ORIGINS", "*")
@@ -53,6 +116,31 @@ def test():
     return "Test request received successfully. Service is running."
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check - reports whether the model artifacts are loaded"""
+    status = model_status()
+    status["status"] = "ready" if status["models_loaded"] else "loading"
+    return jsonify(status), 200 if status["models_loaded"] else 503
+
+
+@app.route("/metrics", methods=["GET"])
+@require_metrics_token
+def metrics():
+    """Internal performance counters for tuning (needs METRICS_TOKEN)"""
+    prediction_cache = get_prediction_cache()
+    return jsonify({
+        "micro_batching": prediction_batcher.stats() if prediction_batcher else {"enabled": False},
+        "prediction_cache": prediction_cache.stats() if prediction_cache else {"enabled": False},
+        "bulk_writer": get_bulk_writer().stats() if DB_AVAILABLE else {"enabled": False},
+        "write_behind": write_behind.stats() if write_behind else {"enabled": False},
+        "user_cache": user_cache_stats() if DB_AVAILABLE else {"enabled": False},
+        "auth": auth_cache_stats() if DB_AVAILABLE else {"enabled": False},
+        "clerk_profiles": profile_stats() if DB_AVAILABLE else {"enabled": False},
+        "memory": process_memory(),
+    })
+
+
 @app.route("/", methods=["GET", "POST"])
 def home():
     return render_template("index.html")
@@ -68,62 +156,6 @@ def dashboard():
     return render_template("dashboard.html")
 
 
-def get_or_create_user(clerk_user_id, email=None, name=None):
-    """Get existing user or create new one, updating email/name if missing"""
-    if not DB_AVAILABLE:
-        return None
-    
-    try:
-        user = users_collection.find_one({"clerk_user_id": clerk_user_id})
-        
-        if not user:
-            # Create new user
-            user = {
-                "clerk_user_id": clerk_user_id,
-                "email": email,
-                "name": name,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow(),
-                "total_reviews": 0,
-                "total_sessions": 0
-            }
-            users_collection.insert_one(user)
-            print(f"✅ Created new user: {clerk_user_id} (email: {email}, name: {name})")
-        else:
-            # Update user info if email or name is missing
-            update_fields = {"updated_at": datetime.utcnow()}
-            updated = False
-            
-            # Update email if missing and we have it
-            if (not user.get("email") or user.get("email") is None) and email:
-                update_fields["email"] = email
-                updated = True
-                print(f"✅ Updated email for user: {clerk_user_id} -> {email}")
-            
-            # Update name if missing and we have it
-            if (not user.get("name") or user.get("name") is None) and name:
-                update_fields["name"] = name
-                updated = True
-                print(f"✅ Updated name for user: {clerk_user_id} -> {name}")
-            
-            # Update the user document
-            if updated:
-                users_collection.update_one(
-                    {"clerk_user_id": clerk_user_id},
-                    {"$set": update_fields}
-                )
-            else:
-                # Just update last activity if no info to update
-                users_collection.update_one(
-                    {"clerk_user_id": clerk_user_id},
-                    {"$set": {"updated_at": datetime.utcnow()}}
-                )
-        
-        return user
-    except Exception as e:
-        print(f"Error in get_or_create_user: {e}")
-        return None
-
 @app.route("/predict", methods=["POST"])
 @require_auth
 def predict():
@@ -145,95 +177,90 @@ def predict():
     if DB_AVAILABLE:
         user = get_or_create_user(clerk_user_id, email=email, name=name)
     
-    # Select the predictor to be loaded from Models folder
-    predictor = pickle.load(open(r"Models/model_xgb.pkl", "rb"))
-    scaler = pickle.load(open(r"Models/scaler.pkl", "rb"))
-    cv = pickle.load(open(r"Models/countVectorizer.pkl", "rb"))
-    
     try:
+        # Models are loaded once per worker and shared across threads
+        predictor, scaler, cv = get_models()
+
         # Check if the request contains a file (for bulk prediction) or text input
-        if "file" in request.files:
-            # Bulk prediction from CSV or Excel file
-            file = request.files["file"]
-            filename = file.filename.lower()
-            
-            # Read file based on extension
-            if filename.endswith('.csv'):
-                data = pd.read_csv(file)
-            elif filename.endswith(('.xlsx', '.xls')):
-                data = pd.read_excel(file)
-            else:
-                return jsonify({"error": "Unsupported file format. Please upload CSV or Excel (.xlsx, .xls) file."}), 400
-            
-            # Find the review text column (flexible column name matching)
-            review_column = None
-            possible_names = ['Sentence', 'sentence', 'Review', 'review', 'review_text', 'Review Text', 
-                            'text', 'Text', 'comment', 'Comment', 'feedback', 'Feedback']
-            
-            for col in data.columns:
-                if col in possible_names or 'sentence' in col.lower() or 'review' in col.lower():
-                    review_column = col
-                    break
-            
-            if review_column is None:
-                return jsonify({"error": f"Could not find review column. Available columns: {', '.join(data.columns)}. Expected column names: Sentence, Review, review_text, etc."}), 400
+        file = request.files.get("file") or raw_body_upload()
+        if file is not None:
+            # Bulk prediction from CSV, NDJSON, Parquet, Excel, or a gzip/zip of them
+            filename = (file.filename or "").lower()
+            if not is_supported_upload(filename):
+                return jsonify({"error": "Unsupported file format. Please upload CSV, NDJSON, Parquet, Excel (.xlsx, .xls), zip or gzip files."}), 400
+
+            # Output format from ?format= or the Accept header (CSV unless asked otherwise)
+            output_format = negotiate_output_format(request.args.get("format"), request.accept_mimetypes)
+            if output_format is None:
+                return jsonify({"error": f"Unsupported output format. Use one of: {', '.join(OUTPUT_FORMATS)}."}), 406
+            if not format_available(output_format):
+                return jsonify({"error": f"{output_format} output requires pyarrow on the server."}), 406
+
+            # Every column is echoed back; ?keep_columns=false parses only the review column
+            keep_columns = wants_all_columns()
+
+            # Async mode: queue the upload as a background job and return 202 right away
+            if wants_async():
+                return start_bulk_job(file, clerk_user_id, output_format, keep_columns)
+
+            # Streaming mode: process the upload chunk by chunk and stream the predictions back
+            if wants_stream():
+                return stream_bulk_prediction(predictor, scaler, cv, file, clerk_user_id, output_format, keep_columns)
             
-            # Rename the column to 'Sentence' for consistency
-            data = data.rename(columns={review_column: 'Sentence'})
+            # Sniff the format and header, then read only what is needed into a "Sentence" column
+            try:
+                data = read_reviews(file, file.filename, keep_columns=keep_columns)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
 
-            predictions, graph = bulk_prediction(predictor, scaler, cv, data)
+            # The header chart is kept for CSV clients that rely on it; other formats fetch
+            # the summary and chart from /api/sessions/<id>/summary instead
+            chart_format = request.args.get("chart", "png" if output_format == "csv" else "none").lower()
+            if chart_format not in CHART_FORMATS:
+                return jsonify({"error": f"Unsupported chart format. Use one of: {', '.join(CHART_FORMATS)} "
+                                         f"(the JSON chart spec is in the session summary)."}), 400
+
+            predictions, graph = bulk_prediction(predictor, scaler, cv, data, chart_format, output_format)
             
             # Save bulk analysis session to MongoDB
             session_id = None
             if DB_AVAILABLE:
                 try:
+                    # Session, reviews and user stats are written in the background
                     session_id = save_bulk_analysis(clerk_user_id, data, file.filename)
-                    # Update user stats
-                    users_collection.update_one(
-                        {"clerk_user_id": clerk_user_id},
-                        {
-                            "$inc": {"total_sessions": 1, "total_reviews": len(data)},
-                            "$set": {"updated_at": datetime.utcnow()}
-                        }
-                    )
-                    print(f"✅ Saved bulk analysis session for user: {clerk_user_id}")
+                    print(f"✅ Queued bulk analysis session for user: {clerk_user_id}")
                 except Exception as e:
                     print(f"Error saving bulk analysis: {e}")
 
             response = send_file(
                 predictions,
-                mimetype="text/csv",
+                mimetype=output_mimetype(output_format),
                 as_attachment=True,
-                download_name="Predictions.csv",
+                download_name=output_filename(output_format),
             )
 
-            response.headers["X-Graph-Exists"] = "true"
-            response.headers["X-Graph-Data"] = base64.b64encode(graph.getbuffer()).decode("ascii")
+            # ?chart=none lets clients that draw their own charts skip server-side rendering
+            response.headers["X-Graph-Exists"] = "true" if graph is not None else "false"
+            if graph is not None:
+                response.headers["X-Graph-Format"] = chart_format
+                response.headers["X-Graph-Data"] = base64.b64encode(graph).decode("ascii")
             if session_id:
                 response.headers["X-Session-Id"] = str(session_id)
+                response.headers["X-Summary-Url"] = f"/api/sessions/{session_id}/summary"
 
             return response
 
         elif request.json and "text" in request.json:
             # Single string prediction
             text_input = request.json["text"]
-            predicted_sentiment, confidence = single_prediction_with_confidence(predictor, scaler, cv, text_input)
+            if prediction_batcher is not None:
+                predicted_sentiment, confidence = prediction_batcher.submit(text_input)
+            else:
+                predicted_sentiment, confidence = single_prediction_with_confidence(predictor, scaler, cv, text_input)
             
-            # Save individual review to MongoDB
+            # Save individual review and user stats to MongoDB (buffered unless WRITE_BEHIND=false)
             if DB_AVAILABLE:
-                try:
-                    save_review(clerk_user_id, text_input, predicted_sentiment, confidence)
-                    # Update user stats
-                    users_collection.update_one(
-                        {"clerk_user_id": clerk_user_id},
-                        {
-                            "$inc": {"total_reviews": 1},
-                            "$set": {"updated_at": datetime.utcnow()}
-                        }
-                    )
-                    print(f"✅ Saved review for user: {clerk_user_id}")
-                except Exception as e:
-                    print(f"Error saving review: {e}")
+                save_review(clerk_user_id, text_input, predicted_sentiment, confidence)
 
             return jsonify({"prediction": predicted_sentiment, "confidence": confidence})
         else:
@@ -244,103 +271,217 @@ def predict():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/predict/batch", methods=["POST"])
+@require_auth
+def predict_batch():
+    """Predict many texts in one request: {"texts": [...]} or {"items": [{"id": ..., "text": ...}]}"""
+    clerk_user_id = getattr(request, 'clerk_user_id', None)
+    email = getattr(request, 'clerk_email', None)
+    name = getattr(request, 'clerk_name', None)
+
+    if not clerk_user_id or not isinstance(clerk_user_id, str) or len(clerk_user_id.strip()) == 0:
+        print(f"❌ SECURITY: Authentication failed - invalid clerk_user_id")
+        return jsonify({"error": "Authentication required"}), 401
+
+    clerk_user_id = str(clerk_user_id).strip()
+
+    payload = request.get_json(silent=True) or {}
+    if "items" in payload:
+        items = payload["items"]
+        if not isinstance(items, list) or not all(isinstance(item, dict) and isinstance(item.get("text"), str) for item in items):
+            return jsonify({"error": "'items' must be a list of objects with a 'text' string."}), 400
+        texts = [item["text"] for item in items]
+        client_ids = [item.get("id") for item in items]
+    elif "texts" in payload:
+        texts = payload["texts"]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            return jsonify({"error": "'texts' must be a list of strings."}), 400
+        client_ids = None
+    else:
+        return jsonify({"error": "Invalid request. Please provide 'texts' or 'items' in JSON format."}), 400
+
+    if not texts:
+        return jsonify({"predictions": []})
+    if len(texts) > BATCH_MAX_TEXTS:
+        return jsonify({"error": f"Too many texts in one batch (max {BATCH_MAX_TEXTS})."}), 413
+
+    if DB_AVAILABLE:
+        get_or_create_user(clerk_user_id, email=email, name=name)
+
+    try:
+        predictor, scaler, cv = get_models()
+
+        # One vectorization and one predict_proba call for the whole batch
+        sentiments, confidences = predict_texts(predictor, scaler, cv, texts)
+
+        predictions = []
+        for i, (sentiment, confidence) in enumerate(zip(sentiments, confidences)):
+            prediction = {"prediction": str(sentiment), "confidence": float(confidence)}
+            if client_ids is not None:
+                prediction["id"] = client_ids[i]
+            predictions.append(prediction)
+
+        if DB_AVAILABLE:
+            save_review_batch(clerk_user_id, texts, sentiments, confidences, client_ids)
+
+        return jsonify({"predictions": predictions})
+    except Exception as e:
+        print(f"Error in predict batch endpoint: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 def single_prediction(predictor, scaler, cv, text_input):
-    corpus = []
-    stemmer = PorterStemmer()
-    review = re.sub("[^a-zA-Z]", " ", text_input)
-    review = review.lower().split()
-    review = [stemmer.stem(word) for word in review if not word in STOPWORDS]
-    review = " ".join(review)
-    corpus.append(review)
-    X_prediction = cv.transform(corpus).toarray()
-    X_prediction_scl = scaler.transform(X_prediction)
-    y_predictions = predictor.predict_proba(X_prediction_scl)
+    corpus = [normalize_text(text_input)]
+    y_predictions = sparse_predict_proba(predictor, scaler, cv, corpus)
     y_predictions = y_predictions.argmax(axis=1)[0]
 
     return "Positive" if y_predictions == 1 else "Negative"
 
 
 def single_prediction_with_confidence(predictor, scaler, cv, text_input):
-    corpus = []
-    stemmer = PorterStemmer()
-    review = re.sub("[^a-zA-Z]", " ", text_input)
-    review = review.lower().split()
-    review = [stemmer.stem(word) for word in review if not word in STOPWORDS]
-    review = " ".join(review)
-    corpus.append(review)
-    X_prediction = cv.transform(corpus).toarray()
-    X_prediction_scl = scaler.transform(X_prediction)
-    y_proba = predictor.predict_proba(X_prediction_scl)[0]
-    y_predictions = y_proba.argmax()
-    confidence = float(y_proba[y_predictions])
-    sentiment = "Positive" if y_predictions == 1 else "Negative"
-    
-    return sentiment, confidence
-
-
-def bulk_prediction(predictor, scaler, cv, data):
-    corpus = []
-    stemmer = PorterStemmer()
-    for i in range(0, data.shape[0]):
-        review = re.sub("[^a-zA-Z]", " ", data.iloc[i]["Sentence"])
-        review = review.lower().split()
-        review = [stemmer.stem(word) for word in review if not word in STOPWORDS]
-        review = " ".join(review)
-        corpus.append(review)
-
-    X_prediction = cv.transform(corpus).toarray()
-    X_prediction_scl = scaler.transform(X_prediction)
-    y_predictions = predictor.predict_proba(X_prediction_scl)
-    y_predictions = y_predictions.argmax(axis=1)
-    y_predictions = list(map(sentiment_mapping, y_predictions))
-
-    data["Predicted sentiment"] = y_predictions
-    predictions_csv = BytesIO()
-
-    data.to_csv(predictions_csv, index=False)
-    predictions_csv.seek(0)
-
-    graph = get_distribution_graph(data)
-
-    return predictions_csv, graph
-
-
-def get_distribution_graph(data):
-    fig = plt.figure(figsize=(5, 5))
-    colors = ("green", "red")
-    wp = {"linewidth": 1, "edgecolor": "black"}
-    tags = data["Predicted sentiment"].value_counts()
-    explode = (0.01, 0.01)
-
-    tags.plot(
-        kind="pie",
-        autopct="%1.1f%%",
-        shadow=True,
-        colors=colors,
-        startangle=90,
-        wedgeprops=wp,
-        explode=explode,
-        title="Sentiment Distribution",
-        xlabel="",
-        ylabel="",
-    )
+    # Repeated reviews are served from the prediction cache
+    sentiments, confidences = predict_corpus(predictor, scaler, cv, [normalize_text(text_input)])
+    return str(sentiments[0]), float(confidences[0])
 
-    graph = BytesIO()
-    plt.savefig(graph, format="png")
-    plt.close()
 
-    return graph
+def bulk_prediction(predictor, scaler, cv, data, chart_format="png", output_format="csv"):
+    # Features stay sparse end to end, so memory scales with nonzeros rather than rows x vocabulary
+    predict_chunk(predictor, scaler, cv, data)
 
+    writer = create_writer(output_format)
+    predictions = BytesIO(writer.write(data) + writer.close())
+
+    graph = get_distribution_graph(data, chart_format)
+
+    return predictions, graph
+
+
+def get_distribution_graph(data, chart_format="png"):
+    """Sentiment distribution chart as png or svg bytes; None when charts are turned off"""
+    if chart_format == "none":
+        return None
+    positive, negative = distribution_counts(data["Predicted sentiment"])
+    return render_chart(positive, negative, chart_format)
 
-def sentiment_mapping(x):
-    if x == 1:
-        return "Positive"
-    else:
-        return "Negative"
+
+def wants_stream():
+    """Whether the client asked for a streamed bulk response (?stream=true)"""
+    return request.args.get("stream", "").lower() in ("1", "true", "yes")
+
+
+def wants_all_columns():
+    """Whether every upload column is echoed back; ?keep_columns=false returns only the review and predictions"""
+    return request.args.get("keep_columns", "true").lower() not in ("0", "false", "no")
+
+
+def user_data_etag(clerk_user_id, data_version):
+    """ETag of a per-user read: the user's data version, scoped to the user and the URL"""
+    scope = hashlib.blake2b(f"{clerk_user_id} {request.full_path}".encode(), digest_size=8)
+    return f"{data_version}-{scope.hexdigest()}"
+
+
+def not_modified(etag, vary=()):
+    """304 response when the client's If-None-Match already has this ETag, else None.
+
+    It carries the same ETag, Cache-Control and Vary as the 200 would, so caches keep
+    treating the stored response the same way (RFC 9110 §15.4.5).
+    """
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    return revalidated(response, etag, vary)
+
+
+def revalidated(response, etag, vary=()):
+    """Tag a per-user read so the browser keeps it but checks back with If-None-Match every time.
+
+    vary lists the request headers, besides Authorization, that the body depends on.
+    """
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["Vary"] = ", ".join(("Authorization",) + tuple(vary))
+    return response
+
+
+def raw_body_upload():
+    """Treat a non-multipart body with a data Content-Type (text/csv, Parquet, zip...) as the upload"""
+    default_name = UPLOAD_MIME_TYPES.get(request.mimetype)
+    if default_name is None:
+        return None
+    return FileStorage(stream=request.stream, filename=request.args.get("filename") or default_name,
+                       content_type=request.mimetype)
+
+
+def wants_async():
+    """Whether the client asked for an async bulk job (?async=true or Prefer: respond-async)"""
+    return (request.args.get("async", "").lower() in ("1", "true", "yes")
+            or "respond-async" in request.headers.get("Prefer", ""))
+
+
+def start_bulk_job(file, clerk_user_id, output_format="csv", keep_columns=True):
+    """Queue a bulk upload as a background job and return 202 with its URLs"""
+    if not JOBS_AVAILABLE:
+        return jsonify({"error": "Async bulk jobs require the database"}), 503
+    
+    job = create_job(clerk_user_id, file, output_format, keep_columns)
+    print(f"✅ Queued bulk job {job['_id']} for user: {clerk_user_id[:20]}...")
+    
+    response = jsonify(serialize_job(job))
+    response.status_code = 202
+    response.headers["Location"] = f"/api/jobs/{job['_id']}"
+    return response
+
+
+def stream_bulk_prediction(predictor, scaler, cv, file, clerk_user_id, output_format="csv", keep_columns=True):
+    """Predict an upload chunk by chunk, streaming the predictions as chunks finish"""
+    # Flask closes request files once the view returns, so spool the upload to a file we own
+    upload = tempfile.TemporaryFile()
+    shutil.copyfileobj(file.stream, upload)
+    upload.seek(0)
+    chunks = iter_upload_predictions(predictor, scaler, cv, upload, file.filename, keep_columns=keep_columns)
+
+    # Process the first chunk up front so bad uploads still get a proper 400
+    try:
+        first_chunk = next(chunks, None)
+    except ValueError as e:
+        upload.close()
+        return jsonify({"error": str(e)}), 400
+    if first_chunk is None:
+        upload.close()
+        return jsonify({"error": "Uploaded file contains no reviews."}), 400
+
+    summary = SentimentSummary()
+    session_id = create_bulk_session(clerk_user_id, file.filename)
+
+    def save_chunk(chunk):
+        if session_id:
+            save_bulk_reviews(clerk_user_id, session_id, chunk)
+
+    def generate():
+        status = "failed"
+        try:
+            yield from stream_predictions(chain([first_chunk], chunks), summary, create_writer(output_format),
+                                          on_chunk=save_chunk)
+            status = "completed"
+        except Exception as e:
+            print(f"❌ Error while streaming bulk predictions: {e}")
+        finally:
+            upload.close()
+            if session_id:
+                finish_bulk_session(clerk_user_id, session_id, summary, status)
+
+    response = Response(stream_with_context(generate()), mimetype=output_mimetype(output_format))
+    response.headers["Content-Disposition"] = f"attachment; filename={output_filename(output_format)}"
+    # The chart can't go in a header before the counts are known; the summary is saved on the session
+    response.headers["X-Graph-Exists"] = "false"
+    if session_id:
+        response.headers["X-Session-Id"] = str(session_id)
+        response.headers["X-Summary-Url"] = f"/api/sessions/{session_id}/summary"
+    return response
 
 
 def save_review(clerk_user_id, text, sentiment, confidence):
-    """Save individual review prediction to MongoDB - ONLY for authenticated user"""
+    """Save individual review prediction and bump user stats - ONLY for authenticated user"""
     if not DB_AVAILABLE:
         return None
     
@@ -350,21 +491,84 @@ def save_review(clerk_user_id, text, sentiment, confidence):
         return None
     
     try:
+        clerk_user_id = str(clerk_user_id).strip()  # Ensure it's a string and trimmed
         review = {
-            "clerk_user_id": str(clerk_user_id).strip(),  # Ensure it's a string and trimmed
+            "_id": ObjectId(),
+            "clerk_user_id": clerk_user_id,
             "text": text,
             "predicted_sentiment": sentiment,
             "confidence": float(confidence),
             "created_at": datetime.utcnow()
         }
-        result = reviews_collection.insert_one(review)
+        if write_behind is not None:
+            # Written by the background flusher together with other requests' reviews; dropped
+            # (and counted in /metrics) if the buffer stays full, e.g. while MongoDB is down
+            if not write_behind.add(clerk_user_id, [review], **review_increments([sentiment])):
+                return None
+            return review["_id"]
+        
+        reviews_collection.insert_one(review)
+        users_collection.update_one(
+            {"clerk_user_id": clerk_user_id},
+            {
+                "$inc": review_increments([sentiment]),
+                "$set": {"updated_at": review["created_at"]}
+            }
+        )
         print(f"✅ Saved review for user: {clerk_user_id[:20]}...")  # Only log partial ID for security
-        return result.inserted_id
+        return review["_id"]
     except Exception as e:
         print(f"❌ Error saving review to MongoDB: {e}")
         return None
 
 
+def save_review_batch(clerk_user_id, texts, sentiments, confidences, client_ids=None):
+    """Save a batch of review predictions with one bulk write - ONLY for authenticated user"""
+    if not DB_AVAILABLE:
+        return 0
+
+    # Security check: Ensure clerk_user_id is valid and not None
+    if not clerk_user_id or not isinstance(clerk_user_id, str) or len(clerk_user_id.strip()) == 0:
+        print(f"❌ SECURITY: Attempted to save review batch with invalid clerk_user_id: {clerk_user_id}")
+        return 0
+
+    try:
+        clerk_user_id = str(clerk_user_id).strip()
+        created_at = datetime.utcnow()
+        reviews_to_insert = []
+        for i, (text, sentiment, confidence) in enumerate(zip(texts, sentiments, confidences)):
+            review = {
+                "_id": ObjectId(),
+                "clerk_user_id": clerk_user_id,  # Always use the authenticated user's ID
+                "text": text,
+                "predicted_sentiment": str(sentiment),
+                "confidence": float(confidence),
+                "created_at": created_at
+            }
+            if client_ids is not None and client_ids[i] is not None:
+                review["client_id"] = client_ids[i]
+            reviews_to_insert.append(review)
+
+        if write_behind is not None:
+            if not write_behind.add(clerk_user_id, reviews_to_insert, **review_increments(sentiments)):
+                return 0
+            return len(reviews_to_insert)
+
+        reviews_collection.insert_many(reviews_to_insert, ordered=False)
+        users_collection.update_one(
+            {"clerk_user_id": clerk_user_id},
+            {
+                "$inc": review_increments(sentiments),
+                "$set": {"updated_at": created_at}
+            }
+        )
+        print(f"✅ Saved {len(reviews_to_insert)} batch reviews for user: {clerk_user_id[:20]}...")
+        return len(reviews_to_insert)
+    except Exception as e:
+        print(f"❌ Error saving review batch to MongoDB: {e}")
+        return 0
+
+
 def save_bulk_analysis(clerk_user_id, data, filename):
     """Save bulk analysis session to MongoDB - ONLY for authenticated user"""
     if not DB_AVAILABLE:
@@ -379,11 +583,13 @@ def save_bulk_analysis(clerk_user_id, data, filename):
         # Normalize clerk_user_id to ensure consistency
         clerk_user_id = str(clerk_user_id).strip()
         
-        positive_count = len(data[data["Predicted sentiment"] == "Positive"])
-        negative_count = len(data[data["Predicted sentiment"] == "Negative"])
+        positive_count, negative_count = distribution_counts(data["Predicted sentiment"])
         
         # Save session summary - ONLY linked to this user's ID
+        # The _id is assigned here so the response can reference the session before it is written
+        session_id = ObjectId()
         session = {
+            "_id": session_id,
             "clerk_user_id": clerk_user_id,  # Always use the authenticated user's ID
             "filename": filename,
             "total_reviews": len(data),
@@ -391,24 +597,23 @@ def save_bulk_analysis(clerk_user_id, data, filename):
             "negative_count": int(negative_count),
             "created_at": datetime.utcnow()
         }
-        session_result = analysis_sessions_collection.insert_one(session)
-        session_id = session_result.inserted_id
         
         # Save individual reviews from the bulk analysis - ALL linked to this user's ID
-        reviews_to_insert = []
-        for _, row in data.iterrows():
-            review_doc = {
-                "clerk_user_id": clerk_user_id,  # CRITICAL: Always use authenticated user's ID
-                "text": str(row.get("Sentence", "")),
-                "predicted_sentiment": str(row.get("Predicted sentiment", "Unknown")),
-                "session_id": session_id,
-                "created_at": datetime.utcnow()
-            }
-            reviews_to_insert.append(review_doc)
+        reviews_to_insert = build_bulk_review_docs(clerk_user_id, session_id, data)
         
-        if reviews_to_insert:
-            reviews_collection.insert_many(reviews_to_insert)
-            print(f"✅ Saved {len(reviews_to_insert)} reviews for user: {clerk_user_id[:20]}...")  # Only log partial ID
+        # Update user stats (and the data version) once the session and its reviews are written;
+        # if some are given up on, the counters are rebuilt from what landed on the next stats read
+        user_update = {
+            "$inc": dict(review_increments(data["Predicted sentiment"]), total_sessions=1),
+            "$set": {"updated_at": datetime.utcnow()}
+        }
+        get_bulk_writer().insert_all(
+            [(analysis_sessions_collection, [session]), (reviews_collection, reviews_to_insert)],
+            key=session_id,
+            then=lambda: users_collection.update_one({"clerk_user_id": clerk_user_id}, user_update),
+            on_failure=lambda: mark_stats_stale(clerk_user_id),
+        )
+        print(f"✅ Queued {len(reviews_to_insert)} reviews for user: {clerk_user_id[:20]}...")  # Only log partial ID
         
         return session_id
     except Exception as e:
@@ -416,11 +621,104 @@ def save_bulk_analysis(clerk_user_id, data, filename):
         return None
 
 
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+@require_auth
+def get_bulk_job(job_id):
+    """Get status and progress of a bulk job - ONLY for the authenticated user"""
+    if not JOBS_AVAILABLE:
+        return jsonify({"error": "Database not available"}), 503
+    
+    clerk_user_id = str(getattr(request, 'clerk_user_id', '') or '').strip()
+    if not clerk_user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    job = get_job(clerk_user_id, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(serialize_job(job))
+
+
+@app.route("/api/jobs/<job_id>/events", methods=["GET"])
+@require_auth
+def bulk_job_events(job_id):
+    """Stream bulk job progress as Server-Sent Events until the job finishes"""
+    if not JOBS_AVAILABLE:
+        return jsonify({"error": "Database not available"}), 503
+    
+    clerk_user_id = str(getattr(request, 'clerk_user_id', '') or '').strip()
+    if not clerk_user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    if get_job(clerk_user_id, job_id) is None:
+        return jsonify({"error": "Job not found"}), 404
+    
+    def generate():
+        last_payload = None
+        deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        while time.monotonic() < deadline:
+            job = get_job(clerk_user_id, job_id)
+            if job is None:
+                yield "event: error\ndata: {\"error\": \"Job not found\"}\n\n"
+                return
+            payload = json.dumps(serialize_job(job))
+            if payload != last_payload:
+                yield f"event: progress\ndata: {payload}\n\n"
+                last_payload = payload
+            if job.get("status") in TERMINAL_STATUSES:
+                return
+            time.sleep(JOB_EVENTS_INTERVAL)
+        # Free the worker thread; EventSource clients reconnect automatically
+        yield "retry: 1000\n\n"
+    
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
+
+@app.route("/api/jobs/<job_id>/result", methods=["GET"])
+@require_auth
+def get_bulk_job_result(job_id):
+    """Download the predictions of a finished bulk job - ONLY for the authenticated user"""
+    if not JOBS_AVAILABLE:
+        return jsonify({"error": "Database not available"}), 503
+    
+    clerk_user_id = str(getattr(request, 'clerk_user_id', '') or '').strip()
+    if not clerk_user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    job = get_job(clerk_user_id, job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    if job.get("status") != "completed":
+        return jsonify({"error": "Job has not completed", "status": job.get("status")}), 409
+    
+    result = open_job_result(job_id)
+    
+    def generate():
+        try:
+            while True:
+                block = result.read(256 * 1024)
+                if not block:
+                    break
+                yield block
+        finally:
+            result.close()
+    
+    output_format = job.get("output_format", "csv")
+    response = Response(generate(), mimetype=output_mimetype(output_format))
+    response.headers["Content-Disposition"] = f"attachment; filename={output_filename(output_format)}"
+    response.headers["Content-Length"] = str(result.length)
+    if job.get("session_id"):
+        response.headers["X-Session-Id"] = str(job["session_id"])
+    return response
+
+
 # New endpoints to retrieve user data
 @app.route("/api/reviews", methods=["GET"])
 @require_auth
 def get_user_reviews():
-    """Get all reviews for the authenticated user ONLY - Data isolation enforced"""
+    """Get a page of reviews (?limit, ?cursor) for the authenticated user ONLY - Data isolation enforced"""
     if not DB_AVAILABLE:
         return jsonify({"error": "Database not available"}), 503
     
@@ -435,15 +733,21 @@ def get_user_reviews():
     clerk_user_id = str(clerk_user_id).strip()
     
     try:
-        limit = request.args.get('limit', 50, type=int)
-        skip = request.args.get('skip', 0, type=int)
+        # Unchanged since the client's copy: answer from the user document alone
+        etag = user_data_etag(clerk_user_id, get_data_version(clerk_user_id))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
         
         # CRITICAL: Query ONLY filtered by authenticated user's ID
         # This ensures users can ONLY see their own data
-        reviews = list(reviews_collection.find(
+        reviews, next_cursor = keyset_page(
+            reviews_collection,
             {"clerk_user_id": clerk_user_id},  # User isolation enforced here
-            {"_id": 1, "text": 1, "predicted_sentiment": 1, "confidence": 1, "created_at": 1}
-        ).sort("created_at", -1).limit(limit).skip(skip))
+            {"_id": 1, "text": 1, "predicted_sentiment": 1, "confidence": 1},
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int),
+        )
         
         # Convert ObjectId to string and datetime to ISO format
         for review in reviews:
@@ -451,7 +755,9 @@ def get_user_reviews():
             if "created_at" in review and isinstance(review["created_at"], datetime):
                 review["created_at"] = review["created_at"].isoformat()
         
-        return jsonify({"reviews": reviews})
+        return revalidated(jsonify({"reviews": reviews, "next_cursor": next_cursor}), etag)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error fetching reviews: {e}")
         return jsonify({"error": str(e)}), 500
@@ -460,7 +766,7 @@ def get_user_reviews():
 @app.route("/api/sessions", methods=["GET"])
 @require_auth
 def get_user_sessions():
-    """Get all analysis sessions for the authenticated user ONLY - Data isolation enforced"""
+    """Get a page of analysis sessions (?limit, ?cursor) for the authenticated user ONLY - Data isolation enforced"""
     if not DB_AVAILABLE:
         return jsonify({"error": "Database not available"}), 503
     
@@ -475,22 +781,132 @@ def get_user_sessions():
     clerk_user_id = str(clerk_user_id).strip()
     
     try:
+        etag = user_data_etag(clerk_user_id, get_data_version(clerk_user_id))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
+        
         # CRITICAL: Query ONLY filtered by authenticated user's ID
-        sessions = list(analysis_sessions_collection.find(
-            {"clerk_user_id": clerk_user_id}  # User isolation enforced here
-        ).sort("created_at", -1))
+        sessions, next_cursor = keyset_page(
+            analysis_sessions_collection,
+            {"clerk_user_id": clerk_user_id},  # User isolation enforced here
+            {"_id": 1, "filename": 1, "status": 1, "total_reviews": 1, "positive_count": 1, "negative_count": 1},
+            cursor=request.args.get('cursor'),
+            limit=request.args.get('limit', type=int),
+        )
         
         for session in sessions:
             session["_id"] = str(session["_id"])
             if "created_at" in session and isinstance(session["created_at"], datetime):
                 session["created_at"] = session["created_at"].isoformat()
         
-        return jsonify({"sessions": sessions})
+        return revalidated(jsonify({"sessions": sessions, "next_cursor": next_cursor}), etag)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error fetching sessions: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def find_user_session(clerk_user_id, session_id, projection):
+    """(session, pending) for one of the user's sessions.
+
+    A buffered bulk response names its session before the background writer has stored it,
+    so writes still queued for the session are waited on briefly first. pending is True when
+    they are still queued after that, in which case session is None.
+    """
+    if not ObjectId.is_valid(session_id):
+        return None, False
+    session_id = ObjectId(session_id)
+    written = get_bulk_writer().flush(key=session_id, timeout=SESSION_FLUSH_TIMEOUT_S)
+    session = analysis_sessions_collection.find_one(
+        {"_id": session_id, "clerk_user_id": clerk_user_id},  # User isolation enforced
+        projection
+    )
+    return session, session is None and not written
+
+
+def session_pending(session_id):
+    """202 for a session whose writes are still queued; clients retry after a moment"""
+    response = jsonify({"session_id": session_id, "status": "pending"})
+    response.status_code = 202
+    response.headers["Retry-After"] = "1"
+    return response
+
+
+@app.route("/api/sessions/<session_id>/chart", methods=["GET"])
+@require_auth
+def get_session_chart(session_id):
+    """Sentiment distribution chart of one analysis session (?format=png|svg|json) - ONLY for authenticated user"""
+    if not DB_AVAILABLE:
+        return jsonify({"error": "Database not available"}), 503
+    
+    clerk_user_id = str(getattr(request, 'clerk_user_id', '') or '').strip()
+    if not clerk_user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    chart_format = request.args.get("format", "svg").lower()
+    if chart_format not in CHART_MIME_TYPES:
+        return jsonify({"error": f"Unsupported chart format. Use one of: {', '.join(CHART_MIME_TYPES)}."}), 400
+    
+    try:
+        session, pending = find_user_session(clerk_user_id, session_id, {"positive_count": 1, "negative_count": 1})
+        if pending:
+            return session_pending(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+        
+        chart = render_chart(int(session.get("positive_count", 0)), int(session.get("negative_count", 0)), chart_format)
+        response = Response(chart, mimetype=CHART_MIME_TYPES[chart_format])
+        response.headers["Cache-Control"] = "private, max-age=300"
+        return response
+    except Exception as e:
+        print(f"Error rendering session chart: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/sessions/<session_id>/summary", methods=["GET"])
+@require_auth
+def get_session_summary(session_id):
+    """Sentiment counts and chart spec of one analysis session - ONLY for authenticated user"""
+    if not DB_AVAILABLE:
+        return jsonify({"error": "Database not available"}), 503
+    
+    clerk_user_id = str(getattr(request, 'clerk_user_id', '') or '').strip()
+    if not clerk_user_id:
+        return jsonify({"error": "Authentication required"}), 401
+    
+    try:
+        session, pending = find_user_session(
+            clerk_user_id, session_id,
+            {"filename": 1, "status": 1, "total_reviews": 1, "positive_count": 1, "negative_count": 1,
+             "created_at": 1, "completed_at": 1}
+        )
+        if pending:
+            return session_pending(session_id)
+        if session is None:
+            return jsonify({"error": "Session not found"}), 404
+        
+        positive, negative = int(session.get("positive_count", 0)), int(session.get("negative_count", 0))
+        summary = {
+            "session_id": session_id,
+            "filename": session.get("filename"),
+            "status": session.get("status", "completed"),
+            "total_reviews": int(session.get("total_reviews", 0)),
+            "positive_count": positive,
+            "negative_count": negative,
+            "chart": chart_spec(positive, negative),
+            "chart_url": f"/api/sessions/{session_id}/chart",
+        }
+        for field in ("created_at", "completed_at"):
+            if isinstance(session.get(field), datetime):
+                summary[field] = session[field].isoformat()
+        return jsonify(summary)
+    except Exception as e:
+        print(f"Error fetching session summary: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route("/api/stats", methods=["GET"])
 @require_auth
 def get_user_stats():
@@ -511,36 +927,24 @@ def get_user_stats():
     clerk_user_id = str(clerk_user_id).strip()
     
     try:
-        # Only access this user's data
-        user = users_collection.find_one({"clerk_user_id": clerk_user_id})
-        
-        if not user:
-            # Create user if doesn't exist
-            user = get_or_create_user(clerk_user_id, email=email, name=name)
-        else:
-            # Update user info if email/name is missing
-            get_or_create_user(clerk_user_id, email=email, name=name)
+        # Only access this user's data (creates the user or fills in missing email/name)
+        get_or_create_user(clerk_user_id, email=email, name=name)
         
-        # CRITICAL: All stats queries filtered by authenticated user's ID only
-        # This ensures users can ONLY see their own statistics
-        total_reviews = reviews_collection.count_documents({"clerk_user_id": clerk_user_id})
-        positive_reviews = reviews_collection.count_documents({
-            "clerk_user_id": clerk_user_id,  # User isolation enforced
-            "predicted_sentiment": "Positive"
-        })
-        negative_reviews = reviews_collection.count_documents({
-            "clerk_user_id": clerk_user_id,  # User isolation enforced
-            "predicted_sentiment": "Negative"
-        })
-        total_sessions = analysis_sessions_collection.count_documents({"clerk_user_id": clerk_user_id})  # User isolation enforced
+        # CRITICAL: Counters are read from the authenticated user's own document only
+        # They are maintained on every write, so this is one read instead of counting reviews
+        user = read_user_stats(clerk_user_id) or {}
+        etag = user_data_etag(clerk_user_id, user.get(DATA_VERSION_FIELD, 0))
+        cached = not_modified(etag)
+        if cached is not None:
+            return cached
         
-        return jsonify({
-            "total_reviews": total_reviews,
-            "positive_reviews": positive_reviews,
-            "negative_reviews": negative_reviews,
-            "total_sessions": total_sessions,
-            "account_created": user.get("created_at").isoformat() if user and user.get("created_at") else None
-        })
+        return revalidated(jsonify({
+            "total_reviews": user.get("total_reviews", 0),
+            "positive_reviews": user.get("positive_reviews", 0),
+            "negative_reviews": user.get("negative_reviews", 0),
+            "total_sessions": user.get("total_sessions", 0),
+            "account_created": user.get("created_at").isoformat() if user.get("created_at") else None
+        }), etag)
     except Exception as e:
         print(f"Error fetching stats: {e}")
         return jsonify({"error": str(e)}), 500
@@ -561,33 +965,16 @@ def refresh_user_info():
         return jsonify({"error": "Authentication required"}), 401
     
     try:
-        # Force update user info (update even if values already exist)
-        user = users_collection.find_one({"clerk_user_id": clerk_user_id})
+        # Token claims may lack the profile; ask Clerk directly since the user asked for a refresh
+        if not email or not name:
+            api_email, api_name = get_user_info_from_clerk(clerk_user_id)
+            email = email or api_email
+            name = name or api_name
         
-        if not user:
-            # Create new user
-            user = get_or_create_user(clerk_user_id, email=email, name=name)
-        else:
-            # Force update email/name if we have new values
-            update_fields = {"updated_at": datetime.utcnow()}
-            updated = False
-            
-            if email:
-                update_fields["email"] = email
-                updated = True
-                print(f"✅ Force updated email for user: {clerk_user_id} -> {email}")
-            
-            if name:
-                update_fields["name"] = name
-                updated = True
-                print(f"✅ Force updated name for user: {clerk_user_id} -> {name}")
-            
-            if updated:
-                users_collection.update_one(
-                    {"clerk_user_id": clerk_user_id},
-                    {"$set": update_fields}
-                )
-                user = users_collection.find_one({"clerk_user_id": clerk_user_id})
+        # Force update user info (update even if values already exist) in one upsert
+        user = refresh_user(clerk_user_id, email=email, name=name)
+        if email or name:
+            print(f"✅ Force updated user info for user: {clerk_user_id} (email: {email}, name: {name})")
         
         return jsonify({
             "success": True,
@@ -602,7 +989,12 @@ def refresh_user_info():
 @app.route("/api/user-data", methods=["GET"])
 @require_auth
 def get_user_data():
-    """Get all user data including reviews formatted for frontend - ONLY for authenticated user"""
+    """Stream all user reviews formatted for frontend - ONLY for authenticated user.
+
+    ?format=json (default, {"reviews": [...], "total": n}) or ndjson, ?since= / ?until= dates
+    and ?fields= to pick columns. The body is generated from the Mongo cursor and compressed
+    with the best Accept-Encoding we support, so memory use doesn't grow with the history.
+    """
     if not DB_AVAILABLE:
         return jsonify({"error": "Database not available"}), 503
     
@@ -616,29 +1008,48 @@ def get_user_data():
     # Normalize user ID
     clerk_user_id = str(clerk_user_id).strip()
     
+    output_format = (request.args.get("format") or "").strip().lower()
+    if not output_format:
+        best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+        output_format = "ndjson" if best == "application/x-ndjson" else "json"
+    if output_format not in USER_DATA_MIME_TYPES:
+        return jsonify({"error": f"Unsupported format. Use one of: {', '.join(USER_DATA_MIME_TYPES)}."}), 400
+    
     try:
+        fields = parse_fields(request.args.get("fields"))
+        since = parse_date(request.args.get("since"))
+        until = parse_date(request.args.get("until"), end=True)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    try:
+        etag = user_data_etag(clerk_user_id, get_data_version(clerk_user_id))
+        cached = not_modified(etag, USER_DATA_VARY)
+        if cached is not None:
+            return cached
+        
         # CRITICAL: Query ONLY filtered by authenticated user's ID
         # This is the main endpoint that loads user data - isolation is critical here
         reviews_cursor = reviews_collection.find(
-            {"clerk_user_id": clerk_user_id},  # User isolation enforced - users can ONLY see their own reviews
-            {"text": 1, "predicted_sentiment": 1, "confidence": 1, "created_at": 1, "_id": 0}  # Only include needed fields (clerk_user_id excluded by not including it)
-        ).sort("created_at", -1)
+            user_data_query(clerk_user_id, since, until),  # User isolation enforced - users can ONLY see their own reviews
+            user_data_projection(fields)  # Only include requested fields (clerk_user_id never included)
+        ).sort("created_at", -1).batch_size(USER_DATA_BATCH_SIZE)
         
-        # Format reviews for frontend (matching ReviewData interface)
-        formatted_reviews = []
-        for review in reviews_cursor:
-            formatted_review = {
-                "Sentence": review.get("text", ""),
-                "Predicted sentiment": review.get("predicted_sentiment", "Unknown"),
-            }
-            if "confidence" in review:
-                formatted_review["confidence"] = review["confidence"]
-            formatted_reviews.append(formatted_review)
+        def generate():
+            try:
+                yield from iter_user_data(reviews_cursor, fields, output_format)
+            except Exception as e:
+                # Headers are already sent; the truncated body tells the client it failed
+                print(f"Error streaming user data: {e}")
+            finally:
+                reviews_cursor.close()
         
-        return jsonify({
-            "reviews": formatted_reviews,
-            "total": len(formatted_reviews)
-        })
+        encoding = negotiate_content_encoding(request.accept_encodings)
+        response = Response(stream_with_context(encode_stream(generate(), encoding)),
+                            mimetype=USER_DATA_MIME_TYPES[output_format])
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        return revalidated(response, etag, USER_DATA_VARY)
     except Exception as e:
         print(f"Error fetching user data: {e}")
         return jsonify({"error": str(e)}), 500
@@ -1,5 +1,5 @@
+import hmac
 import os
-import requests
 from functools import wraps
 from flask import request, jsonify
 from dotenv import load_dotenv
@@ -7,58 +7,43 @@ from dotenv import load_dotenv
 load_dotenv()
 
 CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+# Placeholder secret key value; treated the same as no key
+CLERK_SECRET_KEY_PLACEHOLDER = "sk_test_your_clerk_secret_key_here"
+# Seconds clients are asked to wait when a token can't be checked right now
+AUTH_RETRY_AFTER = int(os.getenv("AUTH_RETRY_AFTER", 5))
+# Local development only: accept unverified tokens as dev_user_* ids. Never set in production.
+AUTH_DEV_MODE = os.getenv("AUTH_DEV_MODE", "").lower() in ("1", "true", "yes")
+if AUTH_DEV_MODE:
+    print("⚠️ AUTH_DEV_MODE is on: tokens that can't be verified are accepted as development users")
+elif not CLERK_SECRET_KEY or CLERK_SECRET_KEY == CLERK_SECRET_KEY_PLACEHOLDER:
+    print("⚠️ Warning: CLERK_SECRET_KEY is not set and AUTH_DEV_MODE is off; every authenticated request "
+          "will be rejected. Set CLERK_SECRET_KEY, or AUTH_DEV_MODE=true for local development.")
+# Shared secret for internal endpoints (/metrics); they are disabled while it is unset
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
 def get_user_info_from_clerk(clerk_user_id):
-    """Fetch user information (email, name) from Clerk API"""
-    if not CLERK_SECRET_KEY or CLERK_SECRET_KEY == "sk_test_your_clerk_secret_key_here":
+    """Fetch user information (email, name) from Clerk API (blocking; see clerk_profiles.lookup_profile)"""
+    return get_user_info_outcome(clerk_user_id)[0]
+
+
+def get_user_info_outcome(clerk_user_id):
+    """((email, name), why it failed or None); see clerk_profiles.fetch_profile_outcome"""
+    from clerk_profiles import PROFILE_ERROR, fetch_profile_outcome
+    if not CLERK_SECRET_KEY or CLERK_SECRET_KEY == CLERK_SECRET_KEY_PLACEHOLDER:
         # Development mode - can't fetch from Clerk API
-        return None, None
-    
-    try:
-        headers = {
-            "Authorization": f"Bearer {CLERK_SECRET_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.get(
-            f"https://api.clerk.com/v1/users/{clerk_user_id}",
-            headers=headers,
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            user_data = response.json()
-            
-            # Extract email (primary email address)
-            email_addresses = user_data.get("email_addresses", [])
-            email = None
-            if email_addresses:
-                # Get primary email or first email
-                primary_email = next((e for e in email_addresses if e.get("id") == user_data.get("primary_email_address_id")), None)
-                email = primary_email.get("email_address") if primary_email else email_addresses[0].get("email_address")
-            
-            # Extract name (first_name + last_name or username)
-            first_name = user_data.get("first_name", "")
-            last_name = user_data.get("last_name", "")
-            username = user_data.get("username", "")
-            
-            name = None
-            if first_name or last_name:
-                name = f"{first_name} {last_name}".strip()
-            elif username:
-                name = username
-            
-            return email, name
-        else:
-            print(f"⚠️ Failed to fetch user info from Clerk: {response.status_code} - {response.text}")
-            return None, None
-            
-    except Exception as e:
-        print(f"⚠️ Error fetching user info from Clerk: {e}")
-        return None, None
+        return (None, None), PROFILE_ERROR
+    return fetch_profile_outcome(clerk_user_id)
+
+class AuthUnavailable(Exception):
+    """A token could not be checked because Clerk or a backing store failed; answered with a 503"""
+
 
 def verify_clerk_token(token):
-    """Verify Clerk JWT token and return user ID, email, and name"""
+    """Verify Clerk JWT token and return user ID, email, and name.
+
+    Raises AuthUnavailable when the token can't be checked right now (e.g. the JWKS fetch
+    failing); such requests are never let through as a development user.
+    """
     if not token:
         return None, None, None
     
@@ -67,8 +52,11 @@ def verify_clerk_token(token):
         if token.startswith('Bearer '):
             token = token[7:]
         
-        # If no Clerk secret key is set, use a simple development mode
-        if not CLERK_SECRET_KEY or CLERK_SECRET_KEY == "sk_test_your_clerk_secret_key_here":
+        # Without a Clerk secret key, tokens can only be accepted in explicit development mode
+        if not CLERK_SECRET_KEY or CLERK_SECRET_KEY == CLERK_SECRET_KEY_PLACEHOLDER:
+            if not AUTH_DEV_MODE:
+                print("❌ SECURITY: CLERK_SECRET_KEY is not set and AUTH_DEV_MODE is off; rejecting token")
+                return None, None, None
             print("⚠️ Development mode: Using token as user identifier")
             
             # Try to extract email/name from token claims even in dev mode (without verification)
@@ -103,20 +91,27 @@ def verify_clerk_token(token):
                 clerk_user_id = f"dev_user_{hash(user_id) % 1000000}"
                 return clerk_user_id, None, None
         
-        # Production: Verify with Clerk API
+        # Production: Verify with Clerk (signing keys and verified tokens are cached)
         try:
             import jwt
-            from jwt import PyJWKClient
+            from jwks_cache import token_cache, verify_token
             
-            # Decode JWT without verification first to get issuer and claims
-            unverified = jwt.decode(token, options={"verify_signature": False})
-            issuer = unverified.get("iss", "")
+            # A token verified earlier is trusted until it expires - no decode, no network call
+            cached = token_cache.get(token)
+            if cached is not None:
+                return cached
+            
+            try:
+                decoded = verify_token(token)
+            except jwt.PyJWTError as e:
+                print(f"❌ SECURITY: Rejected token: {e}")
+                return None, None, None
             
             # Try to extract email and name from token claims
-            email = unverified.get("email") or unverified.get("primary_email_address")
-            first_name = unverified.get("first_name", "")
-            last_name = unverified.get("last_name", "")
-            username = unverified.get("username", "")
+            email = decoded.get("email") or decoded.get("primary_email_address")
+            first_name = decoded.get("first_name", "")
+            last_name = decoded.get("last_name", "")
+            username = decoded.get("username", "")
             
             # Build name from available fields
             name = None
@@ -125,44 +120,47 @@ def verify_clerk_token(token):
             elif username:
                 name = username
             
-            # Get the JWKS endpoint from issuer
-            jwks_url = f"{issuer}/.well-known/jwks.json"
-            jwks_client = PyJWKClient(jwks_url)
-            
-            # Get the signing key
-            signing_key = jwks_client.get_signing_key_from_jwt(token)
-            
-            # Verify and decode the token
-            decoded = jwt.decode(
-                token,
-                signing_key.key,
-                algorithms=["RS256"],
-                audience=unverified.get("aud"),
-                issuer=issuer
-            )
-            
             clerk_user_id = decoded.get("sub")
             
-            # If email/name not in token, fetch from Clerk API
+            # If email/name not in token, use the cached profile; a missing one is loaded from the
+            # users collection or the Clerk API in the background rather than while the request waits
             if not email or not name:
-                api_email, api_name = get_user_info_from_clerk(clerk_user_id)
-                email = email or api_email
-                name = name or api_name
+                from clerk_profiles import lookup_profile
+                stored_email, stored_name = lookup_profile(clerk_user_id)
+                email = email or stored_email
+                name = name or stored_name
             
+            token_cache.put(token, decoded.get("exp"), (clerk_user_id, email, name))
             return clerk_user_id, email, name
             
         except ImportError:
             print("⚠️ PyJWT not installed. Install with: pip install PyJWT")
+            if not AUTH_DEV_MODE:
+                raise AuthUnavailable("PyJWT is not installed")
             print("⚠️ Falling back to development mode")
             return f"dev_user_{hash(token) % 1000000}", None, None
             
+    except AuthUnavailable:
+        raise
     except Exception as e:
-        print(f"⚠️ Error verifying token: {e}")
-        print("⚠️ Using development fallback")
-        # Development fallback
-        if token and len(token) > 10:
-            return f"dev_user_{hash(token) % 1000000}", None, None
-        return None, None, None
+        # Signing keys couldn't be fetched (Clerk unreachable) or another lookup failed.
+        # The token is unverified, so it must not turn into a user id.
+        print(f"❌ Error verifying token: {e}")
+        raise AuthUnavailable(str(e)) from e
+
+def auth_cache_stats():
+    """Hit and refresh counters of the JWKS and verified-token caches"""
+    try:
+        from jwks_cache import auth_cache_stats as cache_stats
+    except ImportError:
+        return {"enabled": False}
+    return cache_stats()
+
+def auth_unavailable_response():
+    response = jsonify({"error": "Authentication is temporarily unavailable, please retry"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(AUTH_RETRY_AFTER)
+    return response
 
 def require_auth(f):
     """Decorator to require Clerk authentication - Enforces user isolation"""
@@ -174,7 +172,10 @@ def require_auth(f):
             print(f"❌ SECURITY: Unauthorized access attempt - no token provided")
             return jsonify({"error": "No authorization token provided"}), 401
         
-        clerk_user_id, email, name = verify_clerk_token(auth_header)
+        try:
+            clerk_user_id, email, name = verify_clerk_token(auth_header)
+        except AuthUnavailable:
+            return auth_unavailable_response()
         
         if not clerk_user_id:
             print(f"❌ SECURITY: Unauthorized access attempt - invalid token")
@@ -201,7 +202,11 @@ def optional_auth(f):
         auth_header = request.headers.get('Authorization')
         
         if auth_header:
-            clerk_user_id, email, name = verify_clerk_token(auth_header)
+            try:
+                clerk_user_id, email, name = verify_clerk_token(auth_header)
+            except AuthUnavailable:
+                # A token was sent; serving the request anonymously would drop the user's data
+                return auth_unavailable_response()
             request.clerk_user_id = clerk_user_id
             request.clerk_email = email
             request.clerk_name = name
@@ -214,3 +219,20 @@ def optional_auth(f):
     
     return decorated_function
 
+def require_metrics_token(f):
+    """Decorator for internal endpoints - requires 'Authorization: Bearer <METRICS_TOKEN>'"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not METRICS_TOKEN:
+            # Not configured: behave as if the endpoint didn't exist
+            return jsonify({"error": "Not found"}), 404
+
+        auth_header = request.headers.get('Authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else ''
+        if not hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+            print(f"❌ SECURITY: Unauthorized access attempt on {request.path}")
+            return jsonify({"error": "Invalid or missing metrics token"}), 401
+
+        return f(*args, **kwargs)
+
+    return decorated_function
@@ -0,0 +1,122 @@
+import os
+import queue
+import threading
+import time
+
+# Opt-in: coalesce concurrent single-text predictions into one predict_proba call
+MICRO_BATCHING_ENABLED = os.getenv("MICRO_BATCHING", "false").lower() in ("1", "true", "yes")
+MICRO_BATCH_WINDOW_MS = float(os.getenv("MICRO_BATCH_WINDOW_MS", 3))
+MICRO_BATCH_MAX_SIZE = int(os.getenv("MICRO_BATCH_MAX_SIZE", 64))
+MICRO_BATCH_TIMEOUT_S = float(os.getenv("MICRO_BATCH_TIMEOUT_S", 10))
+
+
+class _PendingPrediction:
+    __slots__ = ("text", "done", "result", "error")
+
+    def __init__(self, text):
+        self.text = text
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collects concurrent single-text requests for a short window and predicts them together.
+
+    predict_fn takes a list of texts and returns (sentiments, confidences) aligned with it.
+    """
+
+    def __init__(self, predict_fn, window_ms=MICRO_BATCH_WINDOW_MS, max_batch_size=MICRO_BATCH_MAX_SIZE):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._max_batch = 0
+        self._last_batch_size = 0
+        self._last_batch_ms = 0.0
+        self._total_batch_ms = 0.0
+        self._batch_sizes = {}
+
+    def _ensure_started(self):
+        # Started lazily so the scheduler thread is created in the worker, not a pre-fork parent
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+
+    def submit(self, text, timeout=MICRO_BATCH_TIMEOUT_S):
+        """Queue one text and block until its (sentiment, confidence) is ready"""
+        self._ensure_started()
+        pending = _PendingPrediction(text)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("Timed out waiting for batched prediction")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            start = time.perf_counter()
+            try:
+                sentiments, confidences = self.predict_fn([pending.text for pending in batch])
+                for pending, sentiment, confidence in zip(batch, sentiments, confidences):
+                    pending.result = (str(sentiment), float(confidence))
+            except Exception as e:
+                print(f"❌ Error in micro-batched prediction: {e}")
+                for pending in batch:
+                    pending.error = e
+            finally:
+                for pending in batch:
+                    pending.done.set()
+            self._record_batch(len(batch), (time.perf_counter() - start) * 1000)
+
+    def _record_batch(self, size, elapsed_ms):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            self._last_batch_size = size
+            self._last_batch_ms = elapsed_ms
+            self._total_batch_ms += elapsed_ms
+            self._batch_sizes[size] = self._batch_sizes.get(size, 0) + 1
+
+    def stats(self):
+        """Queue depth and batch-size statistics for tuning the window"""
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "window_ms": self.window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "items": self._items,
+                "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+                "max_observed_batch_size": self._max_batch,
+                "last_batch_size": self._last_batch_size,
+                "last_batch_ms": self._last_batch_ms,
+                "avg_batch_ms": self._total_batch_ms / self._batches if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+            }
@@ -0,0 +1,164 @@
+import os
+from collections import deque
+from itertools import chain
+
+import numpy as np
+
+from inference import sparse_predict_proba
+from ingest import iter_review_chunks
+from model_loader import model_version
+from output_formats import CsvWriter
+from prediction_cache import get_prediction_cache
+from text_processing import (normalize_series, normalize_series_parallel, normalize_texts,
+                             get_preprocess_pool, PREPROCESS_WORKERS, PARALLEL_PREPROCESS_MIN_ROWS)
+
+# Rows featurized and predicted at a time when streaming a bulk upload
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", 10000))
+
+SENTIMENT_LABELS = np.array(["Negative", "Positive"], dtype=object)
+
+
+def predict_corpus(predictor, scaler, cv, corpus):
+    """Predict preprocessed token strings, inferring each distinct string once.
+
+    Duplicates within the corpus share one prediction, and results are looked up in and
+    written back to the prediction cache. Returns (sentiments, confidences) as numpy arrays
+    aligned with corpus.
+    """
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(corpus, dtype=object), sort=False)
+    uniques = list(uniques)
+    sentiments = np.empty(len(uniques), dtype=object)
+    confidences = np.empty(len(uniques), dtype=float)
+
+    cache = get_prediction_cache()
+    version = model_version() if cache is not None else None
+    cached = cache.get_many(version, uniques) if cache is not None else {}
+
+    missing = []
+    for i, text in enumerate(uniques):
+        if text in cached:
+            sentiments[i], confidences[i] = cached[text]
+        else:
+            missing.append(i)
+
+    if missing:
+        y_proba = sparse_predict_proba(predictor, scaler, cv, [uniques[i] for i in missing])
+        y_predictions = y_proba.argmax(axis=1)
+        sentiments[missing] = SENTIMENT_LABELS[y_predictions]
+        confidences[missing] = y_proba[np.arange(len(y_predictions)), y_predictions]
+        if cache is not None:
+            cache.set_many(version, {uniques[i]: (sentiments[i], confidences[i]) for i in missing})
+
+    # Copy each distinct result back to every row that shares it
+    return sentiments[codes], confidences[codes]
+
+
+def predict_texts(predictor, scaler, cv, texts):
+    """Predict many raw texts with one vectorization and one predict_proba call.
+
+    Returns (sentiments, confidences) as numpy arrays aligned with texts.
+    """
+    return predict_corpus(predictor, scaler, cv, normalize_series_parallel(texts).tolist())
+
+
+def predict_chunk(predictor, scaler, cv, chunk, corpus=None):
+    """Add "Predicted sentiment" and "confidence" columns to a DataFrame with a "Sentence" column.
+
+    Pass corpus when the chunk's reviews have already been normalized.
+    """
+    if corpus is None:
+        sentiments, confidences = predict_texts(predictor, scaler, cv, chunk["Sentence"])
+    else:
+        sentiments, confidences = predict_corpus(predictor, scaler, cv, corpus)
+    chunk["Predicted sentiment"] = sentiments
+    chunk["confidence"] = confidences.round(4)
+    return chunk
+
+
+class SentimentSummary:
+    """Running sentiment counts, updated chunk by chunk"""
+
+    def __init__(self):
+        self.positive = 0
+        self.negative = 0
+
+    @property
+    def total(self):
+        return self.positive + self.negative
+
+    def update(self, sentiments):
+        import pandas as pd
+
+        counts = pd.Series(sentiments).value_counts()
+        self.positive += int(counts.get("Positive", 0))
+        self.negative += int(counts.get("Negative", 0))
+
+    def to_dict(self):
+        return {
+            "total_reviews": self.total,
+            "positive_count": self.positive,
+            "negative_count": self.negative,
+        }
+
+
+def normalize_chunks(chunks):
+    """Yield (chunk, corpus) pairs for DataFrames with a "Sentence" column.
+
+    Uploads of at least PARALLEL_PREPROCESS_MIN_ROWS rows are normalized in the preprocessing
+    pool, with a few chunks in flight so workers stay busy while the current chunk is predicted.
+    Smaller uploads are normalized in-process so they don't pay pool overhead.
+    """
+    # Read ahead just far enough to know which side of the threshold the upload is on
+    chunks = iter(chunks)
+    head = []
+    rows = 0
+    for chunk in chunks:
+        head.append(chunk)
+        rows += len(chunk)
+        if rows >= PARALLEL_PREPROCESS_MIN_ROWS:
+            break
+    chunks = chain(head, chunks)
+
+    pool = get_preprocess_pool() if rows >= PARALLEL_PREPROCESS_MIN_ROWS else None
+    if pool is None:
+        for chunk in chunks:
+            yield chunk, normalize_series(chunk["Sentence"]).tolist()
+        return
+
+    # Bounded read-ahead keeps memory at a few chunks regardless of file size
+    pending = deque()
+    for chunk in chunks:
+        pending.append((chunk, pool.submit(normalize_texts, chunk["Sentence"].tolist())))
+        if len(pending) > PREPROCESS_WORKERS:
+            chunk, future = pending.popleft()
+            yield chunk, future.result()
+    while pending:
+        chunk, future = pending.popleft()
+        yield chunk, future.result()
+
+
+def iter_upload_predictions(predictor, scaler, cv, file, filename, chunksize=BULK_CHUNK_SIZE, keep_columns=True):
+    """Read an upload in fixed-size chunks and yield each chunk with its predictions"""
+    chunks = iter_review_chunks(file, filename, chunksize, keep_columns)
+    for chunk, corpus in normalize_chunks(chunks):
+        yield predict_chunk(predictor, scaler, cv, chunk, corpus)
+
+
+def stream_predictions(chunks, summary, writer=None, on_chunk=None):
+    """Serialize prediction chunks as they finish, keeping the summary up to date.
+
+    writer is an output_formats writer (CSV by default); yields bytes.
+    """
+    writer = writer if writer is not None else CsvWriter()
+    for chunk in chunks:
+        summary.update(chunk["Predicted sentiment"])
+        if on_chunk is not None:
+            on_chunk(chunk)
+        data = writer.write(chunk)
+        if data:
+            yield data
+    data = writer.close()
+    if data:
+        yield data
@@ -0,0 +1,125 @@
+from datetime import datetime
+
+# Import database module
+try:
+    from bson import ObjectId
+    from database import users_collection, reviews_collection, analysis_sessions_collection
+    from bulk_writer import get_bulk_writer
+    from user_stats import DATA_VERSION_FIELD, bump_data_version, delete_reviews, mark_stats_stale, review_increments
+    DB_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: Database modules not available: {e}")
+    DB_AVAILABLE = False
+
+
+def _column(data, name, default):
+    return data[name].tolist() if name in data else [default] * len(data)
+
+
+def build_bulk_review_docs(clerk_user_id, session_id, data):
+    """Build review documents for rows of a bulk analysis.
+
+    Columns are pulled out of the DataFrame once instead of row by row, and every document
+    gets its _id up front so a retried insert can't store the same row twice.
+    """
+    created_at = datetime.utcnow()
+    texts = [str(text) for text in _column(data, "Sentence", "")]
+    sentiments = [str(sentiment) for sentiment in _column(data, "Predicted sentiment", "Unknown")]
+    confidences = [float(confidence) if confidence is not None else None
+                   for confidence in _column(data, "confidence", None)]
+    return [
+        {
+            "_id": ObjectId(),
+            "clerk_user_id": clerk_user_id,  # CRITICAL: Always use authenticated user's ID
+            "text": text,
+            "predicted_sentiment": sentiment,
+            "confidence": confidence,
+            "session_id": session_id,
+            "created_at": created_at,
+        }
+        for text, sentiment, confidence in zip(texts, sentiments, confidences)
+    ]
+
+
+def create_bulk_session(clerk_user_id, filename):
+    """Create a streaming bulk analysis session whose counts are filled in when it finishes"""
+    if not DB_AVAILABLE:
+        return None
+    
+    # Security check: Ensure clerk_user_id is valid and not None
+    if not clerk_user_id or not isinstance(clerk_user_id, str) or len(clerk_user_id.strip()) == 0:
+        print(f"❌ SECURITY: Attempted to create bulk session with invalid clerk_user_id: {clerk_user_id}")
+        return None
+    
+    try:
+        session = {
+            "clerk_user_id": str(clerk_user_id).strip(),  # Always use the authenticated user's ID
+            "filename": filename,
+            "status": "processing",
+            "total_reviews": 0,
+            "positive_count": 0,
+            "negative_count": 0,
+            "created_at": datetime.utcnow()
+        }
+        session_id = analysis_sessions_collection.insert_one(session).inserted_id
+        users_collection.update_one(
+            {"clerk_user_id": session["clerk_user_id"]},
+            {"$inc": {"total_sessions": 1, DATA_VERSION_FIELD: 1}, "$set": {"updated_at": datetime.utcnow()}}
+        )
+        return session_id
+    except Exception as e:
+        print(f"❌ Error creating bulk session in MongoDB: {e}")
+        return None
+
+
+def save_bulk_reviews(clerk_user_id, session_id, chunk):
+    """Queue one chunk of bulk predictions, and the user's counter increments, for the background writer"""
+    try:
+        clerk_user_id = str(clerk_user_id).strip()
+        reviews_to_insert = build_bulk_review_docs(clerk_user_id, session_id, chunk)
+        if reviews_to_insert:
+            increments = review_increments([review["predicted_sentiment"] for review in reviews_to_insert])
+            # Counted (and the data version bumped) only once the reviews are readable; if some
+            # are given up on, the counters are rebuilt from what landed on the next stats read
+            get_bulk_writer().insert(
+                reviews_collection, reviews_to_insert, key=session_id,
+                then=lambda: users_collection.update_one({"clerk_user_id": clerk_user_id}, {"$inc": increments}),
+                on_failure=lambda: mark_stats_stale(clerk_user_id),
+            )
+    except Exception as e:
+        print(f"❌ Error saving bulk reviews to MongoDB: {e}")
+
+
+def wait_for_bulk_reviews(session_id, timeout=None):
+    """Block until the queued reviews of a session have been written"""
+    return get_bulk_writer().flush(key=session_id, timeout=timeout)
+
+
+def finish_bulk_session(clerk_user_id, session_id, summary, status="completed"):
+    """Record the final running counts of a streamed bulk session (user counters are bumped per chunk)"""
+    try:
+        analysis_sessions_collection.update_one(
+            {"_id": session_id, "clerk_user_id": clerk_user_id},
+            {"$set": dict(summary.to_dict(), status=status, completed_at=datetime.utcnow())}
+        )
+        bump_data_version(clerk_user_id)
+        print(f"✅ Saved streamed bulk analysis session for user: {clerk_user_id[:20]}...")
+    except Exception as e:
+        print(f"❌ Error finishing bulk session in MongoDB: {e}")
+
+
+def reset_bulk_session(clerk_user_id, session_id):
+    """Remove reviews saved by an interrupted run so a retried job doesn't duplicate them"""
+    try:
+        # Writes this process still has queued for the session would land after the delete
+        wait_for_bulk_reviews(session_id)
+        deleted = delete_reviews(clerk_user_id, {"session_id": session_id})
+        analysis_sessions_collection.update_one(
+            {"_id": session_id, "clerk_user_id": clerk_user_id},
+            {"$set": {"status": "processing", "total_reviews": 0, "positive_count": 0, "negative_count": 0}}
+        )
+        bump_data_version(clerk_user_id)
+        if deleted:
+            print(f"♻️ Removed {deleted} partial reviews from interrupted session {session_id}")
+    except Exception as e:
+        print(f"❌ Error resetting bulk session in MongoDB: {e}")
@@ -0,0 +1,245 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, PyMongoError
+
+# Documents per insert_many; unordered batches let the server apply them in parallel
+BULK_WRITE_BATCH_SIZE = int(os.getenv("BULK_WRITE_BATCH_SIZE", 1000))
+# Batches waiting to be written; producers block beyond this so memory stays bounded
+BULK_WRITE_QUEUE_SIZE = int(os.getenv("BULK_WRITE_QUEUE_SIZE", 64))
+BULK_WRITE_THREADS = int(os.getenv("BULK_WRITE_THREADS", 2))
+BULK_WRITE_MAX_RETRIES = int(os.getenv("BULK_WRITE_MAX_RETRIES", 5))
+BULK_WRITE_RETRY_BACKOFF_S = float(os.getenv("BULK_WRITE_RETRY_BACKOFF_S", 0.5))
+# Write concern for bulk review inserts: w=0/1/<n>/majority, optionally journaled
+BULK_WRITE_CONCERN = os.getenv("BULK_WRITE_CONCERN", "1")
+BULK_WRITE_JOURNAL = os.getenv("BULK_WRITE_JOURNAL", "false").lower() in ("1", "true", "yes")
+# How long shutdown waits for queued writes
+BULK_WRITE_SHUTDOWN_TIMEOUT_S = float(os.getenv("BULK_WRITE_SHUTDOWN_TIMEOUT_S", 30))
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+def bulk_write_concern(w=BULK_WRITE_CONCERN, journal=BULK_WRITE_JOURNAL):
+    """WriteConcern from the BULK_WRITE_CONCERN / BULK_WRITE_JOURNAL settings"""
+    w = int(w) if str(w).isdigit() else w
+    # Journaling can't be requested for unacknowledged writes
+    return WriteConcern(w=w, j=True if journal and w != 0 else None)
+
+
+class BulkWriter:
+    """Background writer for large batches of documents.
+
+    Inserts are split into bounded unordered insert_many batches and written by worker
+    threads. Documents must carry their own _id: a retried batch then reports the rows
+    that already made it as duplicate-key errors, which are skipped instead of written twice.
+    Updates are applied once and not retried, since they may not be idempotent; an update
+    that must only happen once some inserts have landed can be passed to insert as then,
+    with on_failure to run instead if any of those inserts is given up on.
+    """
+
+    def __init__(self, batch_size=BULK_WRITE_BATCH_SIZE, queue_size=BULK_WRITE_QUEUE_SIZE,
+                 threads=BULK_WRITE_THREADS, max_retries=BULK_WRITE_MAX_RETRIES,
+                 write_concern=None):
+        self.batch_size = max(1, batch_size)
+        self.threads = max(1, threads)
+        self.max_retries = max_retries
+        self.write_concern = write_concern if write_concern is not None else bulk_write_concern()
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._workers = []
+        self._workers_pid = None
+        self._start_lock = threading.Lock()
+
+        # Outstanding operations per key (e.g. a session id), so callers can wait for their own writes
+        self._pending = Counter()
+        self._pending_cond = threading.Condition()
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._written = 0
+        self._duplicates = 0
+        self._retries = 0
+        self._failed = 0
+        self._last_batch_ms = 0.0
+        self._total_batch_ms = 0.0
+
+    def _ensure_started(self):
+        # Started lazily (and again after fork) so the threads belong to the worker process
+        if self._workers_pid == os.getpid() and all(worker.is_alive() for worker in self._workers):
+            return
+        with self._start_lock:
+            if self._workers_pid != os.getpid():
+                self._workers = []
+                self._workers_pid = os.getpid()
+            self._workers = [worker for worker in self._workers if worker.is_alive()]
+            while len(self._workers) < self.threads:
+                worker = threading.Thread(target=self._run, name=f"bulk-writer-{len(self._workers)}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _put(self, key, operation):
+        self._ensure_started()
+        with self._pending_cond:
+            self._pending[key] += 1
+        self._queue.put((key, operation))
+
+    def insert(self, collection, docs, key=None, then=None, on_failure=None):
+        """Queue documents (each with an _id) for insertion in unordered batches.
+
+        then, if given, is called once every batch has been written; on_failure is called
+        instead when some documents were given up on after max_retries.
+        """
+        self.insert_all([(collection, docs)], key=key, then=then, on_failure=on_failure)
+
+    def insert_all(self, inserts, key=None, then=None, on_failure=None):
+        """Queue several (collection, docs) inserts that share one then/on_failure callback"""
+        batches = []
+        for collection, docs in inserts:
+            collection = collection.with_options(write_concern=self.write_concern)
+            batches.extend((collection, docs[start:start + self.batch_size])
+                           for start in range(0, len(docs), self.batch_size))
+        if not batches:
+            if then is not None:
+                self._put(key, then)
+            return
+
+        remaining = [len(batches)]
+        all_written = [True]
+        remaining_lock = threading.Lock()
+
+        def write(collection, batch):
+            written = False
+            try:
+                written = self._insert_batch(collection, batch)
+            finally:
+                with remaining_lock:
+                    remaining[0] -= 1
+                    all_written[0] = all_written[0] and written
+                    last = remaining[0] == 0
+                # Runs inside the last batch's operation, so flush(key) also waits for it
+                callback = then if all_written[0] else on_failure
+                if last and callback is not None:
+                    callback()
+
+        for collection, batch in batches:
+            self._put(key, lambda collection=collection, batch=batch: write(collection, batch))
+
+    def update(self, collection, filter, update, key=None):
+        """Queue a single update_one (applied once, without retries)"""
+        self._put(key, lambda: collection.update_one(filter, update))
+
+    def flush(self, key=None, timeout=None):
+        """Wait until every queued operation (or only those for key) has been written"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._pending_cond:
+            while (self._pending[key] if key is not None else sum(self._pending.values())) > 0:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_cond.wait(remaining)
+        return True
+
+    def _run(self):
+        while True:
+            key, operation = self._queue.get()
+            try:
+                operation()
+            except Exception as e:
+                print(f"❌ Error in background bulk write: {e}")
+            finally:
+                with self._pending_cond:
+                    self._pending[key] -= 1
+                    if self._pending[key] <= 0:
+                        del self._pending[key]
+                    self._pending_cond.notify_all()
+                self._queue.task_done()
+
+    def _insert_batch(self, collection, docs):
+        """Insert one batch, retrying failed rows; False if some were given up on"""
+        start = time.perf_counter()
+        attempt = 0
+        written = True
+        while docs:
+            try:
+                collection.insert_many(docs, ordered=False)
+                self._record(written=len(docs))
+                break
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                failed = sorted({error["index"] for error in errors if error.get("code") != DUPLICATE_KEY_ERROR})
+                duplicates = sum(1 for error in errors if error.get("code") == DUPLICATE_KEY_ERROR)
+                self._record(written=len(docs) - len(errors), duplicates=duplicates)
+                docs = [docs[i] for i in failed]
+                error = e
+            except PyMongoError as e:
+                # Network errors leave it unknown which rows landed; the retry sorts that out via _id
+                error = e
+
+            if not docs:
+                break
+            attempt += 1
+            if attempt > self.max_retries:
+                print(f"❌ Giving up on {len(docs)} bulk documents after {self.max_retries} retries: {error}")
+                self._record(failed=len(docs))
+                written = False
+                break
+            self._record(retries=1)
+            time.sleep(BULK_WRITE_RETRY_BACKOFF_S * 2 ** (attempt - 1))
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._batches += 1
+            self._last_batch_ms = elapsed_ms
+            self._total_batch_ms += elapsed_ms
+        return written
+
+    def _record(self, written=0, duplicates=0, retries=0, failed=0):
+        with self._stats_lock:
+            self._written += written
+            self._duplicates += duplicates
+            self._retries += retries
+            self._failed += failed
+
+    def stats(self):
+        with self._stats_lock, self._pending_cond:
+            return {
+                "queued_operations": self._queue.qsize(),
+                "pending_operations": sum(self._pending.values()),
+                "batches": self._batches,
+                "documents_written": self._written,
+                "duplicates_skipped": self._duplicates,
+                "retries": self._retries,
+                "documents_failed": self._failed,
+                "last_batch_ms": self._last_batch_ms,
+                "avg_batch_ms": self._total_batch_ms / self._batches if self._batches else 0.0,
+                "write_concern": self.write_concern.document,
+            }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_bulk_writer():
+    """Process-wide background bulk writer"""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = BulkWriter()
+                atexit.register(flush_bulk_writer)
+    return _writer
+
+
+def flush_bulk_writer(timeout=BULK_WRITE_SHUTDOWN_TIMEOUT_S):
+    """Drain queued writes, e.g. on graceful shutdown"""
+    if _writer is None:
+        return True
+    drained = _writer.flush(timeout=timeout)
+    if not drained:
+        print(f"⚠️ Shutting down with {_writer.stats()['pending_operations']} bulk writes still queued")
+    return drained
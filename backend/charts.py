@@ -0,0 +1,126 @@
+import json
+import math
+import os
+from functools import lru_cache
+from io import BytesIO
+
+# Rendered charts only depend on the two counts, so they are cached by (positive, negative, format)
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", 256))
+
+# Charts a bulk response can carry in its headers; the JSON spec is served by the session summary
+CHART_FORMATS = ("png", "svg", "none")
+CHART_TITLE = "Sentiment Distribution"
+CHART_COLORS = {"Positive": "green", "Negative": "red"}
+CHART_MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml", "json": "application/json"}
+
+
+def distribution_counts(sentiments):
+    """(positive, negative) counts from a column of predicted sentiments"""
+    counts = sentiments.value_counts()
+    return int(counts.get("Positive", 0)), int(counts.get("Negative", 0))
+
+
+def _slices(positive, negative):
+    return [(label, value) for label, value in (("Positive", positive), ("Negative", negative)) if value > 0]
+
+
+def chart_spec(positive, negative):
+    """Render-it-yourself chart description for the frontend"""
+    total = positive + negative
+    return {
+        "type": "pie",
+        "title": CHART_TITLE,
+        "total": total,
+        "data": [
+            {
+                "label": label,
+                "value": value,
+                "percent": round(100.0 * value / total, 1),
+                "color": CHART_COLORS[label],
+            }
+            for label, value in _slices(positive, negative)
+        ],
+    }
+
+
+def preload():
+    """Import matplotlib ahead of the first PNG, e.g. in a gunicorn master before it forks"""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: F401
+    from matplotlib.figure import Figure  # noqa: F401
+
+
+def _render_png(positive, negative):
+    # matplotlib is only imported when a PNG is actually requested
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    slices = _slices(positive, negative)
+    fig = Figure(figsize=(5, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if slices:
+        ax.pie(
+            [value for _, value in slices],
+            labels=[label for label, _ in slices],
+            autopct="%1.1f%%",
+            shadow=True,
+            colors=[CHART_COLORS[label] for label, _ in slices],
+            startangle=90,
+            wedgeprops={"linewidth": 1, "edgecolor": "black"},
+            explode=[0.01] * len(slices),
+        )
+    ax.set_title(CHART_TITLE)
+
+    graph = BytesIO()
+    fig.savefig(graph, format="png")
+    return graph.getvalue()
+
+
+def _render_svg(positive, negative):
+    size, radius = 240, 90
+    cx, cy = size / 2, size / 2 + 15
+    total = positive + negative
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size + 20}" viewBox="0 0 {size} {size + 20}">',
+        f'<text x="{cx}" y="20" text-anchor="middle" font-family="sans-serif" font-size="14">{CHART_TITLE}</text>',
+    ]
+
+    slices = _slices(positive, negative)
+    if len(slices) == 1:
+        label, _ = slices[0]
+        parts.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="{CHART_COLORS[label]}" stroke="black" stroke-width="1"/>')
+        parts.append(f'<text x="{cx}" y="{cy}" text-anchor="middle" font-family="sans-serif" font-size="12" fill="white">{label} 100.0%</text>')
+    else:
+        # Start at 12 o'clock and go counter-clockwise, like the matplotlib chart
+        angle = math.pi / 2
+        for label, value in slices:
+            sweep = 2 * math.pi * value / total
+            x1, y1 = cx + radius * math.cos(angle), cy - radius * math.sin(angle)
+            x2, y2 = cx + radius * math.cos(angle + sweep), cy - radius * math.sin(angle + sweep)
+            large_arc = 1 if sweep > math.pi else 0
+            parts.append(
+                f'<path d="M{cx:.2f},{cy:.2f} L{x1:.2f},{y1:.2f} A{radius},{radius} 0 {large_arc},0 {x2:.2f},{y2:.2f} Z" '
+                f'fill="{CHART_COLORS[label]}" stroke="black" stroke-width="1"/>'
+            )
+            mid = angle + sweep / 2
+            tx, ty = cx + 0.6 * radius * math.cos(mid), cy - 0.6 * radius * math.sin(mid)
+            parts.append(
+                f'<text x="{tx:.2f}" y="{ty:.2f}" text-anchor="middle" font-family="sans-serif" font-size="12" fill="white">'
+                f'{label} {100.0 * value / total:.1f}%</text>'
+            )
+            angle += sweep
+
+    parts.append("</svg>")
+    return "".join(parts).encode("utf-8")
+
+
+@lru_cache(maxsize=CHART_CACHE_SIZE)
+def render_chart(positive, negative, chart_format="png"):
+    """Chart bytes for the given counts in png, svg or json format (cached)"""
+    if chart_format == "png":
+        return _render_png(positive, negative)
+    if chart_format == "svg":
+        return _render_svg(positive, negative)
+    if chart_format == "json":
+        return json.dumps(chart_spec(positive, negative), separators=(",", ":")).encode("utf-8")
+    raise ValueError(f"Unsupported chart format: {chart_format}")
@@ -0,0 +1,307 @@
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Import database module
+try:
+    from database import users_collection
+    from users import cached_profile, get_or_create_user
+    DB_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: Database modules not available: {e}")
+    DB_AVAILABLE = False
+
+CLERK_SECRET_KEY = os.getenv("CLERK_SECRET_KEY")
+CLERK_API_URL = os.getenv("CLERK_API_URL", "https://api.clerk.com/v1").rstrip("/")
+CLERK_API_TIMEOUT = float(os.getenv("CLERK_API_TIMEOUT", 5))
+CLERK_API_POOL_SIZE = int(os.getenv("CLERK_API_POOL_SIZE", 10))
+# Profiles (email, name) kept in memory; misses are filled in by the background enricher
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 600))
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+# Users waiting for background enrichment; further requests are dropped (and retried later) when full
+PROFILE_QUEUE_SIZE = int(os.getenv("PROFILE_QUEUE_SIZE", 1000))
+# After this many consecutive failures Clerk is left alone for CLERK_BREAKER_RESET_S
+CLERK_BREAKER_THRESHOLD = int(os.getenv("CLERK_BREAKER_THRESHOLD", 5))
+CLERK_BREAKER_RESET_S = float(os.getenv("CLERK_BREAKER_RESET_S", 30))
+
+
+class CircuitBreaker:
+    """Stops calls to an upstream after repeated failures, then lets a single trial call through"""
+
+    def __init__(self, threshold=CLERK_BREAKER_THRESHOLD, reset_timeout=CLERK_BREAKER_RESET_S):
+        self.threshold = max(1, threshold)
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self.rejected = 0
+        self.opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if not self._trial_running and time.monotonic() - self._opened_at >= self.reset_timeout:
+                # Half-open: this call decides whether the circuit closes again
+                self._trial_running = True
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.threshold:
+                if self._opened_at is None or self._trial_running:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+                self._trial_running = False
+
+    def retry_after(self):
+        """Seconds until allow() may let a call through again; 0 when it would now"""
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            if self._trial_running:
+                # The trial call in flight decides; check again shortly
+                return min(1.0, self.reset_timeout)
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if self._trial_running else "open"
+
+
+class _ProfileCache:
+    """Per-process LRU of (email, name) per user with a TTL"""
+
+    def __init__(self, max_size=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clerk_user_id):
+        with self._lock:
+            entry = self._entries.get(clerk_user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(clerk_user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, clerk_user_id, profile):
+        with self._lock:
+            self._entries[clerk_user_id] = (time.monotonic() + self.ttl, profile)
+            self._entries.move_to_end(clerk_user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def _create_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CLERK_API_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Authorization": f"Bearer {CLERK_SECRET_KEY}",
+        "Content-Type": "application/json"
+    })
+    return session
+
+
+_session = _create_session()
+_breaker = CircuitBreaker()
+_cache = _ProfileCache()
+
+
+def parse_profile(user_data):
+    """(email, name) from a Clerk user object"""
+    # Extract email (primary email address)
+    email_addresses = user_data.get("email_addresses", [])
+    email = None
+    if email_addresses:
+        # Get primary email or first email
+        primary_email = next((e for e in email_addresses if e.get("id") == user_data.get("primary_email_address_id")), None)
+        email = primary_email.get("email_address") if primary_email else email_addresses[0].get("email_address")
+
+    # Extract name (first_name + last_name or username)
+    first_name = user_data.get("first_name") or ""
+    last_name = user_data.get("last_name") or ""
+    username = user_data.get("username") or ""
+
+    name = None
+    if first_name or last_name:
+        name = f"{first_name} {last_name}".strip()
+    elif username:
+        name = username
+
+    return email, name
+
+
+# Why fetch_profile_outcome found no profile: the first two won't change by asking again
+PROFILE_NOT_FOUND = "not_found"
+PROFILE_EMPTY = "empty"
+PROFILE_ERROR = "error"
+PERMANENT_PROFILE_FAILURES = (PROFILE_NOT_FOUND, PROFILE_EMPTY)
+
+
+def fetch_profile(clerk_user_id):
+    """Fetch (email, name) from the Clerk users API; (None, None) on failure or while the circuit is open"""
+    return fetch_profile_outcome(clerk_user_id)[0]
+
+
+def fetch_profile_outcome(clerk_user_id):
+    """((email, name), failure) where failure is None, PROFILE_NOT_FOUND, PROFILE_EMPTY or PROFILE_ERROR"""
+    if not _breaker.allow():
+        return (None, None), PROFILE_ERROR
+
+    try:
+        response = _session.get(f"{CLERK_API_URL}/users/{clerk_user_id}", timeout=CLERK_API_TIMEOUT)
+    except requests.RequestException as e:
+        _breaker.failure()
+        print(f"⚠️ Error fetching user info from Clerk: {e}")
+        return (None, None), PROFILE_ERROR
+
+    if response.status_code == 200:
+        _breaker.success()
+        profile = parse_profile(response.json())
+        _cache.put(clerk_user_id, profile)
+        return profile, (None if any(profile) else PROFILE_EMPTY)
+
+    # 4xx other than rate limiting means Clerk is up but has nothing for us
+    if response.status_code == 429 or response.status_code >= 500:
+        _breaker.failure()
+        failure = PROFILE_ERROR
+    else:
+        _breaker.success()
+        failure = PROFILE_NOT_FOUND
+    print(f"⚠️ Failed to fetch user info from Clerk: {response.status_code} - {response.text[:200]}")
+    return (None, None), failure
+
+
+def _stored_profile(clerk_user_id):
+    """(email, name) stored on the user document; (None, None) when unknown or unreadable"""
+    if not DB_AVAILABLE:
+        return None, None
+    try:
+        user = users_collection.find_one({"clerk_user_id": clerk_user_id}, {"email": 1, "name": 1, "_id": 0})
+    except Exception as e:
+        print(f"⚠️ Error reading stored profile: {e}")
+        return None, None
+    return (user.get("email"), user.get("name")) if user else (None, None)
+
+
+class ProfileEnricher:
+    """Background worker that loads missing profiles from the users collection, or else from Clerk,
+    and stores what Clerk returns on the user"""
+
+    def __init__(self, queue_size=PROFILE_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self.enriched = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        # Started lazily (and again after fork) so the thread belongs to the worker process
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile-enricher", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def enqueue(self, clerk_user_id):
+        """Ask for a user's profile to be fetched; never blocks"""
+        self._ensure_started()
+        with self._lock:
+            if clerk_user_id in self._queued:
+                return
+            try:
+                self._queue.put_nowait(clerk_user_id)
+                self._queued.add(clerk_user_id)
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        while True:
+            clerk_user_id = self._queue.get()
+            try:
+                # Most users already have a complete profile stored; only the rest cost a Clerk call
+                stored_email, stored_name = _stored_profile(clerk_user_id)
+                if stored_email and stored_name:
+                    _cache.put(clerk_user_id, (stored_email, stored_name))
+                    continue
+                email, name = fetch_profile(clerk_user_id)
+                if (email or name) and DB_AVAILABLE:
+                    # Fills in only what is still missing and refreshes the user cache
+                    get_or_create_user(clerk_user_id, email=email, name=name)
+                    self.enriched += 1
+            except Exception as e:
+                print(f"❌ Error enriching profile for user {clerk_user_id}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(clerk_user_id)
+
+    def stats(self):
+        return {"queued": self._queue.qsize(), "enriched": self.enriched, "dropped": self.dropped}
+
+
+_enricher = ProfileEnricher()
+
+
+def lookup_profile(clerk_user_id):
+    """(email, name) for a user without waiting on Clerk or the database.
+
+    Served from the in-process profile cache or the user cache. Otherwise the user is queued
+    for background enrichment, which reads the stored profile and asks Clerk only when that is
+    incomplete, and whatever is known now is returned; later requests pick up the result.
+    """
+    profile = _cache.get(clerk_user_id)
+    if profile is not None:
+        return profile
+
+    email = name = None
+    if DB_AVAILABLE:
+        email, name = cached_profile(clerk_user_id) or (None, None)
+
+    if email and name:
+        _cache.put(clerk_user_id, (email, name))
+    else:
+        _enricher.enqueue(clerk_user_id)
+    return email, name
+
+
+def clerk_retry_after():
+    """Seconds the circuit breaker will keep calls away from Clerk; 0 when a call would be let through"""
+    return _breaker.retry_after()
+
+
+def profile_stats():
+    return dict(_cache.stats(), breaker=_breaker.state(), breaker_opened=_breaker.opened,
+                breaker_rejected=_breaker.rejected, enrichment=_enricher.stats())
@@ -0,0 +1,91 @@
+import zlib
+
+# Content-Encodings for streamed responses, in order of preference when the client weighs them equally.
+# br and zstd need the optional brotli / zstandard packages and are only offered when installed.
+CONTENT_ENCODINGS = ("zstd", "br", "gzip")
+
+# Levels chosen for streaming speed over ratio
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ZSTD_LEVEL = 3
+
+
+class _GzipEncoder:
+    def __init__(self):
+        # wbits=31 writes a gzip header and trailer rather than a raw zlib stream
+        self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class _BrotliEncoder:
+    def __init__(self):
+        import brotli
+        self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class _ZstdEncoder:
+    def __init__(self):
+        import zstandard
+        self._compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+_ENCODERS = {
+    "gzip": _GzipEncoder,
+    "br": _BrotliEncoder,
+    "zstd": _ZstdEncoder,
+}
+
+_OPTIONAL_MODULES = {
+    "br": "brotli",
+    "zstd": "zstandard",
+}
+
+
+def encoding_available(encoding):
+    """False for br/zstd when their compression package isn't installed"""
+    module = _OPTIONAL_MODULES.get(encoding)
+    if module is None:
+        return encoding in _ENCODERS
+    try:
+        __import__(module)
+        return True
+    except ImportError:
+        return False
+
+
+def negotiate_content_encoding(accept_encodings):
+    """Best encoding for a werkzeug Accept-Encoding header, or None to send the body as is"""
+    if not accept_encodings:
+        return None
+    available = [encoding for encoding in CONTENT_ENCODINGS if encoding_available(encoding)]
+    return accept_encodings.best_match(available)
+
+
+def encode_stream(chunks, encoding):
+    """Compress an iterable of bytes incrementally; passes it through when encoding is None"""
+    if encoding is None:
+        yield from chunks
+        return
+    encoder = _ENCODERS[encoding]()
+    for chunk in chunks:
+        data = encoder.compress(chunk)
+        if data:
+            yield data
+    yield encoder.finish()
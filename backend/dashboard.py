@@ -8,8 +8,7 @@ import re
 import pickle
 from io import BytesIO
 import requests
-from nltk.corpus import stopwords
-from nltk.stem.porter import PorterStemmer
+from text_processing import normalize_text
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -72,9 +71,6 @@ ASPECT_KEYWORDS = {
     'performance': ['performance', 'speed', 'fast', 'slow', 'lag', 'responsive']
 }
 
-STOPWORDS = set(stopwords.words("english"))
-stemmer = PorterStemmer()
-
 # Load sentiment model
 @st.cache_resource
 def load_sentiment_model():
@@ -89,12 +85,7 @@ def load_sentiment_model():
 
 def preprocess_text(text):
     """Preprocess text for sentiment analysis"""
-    if pd.isna(text):
-        return ""
-    text = re.sub("[^a-zA-Z]", " ", str(text))
-    text = text.lower().split()
-    text = [stemmer.stem(word) for word in text if word not in STOPWORDS]
-    return " ".join(text)
+    return normalize_text(text)
 
 def predict_sentiment(text, predictor, scaler, cv):
     """Predict sentiment for a text"""
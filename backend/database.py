@@ -1,5 +1,4 @@
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
 import os
 from dotenv import load_dotenv
 from datetime import datetime
@@ -11,15 +10,12 @@ MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "synapse_sentiment")
 
 # Initialize MongoDB client
+# The client connects in the background on first use, so importing this module never waits
+# on the server; migrate.py checks connectivity explicitly. connect=False also keeps a preloading
+# gunicorn master from opening sockets or monitor threads: each forked worker starts its own.
 try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
+    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, connect=False)
     db = client[DATABASE_NAME]
-    
-    # Test connection
-    client.admin.command('ping')
-    print(f"✅ Connected to MongoDB: {DATABASE_NAME}")
-except ConnectionFailure as e:
-    print(f"❌ Failed to connect to MongoDB: {e}")
 except Exception as e:
     print(f"❌ Error connecting to MongoDB: {e}")
 
@@ -28,10 +24,16 @@ users_collection = db.users
 reviews_collection = db.reviews
 analysis_sessions_collection = db.analysis_sessions
 user_preferences_collection = db.user_preferences
+bulk_jobs_collection = db.bulk_jobs
+
+def ping():
+    """Round trip to the server; raises if it can't be reached"""
+    client.admin.command('ping')
 
-# Create indexes
+
+# Create indexes (a migration step: run migrate.py on deploy rather than on every worker boot)
 def create_indexes():
-    """Create indexes for better query performance"""
+    """Create indexes for better query performance; returns whether it succeeded"""
     try:
         # Users collection
         users_collection.create_index("clerk_user_id", unique=True)
@@ -39,17 +41,22 @@ def create_indexes():
         # Reviews collection
         reviews_collection.create_index("clerk_user_id")
         reviews_collection.create_index("created_at")
-        reviews_collection.create_index([("clerk_user_id", 1), ("created_at", -1)])
+        reviews_collection.create_index([("clerk_user_id", 1), ("created_at", -1), ("_id", -1)])
+        reviews_collection.create_index([("clerk_user_id", 1), ("predicted_sentiment", 1)])
         
         # Analysis sessions collection
         analysis_sessions_collection.create_index("clerk_user_id")
         analysis_sessions_collection.create_index("created_at")
-        analysis_sessions_collection.create_index([("clerk_user_id", 1), ("created_at", -1)])
+        analysis_sessions_collection.create_index([("clerk_user_id", 1), ("created_at", -1), ("_id", -1)])
+        
+        # Bulk jobs collection
+        bulk_jobs_collection.create_index([("clerk_user_id", 1), ("created_at", -1)])
+        bulk_jobs_collection.create_index([("status", 1), ("heartbeat_at", 1)])
+        bulk_jobs_collection.create_index([("status", 1), ("finished_at", 1)])
         
         print("✅ Database indexes created successfully")
+        return True
     except Exception as e:
         print(f"⚠️ Warning: Could not create indexes: {e}")
-
-# Initialize indexes when module is imported
-create_indexes()
+        return False
 
@@ -1,18 +1,48 @@
 # Gunicorn configuration file
-import multiprocessing
+import gc
+import os
+
+from text_processing import available_cpus
 
 # Server socket
-bind = "0.0.0.0:5000"
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
 backlog = 2048
 
-# Worker processes (1 worker for free tier memory limits)
-workers = 1
+# Import the app (and load the models) once in the master, then fork the workers from it so the
+# vectorizer, scaler, booster, pandas and matplotlib are shared copy-on-write instead of loaded
+# per worker. With it off every worker imports the app itself and only one fits in free tier memory.
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Cores this container may actually use (CPU affinity and cgroup quota, not the host's core count)
+cores = available_cpus()
+
+# Worker processes: one per core when preloading, but at most GUNICORN_MAX_WORKERS by default since
+# the deployment is memory-capped (worker_memory.py reports what each one costs)
+GUNICORN_MAX_WORKERS = int(os.getenv("GUNICORN_MAX_WORKERS", 4))
+workers = int(os.getenv("WEB_CONCURRENCY", min(cores, GUNICORN_MAX_WORKERS) if preload_app else 1))
 worker_class = "sync"
-threads = 2
+threads = int(os.getenv("GUNICORN_THREADS", 2))
 worker_connections = 1000
-timeout = 30
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 120))
 keepalive = 2
 
+# XGBoost threads and preprocessing processes each worker may use; splitting the cores between
+# the workers keeps them from oversubscribing the machine
+cores_per_worker = max(1, cores // workers)
+xgboost_nthread = int(os.getenv("XGBOOST_NTHREAD", 0)) or cores_per_worker
+# Read by text_processing in the master (preload) or each worker; 1 means no process pool
+os.environ.setdefault("PREPROCESS_WORKERS", str(cores_per_worker))
+
+if preload_app:
+    # Tells api.py to finish its imports before the fork and leave threads to post_fork
+    os.environ["PRELOAD_APP"] = "1"
+    # The master warms the booster single-threaded: an OpenMP pool started before fork() is not
+    # usable in the children
+    os.environ["XGBOOST_NTHREAD"] = "1"
+    # No collections in the master while the app is imported, so long-lived objects are packed
+    # together instead of interleaved with freed holes; when_ready freezes them and turns it back on
+    gc.disable()
+
 # Logging
 accesslog = "-"
 errorlog = "-"
@@ -34,3 +64,40 @@ tmp_upload_dir = None
 # keyfile = None
 # certfile = None
 
+
+def when_ready(server):
+    """The preloaded app is imported and no worker is forked yet: freeze it and turn collection back on.
+
+    Frozen objects are never traversed by a worker's collections, which would otherwise write
+    to their GC headers and copy the shared pages into every worker. The master itself runs
+    with the collector on from here, so its own later garbage is still reclaimed.
+    """
+    if preload_app:
+        gc.freeze()
+        gc.enable()
+
+
+def pre_fork(server, worker):
+    """Also freeze whatever the master allocated since, before a worker is (re)spawned"""
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Per-worker setup for state that must not be shared across the fork"""
+    if not preload_app:
+        return
+    # pymongo was told not to connect in the master (connect=False), so each worker opens its own
+    # pool and monitor threads on first use
+    from jobs import start_job_recovery
+    from model_loader import set_inference_threads
+    set_inference_threads(xgboost_nthread)
+    start_job_recovery()
+
+
+def worker_exit(server, worker):
+    """Write out buffered reviews and queued bulk inserts before the worker goes away"""
+    from bulk_writer import flush_bulk_writer
+    from write_behind import flush_write_behind
+    flush_write_behind()
+    flush_bulk_writer()
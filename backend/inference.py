@@ -0,0 +1,64 @@
+import json
+import threading
+
+import numpy as np
+import scipy.sparse as sp
+
+_prepare_lock = threading.Lock()
+
+
+def prepare_sparse_predictor(predictor, scaler):
+    """Make absent CSR entries follow the same tree branch as the scaled value of a zero count.
+
+    XGBoost treats entries missing from a sparse matrix as "missing" and sends them down each
+    split's default branch, while the dense pipeline feeds them as scaler.min_ (0 for count
+    features). The model was trained on dense data, so we rewrite every split's default
+    direction to match what the dense value would have done. Predictions on dense input are
+    unchanged because default directions only apply to missing values.
+    """
+    if getattr(predictor, "_sparse_ready", False):
+        return predictor
+
+    with _prepare_lock:
+        if getattr(predictor, "_sparse_ready", False):
+            return predictor
+
+        booster = predictor.get_booster()
+        model = json.loads(booster.save_raw("json"))
+        offsets = np.asarray(scaler.min_, dtype=np.float32)
+
+        for tree in model["learner"]["gradient_booster"]["model"]["trees"]:
+            left_children = tree["left_children"]
+            split_indices = tree["split_indices"]
+            split_conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+            default_left = tree["default_left"]
+            for node, left in enumerate(left_children):
+                if left == -1:
+                    continue  # Leaf node
+                # XGBoost goes left when value < split_condition
+                default_left[node] = int(offsets[split_indices[node]] < split_conditions[node])
+
+        booster.load_model(bytearray(json.dumps(model).encode("utf-8")))
+        predictor._sparse_ready = True
+
+    return predictor
+
+
+def transform_sparse(scaler, cv, corpus):
+    """Vectorize and min-max scale a corpus, keeping the result in CSR form"""
+    X = cv.transform(corpus).tocsr()
+
+    # Apply the fitted per-feature scale/offset to stored entries only
+    data = X.data * scaler.scale_[X.indices] + scaler.min_[X.indices]
+    if scaler.clip:
+        np.clip(data, scaler.feature_range[0], scaler.feature_range[1], out=data)
+
+    # XGBoost works in float32, so casting here gives the same values the dense path sees
+    return sp.csr_matrix((data.astype(np.float32), X.indices, X.indptr), shape=X.shape)
+
+
+def sparse_predict_proba(predictor, scaler, cv, corpus):
+    """Class probabilities for a preprocessed corpus without densifying the feature matrix"""
+    prepare_sparse_predictor(predictor, scaler)
+    X_prediction_scl = transform_sparse(scaler, cv, corpus)
+    return predictor.predict_proba(X_prediction_scl)
@@ -0,0 +1,471 @@
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+import zlib
+
+
+# Upper bound on decompressed bytes from one upload or request body, so a small
+# compressed payload can't expand without limit
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", 2 * 1024 ** 3))
+
+# Bytes read from the start of an upload to sniff its format, header and delimiter
+SNIFF_BYTES = 64 * 1024
+# Delimiters tried when sniffing delimited text uploads
+CSV_DELIMITERS = ",\t;|"
+READ_BLOCK_SIZE = 1024 * 1024
+
+# Column names recognised as the review text column
+REVIEW_COLUMN_NAMES = ['Sentence', 'sentence', 'Review', 'review', 'review_text', 'Review Text',
+                       'text', 'Text', 'comment', 'Comment', 'feedback', 'Feedback']
+
+# Upload formats by file extension
+UPLOAD_EXTENSIONS = {
+    ".csv": "csv",
+    ".tsv": "csv",
+    ".txt": "csv",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".xlsx": "xlsx",
+    ".xlsm": "xlsx",
+    ".xls": "xls",
+    ".zip": "zip",
+    ".gz": "gzip",
+}
+
+# Default filenames for uploads sent as a raw request body, by Content-Type
+UPLOAD_MIME_TYPES = {
+    "text/csv": "upload.csv",
+    "text/tab-separated-values": "upload.tsv",
+    "application/x-ndjson": "upload.ndjson",
+    "application/jsonl": "upload.ndjson",
+    "application/vnd.apache.parquet": "upload.parquet",
+    "application/x-parquet": "upload.parquet",
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": "upload.xlsx",
+    "application/vnd.ms-excel": "upload.xls",
+    "application/zip": "upload.zip",
+    "application/gzip": "upload.gz",
+}
+
+# Column added to rows from archives with more than one file
+SOURCE_FILE_COLUMN = "Source file"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+_ZIP_MAGIC = b"PK\x03\x04"
+_PARQUET_MAGIC = b"PAR1"
+_OLE_MAGIC = b"\xd0\xcf\x11\xe0"
+
+
+def find_review_column(columns):
+    """Find the review text column (flexible column name matching)"""
+    for col in columns:
+        col_lower = str(col).lower()
+        if col in REVIEW_COLUMN_NAMES or 'sentence' in col_lower or 'review' in col_lower:
+            return col
+    return None
+
+
+def _require_review_column(columns):
+    review_column = find_review_column(columns)
+    if review_column is None:
+        raise ValueError(f"Could not find review column. Available columns: {', '.join(map(str, columns))}. Expected column names: Sentence, Review, review_text, etc.")
+    return review_column
+
+
+def _extension_format(filename):
+    name = (filename or "").lower()
+    for extension, upload_format in UPLOAD_EXTENSIONS.items():
+        if name.endswith(extension):
+            return upload_format
+    return None
+
+
+def is_supported_upload(filename):
+    """Whether an upload can be ingested; files without an extension are sniffed"""
+    name = os.path.basename(filename or "")
+    return "." not in name or _extension_format(name) is not None
+
+
+def is_line_delimited(filename):
+    """Whether newlines in the raw upload roughly correspond to rows (for progress estimates)"""
+    return _extension_format(filename) in ("csv", "ndjson") or "." not in os.path.basename(filename or "")
+
+
+def detect_format(filename, head):
+    """Upload format from magic bytes, then the file extension, then the content itself"""
+    if head.startswith(_GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(_PARQUET_MAGIC):
+        return "parquet"
+    extension_format = _extension_format(filename)
+    if head.startswith(_OLE_MAGIC):
+        return "xls"
+    if head.startswith(_ZIP_MAGIC):
+        # .xlsx workbooks are zip files too
+        return "xlsx" if extension_format == "xlsx" else "zip"
+    if extension_format is not None:
+        return extension_format
+    if "." in os.path.basename(filename or ""):
+        raise ValueError("Unsupported file format. Please upload CSV, NDJSON, Parquet, Excel (.xlsx, .xls), zip or gzip files.")
+    return "ndjson" if head.lstrip().startswith(b"{") else "csv"
+
+
+class _ReplayStream(io.RawIOBase):
+    """Replays bytes already read from a stream before continuing with the stream itself"""
+
+    def __init__(self, head, stream):
+        self._head = head
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._head:
+            size = min(len(buffer), len(self._head))
+            buffer[:size] = self._head[:size]
+            self._head = self._head[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class _LimitedStream(io.RawIOBase):
+    """Raises once more than INGEST_MAX_BYTES have been read through it"""
+
+    def __init__(self, stream, limit=INGEST_MAX_BYTES):
+        self._stream = stream
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ValueError(f"Decompressed upload is larger than {INGEST_MAX_BYTES} bytes.")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class DecompressingStream(io.RawIOBase):
+    """Reads a gzip or zlib/deflate encoded stream as plain bytes, with bounded memory"""
+
+    def __init__(self, stream, limit=INGEST_MAX_BYTES):
+        self._stream = stream
+        # 32 + MAX_WBITS accepts both gzip and zlib headers
+        self._decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self._pending = b""
+        self._eof = False
+        self._remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = len(buffer)
+        while True:
+            if self._pending:
+                data = self._decompressor.decompress(self._pending, size)
+                self._pending = self._decompressor.unconsumed_tail
+            elif self._eof:
+                return 0
+            else:
+                block = self._stream.read(READ_BLOCK_SIZE)
+                if block:
+                    data = self._decompressor.decompress(block, size)
+                    self._pending = self._decompressor.unconsumed_tail
+                else:
+                    self._eof = True
+                    data = self._decompressor.flush()
+            if data:
+                break
+
+        self._remaining -= len(data)
+        if self._remaining < 0:
+            raise ValueError(f"Decompressed request body is larger than {INGEST_MAX_BYTES} bytes.")
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def _peek(stream, size=SNIFF_BYTES):
+    """(head, stream) where stream still starts at the beginning of the data"""
+    head = stream.read(size) or b""
+    if hasattr(stream, "seekable") and stream.seekable():
+        stream.seek(-len(head), io.SEEK_CUR)
+        return head, stream
+    return head, io.BufferedReader(_ReplayStream(head, stream), READ_BLOCK_SIZE)
+
+
+def _seekable(stream, cleanup):
+    """Zip, Parquet and Excel readers need random access; spool other streams to disk"""
+    if hasattr(stream, "seekable") and stream.seekable():
+        return stream
+    spooled = tempfile.TemporaryFile()
+    cleanup.append(spooled)
+    shutil.copyfileobj(stream, spooled, READ_BLOCK_SIZE)
+    spooled.seek(0)
+    return spooled
+
+
+def _select(frame, review_column, keep_columns):
+    if not keep_columns:
+        frame = frame[[review_column]]
+    # Rename the column to 'Sentence' for consistency
+    return frame.rename(columns={review_column: 'Sentence'})
+
+
+def _sniff_delimiter(sample, filename):
+    """Delimiter of a delimited text upload, sniffed from a sample of complete lines"""
+    default = "\t" if (filename or "").lower().endswith(".tsv") else ","
+    text = sample.decode("utf-8", errors="replace")
+    try:
+        delimiter = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS).delimiter
+    except csv.Error:
+        return default
+    # A single-column file has no delimiter in its header, whatever its reviews contain
+    return delimiter if delimiter in text.split("\n", 1)[0] else default
+
+
+def _csv_chunks(stream, filename, chunksize, keep_columns):
+    import pandas as pd
+
+    # Sniff the delimiter and parse the header from a bounded sample of whole lines, then only
+    # convert the review column
+    head, stream = _peek(stream)
+    if b"\n" not in head and len(head) >= SNIFF_BYTES:
+        raise ValueError(f"CSV header row is longer than {SNIFF_BYTES} bytes.")
+    sample = head[:head.rfind(b"\n") + 1] if len(head) >= SNIFF_BYTES else head
+    if not sample.strip():
+        return
+    delimiter = _sniff_delimiter(sample, filename)
+    columns = pd.read_csv(io.BytesIO(sample), sep=delimiter, nrows=0).columns
+    review_column = _require_review_column(columns)
+
+    # Passthrough columns stay text so every chunk has the same dtypes, whatever its values look like
+    usecols = None if keep_columns else [review_column]
+    dtype = {column: str for column in columns if column != review_column} if keep_columns else None
+    for chunk in pd.read_csv(stream, sep=delimiter, chunksize=chunksize, usecols=usecols, dtype=dtype):
+        yield _select(chunk, review_column, keep_columns)
+
+
+def _ndjson_chunks(stream, chunksize, keep_columns):
+    import pandas as pd
+
+    lines = io.TextIOWrapper(stream, encoding="utf-8")
+    review_column = None
+    rows = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if review_column is None:
+            review_column = _require_review_column(list(record))
+        # Without keep_columns only the review text of each record is kept in memory
+        rows.append(record if keep_columns else {review_column: record.get(review_column)})
+        if len(rows) >= chunksize:
+            yield _select(pd.DataFrame(rows), review_column, keep_columns)
+            rows = []
+    if rows:
+        yield _select(pd.DataFrame(rows), review_column, keep_columns)
+
+
+def _parquet_chunks(stream, chunksize, keep_columns, cleanup):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(_seekable(stream, cleanup))
+    review_column = _require_review_column(parquet_file.schema_arrow.names)
+    # Column projection: only the review column's pages are read and decoded
+    columns = None if keep_columns else [review_column]
+    for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+        yield _select(batch.to_pandas(), review_column, keep_columns)
+
+
+def _xlsx_chunks(stream, chunksize, keep_columns, cleanup):
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    # read_only streams rows from the sheet XML instead of building the whole workbook
+    workbook = load_workbook(_seekable(stream, cleanup), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [value if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+        review_column = _require_review_column(columns)
+        review_index = columns.index(review_column)
+
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            if keep_columns:
+                batch.append(tuple(row[:len(columns)]) + (None,) * (len(columns) - len(row)))
+            else:
+                batch.append((row[review_index] if review_index < len(row) else None,))
+            if len(batch) >= chunksize:
+                yield _select(pd.DataFrame(batch, columns=columns if keep_columns else [review_column]),
+                              review_column, keep_columns)
+                batch = []
+        if batch:
+            yield _select(pd.DataFrame(batch, columns=columns if keep_columns else [review_column]),
+                          review_column, keep_columns)
+    finally:
+        workbook.close()
+
+
+def _xls_chunks(stream, chunksize, keep_columns, cleanup):
+    import pandas as pd
+
+    # Legacy .xls has no streaming reader; xlrd loads the sheet, but only the review column is kept
+    stream = _seekable(stream, cleanup)
+    columns = pd.read_excel(stream, nrows=0).columns
+    review_column = _require_review_column(columns)
+    stream.seek(0)
+    data = pd.read_excel(stream, usecols=None if keep_columns else [review_column])
+    for start in range(0, len(data), chunksize):
+        yield _select(data.iloc[start:start + chunksize], review_column, keep_columns)
+
+
+def _zip_chunks(stream, chunksize, keep_columns, cleanup):
+    archive = zipfile.ZipFile(_seekable(stream, cleanup))
+    members = sorted(
+        (info for info in archive.infolist()
+         if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+         and not os.path.basename(info.filename).startswith(".")
+         and _extension_format(info.filename) not in (None, "zip")),
+        key=lambda info: info.filename,
+    )
+    if not members:
+        raise ValueError("Zip archive contains no CSV, NDJSON, Parquet or Excel files.")
+
+    # Members may have different columns, but a streamed output has one header/schema: every
+    # chunk gets the columns of all members (missing ones empty), known before the first is yielded
+    columns = _member_columns(archive, members, keep_columns) if len(members) > 1 else None
+    for info in members:
+        with archive.open(info) as member:
+            for chunk in _iter_chunks(_LimitedStream(member), info.filename, chunksize, keep_columns, cleanup):
+                if columns is not None:
+                    chunk[SOURCE_FILE_COLUMN] = info.filename
+                    chunk = chunk.reindex(columns=columns)
+                yield chunk
+
+
+def _member_columns(archive, members, keep_columns):
+    """Union of the columns of every member, in the order first seen, plus SOURCE_FILE_COLUMN"""
+    columns = {}
+    for info in members:
+        if keep_columns:
+            # The first row of each member is enough for its header
+            member_cleanup = []
+            with archive.open(info) as member:
+                chunks = _iter_chunks(_LimitedStream(member), info.filename, 1, keep_columns, member_cleanup)
+                try:
+                    first = next(chunks, None)
+                finally:
+                    chunks.close()
+                    for spooled in member_cleanup:
+                        spooled.close()
+            names = first.columns if first is not None else []
+        else:
+            names = ["Sentence"]
+        columns.update(dict.fromkeys(names))
+    columns.pop(SOURCE_FILE_COLUMN, None)
+    return list(columns) + [SOURCE_FILE_COLUMN]
+
+
+def _iter_chunks(stream, filename, chunksize, keep_columns, cleanup):
+    head, stream = _peek(stream)
+    upload_format = detect_format(filename, head)
+
+    if upload_format == "gzip":
+        inner_name = filename[:-3] if (filename or "").lower().endswith(".gz") else ""
+        inner = io.BufferedReader(_LimitedStream(gzip.GzipFile(fileobj=stream)), READ_BLOCK_SIZE)
+        yield from _iter_chunks(inner, inner_name, chunksize, keep_columns, cleanup)
+    elif upload_format == "zip":
+        yield from _zip_chunks(stream, chunksize, keep_columns, cleanup)
+    elif upload_format == "parquet":
+        yield from _parquet_chunks(stream, chunksize, keep_columns, cleanup)
+    elif upload_format == "xlsx":
+        yield from _xlsx_chunks(stream, chunksize, keep_columns, cleanup)
+    elif upload_format == "xls":
+        yield from _xls_chunks(stream, chunksize, keep_columns, cleanup)
+    elif upload_format == "ndjson":
+        yield from _ndjson_chunks(stream, chunksize, keep_columns)
+    else:
+        yield from _csv_chunks(stream, filename, chunksize, keep_columns)
+
+
+def iter_review_chunks(file, filename, chunksize, keep_columns=True):
+    """Yield DataFrames with the upload's review text in a "Sentence" column.
+
+    Handles CSV, NDJSON, Parquet, Excel, gzip-compressed files and zip archives of them.
+    Every column is kept unless keep_columns is False, in which case only the review column
+    is parsed. Raises ValueError for unsupported files or when no review column is found.
+    """
+    cleanup = []
+    try:
+        yield from _iter_chunks(file, filename, chunksize, keep_columns, cleanup)
+    finally:
+        for spooled in cleanup:
+            spooled.close()
+
+
+def read_reviews(file, filename, chunksize=100000, keep_columns=True):
+    """Read a whole upload into one DataFrame with a "Sentence" column"""
+    import pandas as pd
+
+    chunks = list(iter_review_chunks(file, filename, chunksize, keep_columns))
+    if not chunks:
+        raise ValueError("Uploaded file contains no reviews.")
+    if len(chunks) == 1:
+        return chunks[0].reset_index(drop=True)
+    return pd.concat(_align_dtypes(chunks), ignore_index=True)
+
+
+def _align_dtypes(chunks):
+    """Turn columns whose inferred dtype differs between chunks into text, so concat doesn't mix
+    types (e.g. ints in one NDJSON or Excel chunk and strings in the next)"""
+    dtypes = {}
+    for chunk in chunks:
+        for column, dtype in chunk.dtypes.items():
+            dtypes.setdefault(column, set()).add(dtype)
+    mixed = [column for column, seen in dtypes.items() if len(seen) > 1 and column != "Sentence"]
+    if not mixed:
+        return chunks
+
+    aligned = []
+    for chunk in chunks:
+        chunk = chunk.copy()
+        for column in mixed:
+            if column in chunk:
+                values = chunk[column]
+                chunk[column] = values.astype(str).where(values.notna(), None)
+        aligned.append(chunk)
+    return aligned
+
+
+class DecompressRequestMiddleware:
+    """WSGI middleware that decodes gzip/deflate request bodies (Content-Encoding) before Flask parses them"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get("HTTP_CONTENT_ENCODING", "").strip().lower()
+        if encoding in ("gzip", "x-gzip", "deflate"):
+            environ["wsgi.input"] = io.BufferedReader(DecompressingStream(environ["wsgi.input"]), READ_BLOCK_SIZE)
+            # The decoded length isn't known up front; the body ends where the decoded stream does
+            environ.pop("CONTENT_LENGTH", None)
+            environ.pop("HTTP_CONTENT_ENCODING", None)
+            environ["wsgi.input_terminated"] = True
+        return self.app(environ, start_response)
@@ -0,0 +1,385 @@
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bulk import iter_upload_predictions, stream_predictions, SentimentSummary
+from bulk_storage import (create_bulk_session, save_bulk_reviews, finish_bulk_session, reset_bulk_session,
+                          wait_for_bulk_reviews)
+from ingest import is_line_delimited
+from model_loader import get_models
+from output_formats import create_writer, output_filename, output_mimetype
+
+# Import database module - job state lives in Mongo, files in GridFS
+try:
+    from database import db, bulk_jobs_collection
+    from gridfs import GridFSBucket
+    from gridfs.errors import NoFile
+    from pymongo import ReturnDocument
+    job_files = GridFSBucket(db, bucket_name="bulk_job_files")
+    JOBS_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: Bulk jobs not available: {e}")
+    JOBS_AVAILABLE = False
+
+BULK_JOB_WORKERS = int(os.getenv("BULK_JOB_WORKERS", 2))
+# A queued/running job whose heartbeat is older than this is assumed to have lost its worker
+BULK_JOB_STALE_SECONDS = int(os.getenv("BULK_JOB_STALE_SECONDS", 120))
+BULK_JOB_MAX_ATTEMPTS = int(os.getenv("BULK_JOB_MAX_ATTEMPTS", 3))
+BULK_JOB_RECOVERY_INTERVAL = int(os.getenv("BULK_JOB_RECOVERY_INTERVAL", 60))
+# Each process refreshes the heartbeat of the jobs it holds (queued in its pool or running) this often,
+# independently of progress, so long flushes and a busy pool don't make live jobs look stale
+BULK_JOB_HEARTBEAT_INTERVAL = int(os.getenv("BULK_JOB_HEARTBEAT_INTERVAL", max(1, BULK_JOB_STALE_SECONDS // 4)))
+# Finished jobs (their document and result file) are kept this long for download, then expired
+BULK_JOB_RETENTION_HOURS = float(os.getenv("BULK_JOB_RETENTION_HOURS", 24 * 7))
+
+TERMINAL_STATUSES = ("completed", "failed")
+
+_executor = None
+_executor_lock = threading.Lock()
+_recovery_thread = None
+_boot_id = None
+_boot_pid = None
+
+
+class JobTakenOver(Exception):
+    """Another worker re-claimed the job while this one was still running it"""
+
+
+def _get_executor():
+    # Created lazily so the pool's threads belong to the worker process, not a pre-fork parent
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=BULK_JOB_WORKERS, thread_name_prefix="bulk-job")
+    return _executor
+
+
+def _worker_id():
+    # The random part tells a restarted container's process apart from an earlier one with the same pid;
+    # it is regenerated after a fork so preloaded gunicorn workers don't share it
+    global _boot_id, _boot_pid
+    if _boot_pid != os.getpid():
+        _boot_id, _boot_pid = uuid.uuid4().hex[:8], os.getpid()
+    return f"{socket.gethostname()}:{os.getpid()}:{_boot_id}"
+
+
+def _upload_file_id(job_id):
+    return f"{job_id}:upload"
+
+
+def _result_file_id(job_id):
+    return f"{job_id}:result"
+
+
+def _delete_file(file_id):
+    # GridFS deletes the chunks even when the files document was never written
+    try:
+        job_files.delete(file_id)
+    except NoFile:
+        pass
+
+
+def _release_files(job_id, status):
+    # The upload is only needed to (re)run the job; a failed job's partial result is never served
+    _delete_file(_upload_file_id(job_id))
+    if status != "completed":
+        _delete_file(_result_file_id(job_id))
+
+
+def create_job(clerk_user_id, file, output_format="csv", keep_columns=True):
+    """Store an upload in GridFS, record a queued job and hand it to the worker pool"""
+    job_id = uuid.uuid4().hex
+
+    # Copy the upload in blocks, counting lines for a rough progress estimate (plain CSV/NDJSON only)
+    newlines = 0
+    with job_files.open_upload_stream_with_id(
+        _upload_file_id(job_id), file.filename or "upload.csv", metadata={"job_id": job_id}
+    ) as grid_in:
+        while True:
+            block = file.stream.read(1 << 20)
+            if not block:
+                break
+            newlines += block.count(b"\n")
+            grid_in.write(block)
+
+    now = datetime.utcnow()
+    job = {
+        "_id": job_id,
+        "clerk_user_id": clerk_user_id,
+        "filename": file.filename,
+        "output_format": output_format,
+        "keep_columns": keep_columns,
+        "status": "queued",
+        "rows_processed": 0,
+        "total_rows_estimate": max(newlines - 1, 0) if is_line_delimited(file.filename) else None,
+        "attempts": 0,
+        "session_id": None,
+        "error": None,
+        "created_at": now,
+        "heartbeat_at": now,
+        "worker": _worker_id(),
+    }
+    bulk_jobs_collection.insert_one(job)
+    submit_job(job_id)
+    start_job_recovery()
+    return job
+
+
+def submit_job(job_id):
+    _get_executor().submit(run_job, job_id)
+
+
+def _update_job(job_id, run_token, fields):
+    result = bulk_jobs_collection.update_one(
+        {"_id": job_id, "run_token": run_token},
+        {"$set": dict(fields, heartbeat_at=datetime.utcnow())}
+    )
+    if result.matched_count == 0:
+        raise JobTakenOver(job_id)
+
+
+def run_job(job_id):
+    """Predict a queued job's upload, saving reviews and the result file as chunks finish"""
+    run_token = uuid.uuid4().hex
+    now = datetime.utcnow()
+
+    # Claim the job atomically so only one worker runs it; a job re-queued elsewhere while it
+    # waited in this pool now belongs to that worker
+    job = bulk_jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued", "worker": _worker_id()},
+        {
+            "$set": {"status": "running", "run_token": run_token, "worker": _worker_id(),
+                     "started_at": now, "heartbeat_at": now, "rows_processed": 0, "error": None},
+            "$inc": {"attempts": 1},
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if job is None:
+        return
+
+    clerk_user_id = job["clerk_user_id"]
+    session_id = job.get("session_id")
+    summary = SentimentSummary()
+    status, error = "failed", None
+    started = time.monotonic()
+    print(f"🚀 Running bulk job {job_id} (attempt {job['attempts']})")
+
+    try:
+        # A retried job starts over, so clear whatever the interrupted run saved
+        if session_id:
+            reset_bulk_session(clerk_user_id, session_id)
+        else:
+            session_id = create_bulk_session(clerk_user_id, job["filename"])
+            _update_job(job_id, run_token, {"session_id": session_id})
+        _delete_file(_result_file_id(job_id))
+
+        predictor, scaler, cv = get_models()
+        upload = job_files.open_download_stream(_upload_file_id(job_id))
+        chunks = iter_upload_predictions(predictor, scaler, cv, upload, job["filename"],
+                                         keep_columns=job.get("keep_columns", True))
+
+        def save_chunk(chunk):
+            if session_id:
+                save_bulk_reviews(clerk_user_id, session_id, chunk)
+
+        output_format = job.get("output_format", "csv")
+        with job_files.open_upload_stream_with_id(
+            _result_file_id(job_id), output_filename(output_format),
+            metadata={"job_id": job_id, "content_type": output_mimetype(output_format)}
+        ) as result:
+            for data in stream_predictions(chunks, summary, create_writer(output_format), on_chunk=save_chunk):
+                result.write(data)
+                _update_job(job_id, run_token, _progress(job, summary.total, started))
+
+        # A completed job means its reviews are in the database, not just queued
+        if session_id:
+            wait_for_bulk_reviews(session_id)
+        status = "completed"
+    except JobTakenOver:
+        print(f"⚠️ Bulk job {job_id} was re-claimed by another worker, abandoning this run")
+        return
+    except Exception as e:
+        error = str(e)
+        print(f"❌ Bulk job {job_id} failed: {e}")
+
+    if session_id:
+        finish_bulk_session(clerk_user_id, session_id, summary, status)
+    try:
+        _update_job(job_id, run_token, {
+            "status": status,
+            "error": error,
+            "rows_processed": summary.total,
+            "eta_seconds": 0,
+            "summary": summary.to_dict(),
+            "finished_at": datetime.utcnow(),
+        })
+        print(f"✅ Bulk job {job_id} {status}: {summary.total} rows in {time.monotonic() - started:.1f}s")
+    except JobTakenOver:
+        print(f"⚠️ Bulk job {job_id} was re-claimed by another worker before it finished")
+        return
+    try:
+        _release_files(job_id, status)
+    except Exception as e:
+        # Left for expire_finished_jobs to clean up
+        print(f"⚠️ Could not delete the files of bulk job {job_id}: {e}")
+
+
+def _progress(job, rows_processed, started):
+    elapsed = time.monotonic() - started
+    rate = rows_processed / elapsed if elapsed > 0 else 0.0
+    estimate = job.get("total_rows_estimate")
+    remaining = max(estimate - rows_processed, 0) if estimate is not None else None
+    return {
+        "rows_processed": rows_processed,
+        "rows_per_second": round(rate, 1),
+        "eta_seconds": round(remaining / rate, 1) if rate > 0 and remaining is not None else None,
+    }
+
+
+def heartbeat_jobs():
+    """Refresh the heartbeat of every queued or running job this process holds"""
+    if not JOBS_AVAILABLE:
+        return 0
+    try:
+        result = bulk_jobs_collection.update_many(
+            {"worker": _worker_id(), "status": {"$in": ["queued", "running"]}},
+            {"$set": {"heartbeat_at": datetime.utcnow()}}
+        )
+        return result.modified_count
+    except Exception as e:
+        print(f"⚠️ Error refreshing bulk job heartbeats: {e}")
+        return 0
+
+
+def recover_stale_jobs():
+    """Re-queue jobs whose worker stopped heartbeating (e.g. it was recycled or killed).
+
+    Live workers heartbeat the jobs waiting in their pool as well as the running ones, so a
+    stale queued job is one whose worker is gone or that was never handed to a pool.
+    """
+    if not JOBS_AVAILABLE:
+        return 0
+    recovered = 0
+    try:
+        while True:
+            now = datetime.utcnow()
+            job = bulk_jobs_collection.find_one_and_update(
+                {
+                    "status": {"$in": ["queued", "running"]},
+                    "heartbeat_at": {"$lt": now - timedelta(seconds=BULK_JOB_STALE_SECONDS)},
+                },
+                {"$set": {"status": "queued", "heartbeat_at": now, "run_token": None, "worker": _worker_id()}},
+                return_document=ReturnDocument.AFTER,
+            )
+            if job is None:
+                break
+
+            if job.get("attempts", 0) >= BULK_JOB_MAX_ATTEMPTS:
+                result = bulk_jobs_collection.update_one(
+                    {"_id": job["_id"], "status": "queued"},
+                    {"$set": {"status": "failed", "error": f"Gave up after {job['attempts']} attempts",
+                              "finished_at": now}}
+                )
+                if result.modified_count:
+                    _release_files(job["_id"], "failed")
+                print(f"❌ Bulk job {job['_id']} failed after {job['attempts']} attempts")
+                continue
+
+            print(f"♻️ Re-queued interrupted bulk job {job['_id']}")
+            submit_job(job["_id"])
+            recovered += 1
+    except Exception as e:
+        print(f"⚠️ Error recovering bulk jobs: {e}")
+    return recovered
+
+
+def expire_finished_jobs():
+    """Delete finished jobs older than the retention period, with their upload and result files.
+
+    Files go first, so a sweep interrupted halfway leaves a job document the next one finds
+    again rather than orphaned GridFS chunks.
+    """
+    if not JOBS_AVAILABLE:
+        return 0
+    expired = 0
+    try:
+        cutoff = datetime.utcnow() - timedelta(hours=BULK_JOB_RETENTION_HOURS)
+        finished = bulk_jobs_collection.find(
+            {"status": {"$in": list(TERMINAL_STATUSES)}, "finished_at": {"$lt": cutoff}}, {"_id": 1}
+        )
+        for job in finished:
+            _delete_file(_upload_file_id(job["_id"]))
+            _delete_file(_result_file_id(job["_id"]))
+            expired += bulk_jobs_collection.delete_one(
+                {"_id": job["_id"], "status": {"$in": list(TERMINAL_STATUSES)}}
+            ).deleted_count
+        if expired:
+            print(f"🧹 Expired {expired} finished bulk jobs")
+    except Exception as e:
+        print(f"⚠️ Error expiring bulk jobs: {e}")
+    return expired
+
+
+def start_job_recovery():
+    """Start the background thread that heartbeats this process's jobs, picks up interrupted ones
+    and expires old finished ones"""
+    global _recovery_thread
+    if not JOBS_AVAILABLE or (_recovery_thread is not None and _recovery_thread.is_alive()):
+        return
+    with _executor_lock:
+        if _recovery_thread is not None and _recovery_thread.is_alive():
+            return
+
+        def loop():
+            next_recovery = 0
+            while True:
+                heartbeat_jobs()
+                if time.monotonic() >= next_recovery:
+                    recover_stale_jobs()
+                    expire_finished_jobs()
+                    next_recovery = time.monotonic() + BULK_JOB_RECOVERY_INTERVAL
+                time.sleep(min(BULK_JOB_HEARTBEAT_INTERVAL, BULK_JOB_RECOVERY_INTERVAL))
+
+        _recovery_thread = threading.Thread(target=loop, name="bulk-job-recovery", daemon=True)
+        _recovery_thread.start()
+
+
+def get_job(clerk_user_id, job_id):
+    """Fetch a job - ONLY if it belongs to the authenticated user"""
+    return bulk_jobs_collection.find_one({"_id": job_id, "clerk_user_id": clerk_user_id})
+
+
+def open_job_result(job_id):
+    """Open the finished result file of a job for streaming"""
+    return job_files.open_download_stream(_result_file_id(job_id))
+
+
+def serialize_job(job):
+    """JSON-friendly view of a job document"""
+    job_id = job["_id"]
+    serialized = {
+        "job_id": job_id,
+        "status": job.get("status"),
+        "filename": job.get("filename"),
+        "output_format": job.get("output_format", "csv"),
+        "rows_processed": job.get("rows_processed", 0),
+        "total_rows_estimate": job.get("total_rows_estimate"),
+        "rows_per_second": job.get("rows_per_second"),
+        "eta_seconds": job.get("eta_seconds"),
+        "attempts": job.get("attempts", 0),
+        "error": job.get("error"),
+        "summary": job.get("summary"),
+        "session_id": str(job["session_id"]) if job.get("session_id") else None,
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events",
+        "result_url": f"/api/jobs/{job_id}/result",
+    }
+    for field in ("created_at", "started_at", "finished_at"):
+        if isinstance(job.get(field), datetime):
+            serialized[field] = job[field].isoformat()
+    return serialized
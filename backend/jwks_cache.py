@@ -0,0 +1,182 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+
+
+# Issuers whose tokens are accepted, comma separated (e.g. https://clerk.example.com). When unset,
+# the issuer is derived from CLERK_PUBLISHABLE_KEY; with neither, every token is rejected.
+# Signing keys are fetched from the token's issuer, so this list must never be open-ended.
+CLERK_ISSUERS = {issuer.strip().rstrip("/") for issuer in os.getenv("CLERK_ISSUERS", "").split(",") if issuer.strip()}
+CLERK_PUBLISHABLE_KEY = os.getenv("CLERK_PUBLISHABLE_KEY")
+# Signing keys are re-fetched after this long, or earlier when a token names an unknown kid
+JWKS_CACHE_TTL = int(os.getenv("JWKS_CACHE_TTL", 3600))
+# Unknown-kid refreshes per issuer are spaced at least this far apart so bogus tokens can't hammer Clerk
+JWKS_MIN_REFRESH_INTERVAL = int(os.getenv("JWKS_MIN_REFRESH_INTERVAL", 30))
+JWKS_FETCH_TIMEOUT = float(os.getenv("JWKS_FETCH_TIMEOUT", 5))
+# Verified tokens remembered until they expire
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+
+
+def publishable_key_issuer(publishable_key):
+    """Frontend API origin of a Clerk instance, encoded in its publishable key (pk_<env>_<base64 "host$">)"""
+    try:
+        encoded = publishable_key.split("_", 2)[2]
+        host = base64.b64decode(encoded + "=" * (-len(encoded) % 4)).decode().rstrip("$")
+    except (IndexError, ValueError, UnicodeDecodeError):
+        return None
+    return f"https://{host}" if host else None
+
+
+if not CLERK_ISSUERS and CLERK_PUBLISHABLE_KEY:
+    CLERK_ISSUERS = {issuer for issuer in [publishable_key_issuer(CLERK_PUBLISHABLE_KEY)] if issuer}
+if not CLERK_ISSUERS:
+    print("⚠️ Warning: Neither CLERK_ISSUERS nor CLERK_PUBLISHABLE_KEY is set; all Clerk tokens will be rejected")
+
+
+class IssuerNotAllowed(jwt.InvalidIssuerError):
+    pass
+
+
+def issuer_allowed(issuer):
+    return isinstance(issuer, str) and issuer.rstrip("/") in CLERK_ISSUERS
+
+
+class JwksCache:
+    """Signing keys per issuer, fetched from <issuer>/.well-known/jwks.json and kept for a TTL"""
+
+    def __init__(self, ttl=JWKS_CACHE_TTL, min_refresh_interval=JWKS_MIN_REFRESH_INTERVAL):
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self._issuers = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def _entry(self, issuer):
+        with self._lock:
+            return self._issuers.setdefault(issuer, {"keys": {}, "fetched_at": None, "lock": threading.Lock()})
+
+    def _refresh(self, issuer, entry):
+        response = requests.get(f"{issuer}/.well-known/jwks.json", timeout=JWKS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        jwk_set = jwt.PyJWKSet.from_dict(response.json())
+        entry["keys"] = {key.key_id: key for key in jwk_set.keys}
+        entry["fetched_at"] = time.monotonic()
+        self.refreshes += 1
+
+    def get_signing_key(self, issuer, kid):
+        """Key for kid, refreshing the issuer's key set when it is stale or doesn't know kid"""
+        if not issuer_allowed(issuer):
+            raise IssuerNotAllowed(f"Issuer not allowed: {issuer}")
+        entry = self._entry(issuer)
+        fetched_at = entry["fetched_at"]
+        if fetched_at is not None and time.monotonic() - fetched_at < self.ttl and kid in entry["keys"]:
+            self.hits += 1
+            return entry["keys"][kid]
+
+        with entry["lock"]:
+            # Another request may have refreshed while this one waited
+            fetched_at = entry["fetched_at"]
+            age = time.monotonic() - fetched_at if fetched_at is not None else None
+            stale = age is None or age >= self.ttl
+            unknown_kid = kid not in entry["keys"]
+            if stale or (unknown_kid and age >= self.min_refresh_interval):
+                try:
+                    self._refresh(issuer, entry)
+                except Exception as e:
+                    self.refresh_failures += 1
+                    if not entry["keys"]:
+                        raise
+                    # Keep serving the keys we have rather than failing every request
+                    print(f"⚠️ Could not refresh JWKS for {issuer}, using cached keys: {e}")
+            key = entry["keys"].get(kid)
+        if key is None:
+            raise jwt.InvalidKeyError(f"Unknown signing key: {kid}")
+        return key
+
+    def stats(self):
+        with self._lock:
+            issuers = len(self._issuers)
+        return {
+            "issuers": issuers,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of verification results keyed by token hash, each kept until the token's exp"""
+
+    def __init__(self, max_size=TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, expires_at, value):
+        if not expires_at:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+jwks_cache = JwksCache()
+token_cache = VerifiedTokenCache()
+
+
+def verify_token(token):
+    """Claims of a Clerk session token, verified against its issuer's cached signing keys"""
+    unverified = jwt.decode(token, options={"verify_signature": False})
+    issuer = unverified.get("iss", "")
+    signing_key = jwks_cache.get_signing_key(issuer, jwt.get_unverified_header(token).get("kid"))
+    return jwt.decode(
+        token,
+        signing_key.key,
+        algorithms=["RS256"],
+        audience=unverified.get("aud"),
+        issuer=issuer
+    )
+
+
+def auth_cache_stats():
+    return {"jwks": jwks_cache.stats(), "verified_tokens": token_cache.stats()}
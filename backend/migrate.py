@@ -0,0 +1,96 @@
+"""
+Database migrations, run once per deploy before the web workers start
+(Procfile release phase, Railway pre-deploy command, the docker-compose migrate service):
+
+    python migrate.py
+
+Workers no longer ping MongoDB or create indexes when they boot.
+"""
+
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+from database import (DATABASE_NAME, create_indexes, ping, reviews_collection,
+                      analysis_sessions_collection)
+
+BACKFILL_BATCH_SIZE = 1000
+
+# Indexes replaced by the (clerk_user_id, created_at, _id) ones keyset pagination sorts on
+SUPERSEDED_INDEXES = {
+    reviews_collection: ["clerk_user_id_1_created_at_-1"],
+    analysis_sessions_collection: ["clerk_user_id_1_created_at_-1"],
+}
+
+
+def backfill_created_at(collection, batch_size=BACKFILL_BATCH_SIZE):
+    """Give documents written before created_at existed the time their _id was generated.
+
+    Listings are paged on (created_at, _id), so every document needs a created_at to be
+    usable as a cursor. Returns the number of documents updated.
+    """
+    updated = 0
+    while True:
+        # Each pass fills in a batch, so the filter no longer matches it on the next one
+        docs = list(collection.find({"created_at": None}, {"_id": 1}).limit(batch_size))
+        if not docs:
+            return updated
+        operations = [
+            UpdateOne({"_id": doc["_id"]}, {"$set": {"created_at": _id_time(doc["_id"])}})
+            for doc in docs
+        ]
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+
+
+def _id_time(object_id):
+    # Stored like datetime.utcnow(): naive UTC
+    if isinstance(object_id, ObjectId):
+        return object_id.generation_time.replace(tzinfo=None)
+    return datetime(1970, 1, 1)
+
+
+def drop_superseded_indexes():
+    """Drop indexes a newer compound index makes redundant; returns the names dropped"""
+    dropped = []
+    for collection, names in SUPERSEDED_INDEXES.items():
+        existing = collection.index_information()
+        for name in names:
+            if name not in existing:
+                continue
+            try:
+                collection.drop_index(name)
+                dropped.append(f"{collection.name}.{name}")
+            except OperationFailure as e:
+                print(f"⚠️ Warning: Could not drop index {collection.name}.{name}: {e}")
+    return dropped
+
+
+def migrate():
+    """Check the database is reachable, create (or confirm) every index and backfill old documents; returns success"""
+    try:
+        ping()
+        print(f"✅ Connected to MongoDB: {DATABASE_NAME}")
+    except Exception as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+        return False
+    if not create_indexes():
+        return False
+
+    try:
+        for collection in (reviews_collection, analysis_sessions_collection):
+            updated = backfill_created_at(collection)
+            if updated:
+                print(f"✅ Backfilled created_at on {updated} {collection.name} documents")
+        dropped = drop_superseded_indexes()
+        if dropped:
+            print(f"✅ Dropped superseded indexes: {', '.join(dropped)}")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        return False
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if migrate() else 1)
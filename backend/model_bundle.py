@@ -0,0 +1,274 @@
+"""
+Compact model bundle: the pickled vectorizer, scaler and XGBoost model converted into plain
+arrays and XGBoost's native format, so serving doesn't unpickle (and run) sklearn objects.
+
+    python model_bundle.py export [--models-dir Models] [--bundle-dir Models/bundle]
+    python model_bundle.py verify [--models-dir Models] [--bundle-dir Models/bundle]
+
+A bundle directory holds:
+    vocabulary.npy   terms in feature order, which CountVectorizer makes alphabetical, so the
+                     array itself is the lookup table (binary search, no dict to rebuild)
+    scale.npy        MinMaxScaler scale_ as float32
+    min.npy          MinMaxScaler min_ as float32
+    model.ubj        XGBoost booster in UBJSON, split directions already prepared for CSR input
+    manifest.json    format version, library versions, sha256 of every file and of the pickles
+
+The .npy files are memory-mapped on load, so forked gunicorn workers share their pages.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+import scipy.sparse as sp
+
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+VOCABULARY_FILE = "vocabulary.npy"
+SCALE_FILE = "scale.npy"
+MIN_FILE = "min.npy"
+BOOSTER_FILE = "model.ubj"
+SOURCE_FILES = {"predictor": "model_xgb.pkl", "scaler": "scaler.pkl", "vectorizer": "countVectorizer.pkl"}
+
+# Texts run through both the pickles and the bundle after an export; predictions must agree
+VERIFY_TEXTS = [
+    "love my echo",
+    "great sound and easy to set up",
+    "stopped working after a week, very disappointed",
+    "it is ok",
+    "",
+]
+
+# CountVectorizer settings the bundled vectorizer reproduces
+_SUPPORTED_VECTORIZER = {
+    "analyzer": "word",
+    "binary": False,
+    "ngram_range": (1, 1),
+    "preprocessor": None,
+    "tokenizer": None,
+    "stop_words": None,
+    "strip_accents": None,
+}
+
+
+class BundleError(Exception):
+    pass
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BundleVectorizer:
+    """Token counts over a sorted vocabulary array, equivalent to the fitted CountVectorizer"""
+
+    def __init__(self, vocabulary, token_pattern, lowercase=True):
+        self.vocabulary = vocabulary
+        self.lowercase = lowercase
+        self._token_pattern = re.compile(token_pattern)
+
+    def transform(self, corpus):
+        """CSR matrix of term counts, one row per document"""
+        tokens = []
+        lengths = np.empty(len(corpus), dtype=np.int64)
+        for row, doc in enumerate(corpus):
+            doc_tokens = self._token_pattern.findall(doc.lower() if self.lowercase else doc)
+            tokens.extend(doc_tokens)
+            lengths[row] = len(doc_tokens)
+
+        # One binary search over the whole corpus; tokens outside the vocabulary are dropped
+        tokens = np.array(tokens, dtype=str)
+        positions = np.searchsorted(self.vocabulary, tokens)
+        positions[positions == len(self.vocabulary)] = 0
+        known = self.vocabulary[positions] == tokens if len(tokens) else np.zeros(0, dtype=bool)
+
+        rows = np.repeat(np.arange(len(corpus)), lengths)[known]
+        counts = np.ones(len(rows), dtype=np.int64)
+        # Duplicate (row, term) pairs are summed into counts by the conversion
+        return sp.coo_matrix((counts, (rows, positions[known])),
+                             shape=(len(corpus), len(self.vocabulary))).tocsr()
+
+
+class BundleScaler:
+    """The fitted MinMaxScaler parameters inference.transform_sparse reads"""
+
+    def __init__(self, scale, offset, clip=False, feature_range=(0, 1)):
+        self.scale_ = scale
+        self.min_ = offset
+        self.clip = clip
+        self.feature_range = tuple(feature_range)
+
+
+class BundlePredictor:
+    """Binary XGBoost booster with the slice of the XGBClassifier interface the app uses"""
+
+    def __init__(self, booster, sparse_ready=True):
+        self._booster = booster
+        self._sparse_ready = sparse_ready
+        self.n_jobs = None
+
+    def get_booster(self):
+        return self._booster
+
+    def set_params(self, **params):
+        if "n_jobs" in params:
+            self.n_jobs = params.pop("n_jobs")
+        if params:
+            raise ValueError(f"Unsupported parameters: {', '.join(params)}")
+        return self
+
+    def predict_proba(self, X):
+        positive = self._booster.inplace_predict(X)
+        return np.column_stack([1 - positive, positive])
+
+
+def _check_exportable(predictor, scaler, cv):
+    params = cv.get_params()
+    unsupported = [name for name, value in _SUPPORTED_VECTORIZER.items() if params.get(name) != value]
+    if unsupported:
+        raise BundleError(f"Vectorizer settings not supported by the bundle: {', '.join(unsupported)}")
+    terms = sorted(cv.vocabulary_)
+    if any(cv.vocabulary_[term] != index for index, term in enumerate(terms)):
+        raise BundleError("Vectorizer feature indices are not in alphabetical term order")
+    if predictor.get_xgb_params().get("objective") != "binary:logistic" or list(predictor.classes_) != [0, 1]:
+        raise BundleError("Only binary:logistic models with classes [0, 1] can be bundled")
+    if scaler.n_features_in_ != len(terms):
+        raise BundleError("Scaler and vectorizer disagree on the number of features")
+    return terms
+
+
+def export_bundle(models_dir, bundle_dir):
+    """Convert the pickles in models_dir into a bundle at bundle_dir; returns the manifest"""
+    import pickle
+    import sklearn
+    import xgboost
+    from inference import prepare_sparse_predictor
+
+    def load(name):
+        with open(os.path.join(models_dir, SOURCE_FILES[name]), "rb") as f:
+            return pickle.load(f)
+
+    predictor, scaler, cv = load("predictor"), load("scaler"), load("vectorizer")
+    terms = _check_exportable(predictor, scaler, cv)
+    prepare_sparse_predictor(predictor, scaler)
+
+    # Written next to the target and swapped in, so a failed export never leaves half a bundle
+    tmp_dir = f"{bundle_dir.rstrip(os.sep)}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    np.save(os.path.join(tmp_dir, VOCABULARY_FILE), np.array(terms, dtype=str))
+    np.save(os.path.join(tmp_dir, SCALE_FILE), np.asarray(scaler.scale_, dtype=np.float32))
+    np.save(os.path.join(tmp_dir, MIN_FILE), np.asarray(scaler.min_, dtype=np.float32))
+    predictor.get_booster().save_model(os.path.join(tmp_dir, BOOSTER_FILE))
+
+    files = {}
+    for filename in (VOCABULARY_FILE, SCALE_FILE, MIN_FILE, BOOSTER_FILE):
+        path = os.path.join(tmp_dir, filename)
+        files[filename] = {"sha256": _sha256(path), "bytes": os.path.getsize(path)}
+    model_version = hashlib.sha256("".join(files[name]["sha256"] for name in sorted(files)).encode()).hexdigest()[:16]
+
+    manifest = {
+        "format_version": BUNDLE_FORMAT_VERSION,
+        "model_version": model_version,
+        "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "versions": {"xgboost": xgboost.__version__, "numpy": np.__version__, "scikit-learn": sklearn.__version__},
+        "files": files,
+        "source": {filename: _sha256(os.path.join(models_dir, filename)) for filename in SOURCE_FILES.values()},
+        "vectorizer": {
+            "n_features": len(terms),
+            "lowercase": cv.lowercase,
+            "token_pattern": cv.token_pattern,
+        },
+        "scaler": {"clip": bool(scaler.clip), "feature_range": list(scaler.feature_range)},
+        "predictor": {"objective": "binary:logistic", "classes": [0, 1], "sparse_ready": True},
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(bundle_dir, ignore_errors=True)
+    os.replace(tmp_dir, bundle_dir)
+    return manifest
+
+
+def bundle_exists(bundle_dir):
+    return os.path.isfile(os.path.join(bundle_dir, MANIFEST_FILE))
+
+
+def read_manifest(bundle_dir):
+    with open(os.path.join(bundle_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != BUNDLE_FORMAT_VERSION:
+        raise BundleError(f"Unsupported bundle format {manifest.get('format_version')} in {bundle_dir}")
+    return manifest
+
+
+def load_bundle(bundle_dir, verify_checksums=True):
+    """(predictor, scaler, cv, manifest) from a bundle; raises BundleError if it is damaged"""
+    import xgboost
+
+    manifest = read_manifest(bundle_dir)
+    if verify_checksums:
+        for filename, expected in manifest["files"].items():
+            if _sha256(os.path.join(bundle_dir, filename)) != expected["sha256"]:
+                raise BundleError(f"Checksum mismatch for {filename} in {bundle_dir}")
+
+    def array(filename):
+        return np.load(os.path.join(bundle_dir, filename), mmap_mode="r", allow_pickle=False)
+
+    vectorizer = manifest["vectorizer"]
+    cv = BundleVectorizer(array(VOCABULARY_FILE), vectorizer["token_pattern"], vectorizer["lowercase"])
+    scaler = BundleScaler(array(SCALE_FILE), array(MIN_FILE), **manifest["scaler"])
+    booster = xgboost.Booster(model_file=os.path.join(bundle_dir, BOOSTER_FILE))
+    predictor = BundlePredictor(booster, sparse_ready=manifest["predictor"]["sparse_ready"])
+    if len(cv.vocabulary) != vectorizer["n_features"] or booster.num_features() != vectorizer["n_features"]:
+        raise BundleError(f"Feature count mismatch in {bundle_dir}")
+    return predictor, scaler, cv, manifest
+
+
+def verify_bundle(models_dir, bundle_dir, texts=VERIFY_TEXTS):
+    """Compare bundle predictions with the pickles'; returns the largest probability difference"""
+    import pickle
+    from inference import sparse_predict_proba
+    from text_processing import normalize_text
+
+    def load(name):
+        with open(os.path.join(models_dir, SOURCE_FILES[name]), "rb") as f:
+            return pickle.load(f)
+
+    corpus = [normalize_text(text) for text in texts]
+    expected = sparse_predict_proba(load("predictor"), load("scaler"), load("vectorizer"), corpus)
+    predictor, scaler, cv, _ = load_bundle(bundle_dir)
+    actual = sparse_predict_proba(predictor, scaler, cv, corpus)
+    if not np.array_equal(expected.argmax(axis=1), actual.argmax(axis=1)):
+        raise BundleError("Bundle predictions differ from the pickled models")
+    return float(np.abs(expected - actual).max())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=("export", "verify"))
+    parser.add_argument("--models-dir", default=os.getenv("MODELS_DIR", "Models"), help="directory of the .pkl files")
+    parser.add_argument("--bundle-dir", help="bundle directory (default: <models-dir>/bundle)")
+    args = parser.parse_args()
+    bundle_dir = args.bundle_dir or os.path.join(args.models_dir, "bundle")
+
+    if args.command == "export":
+        manifest = export_bundle(args.models_dir, bundle_dir)
+        size = sum(entry["bytes"] for entry in manifest["files"].values())
+        print(f"✅ Exported bundle {manifest['model_version']} to {bundle_dir} ({size / 1024:.0f} KB)")
+
+    max_diff = verify_bundle(args.models_dir, bundle_dir)
+    start = time.perf_counter()
+    load_bundle(bundle_dir)
+    print(f"✅ Bundle matches the pickled models (max probability difference {max_diff:.2e}), "
+          f"loads in {(time.perf_counter() - start) * 1000:.1f} ms")
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+from inference import prepare_sparse_predictor, sparse_predict_proba
+from model_bundle import BundleError, bundle_exists, load_bundle, read_manifest
+
+# Directory holding the pickled model artifacts
+MODELS_DIR = os.getenv("MODELS_DIR", "Models")
+# Bundle exported from the pickles by model_bundle.py; preferred over them when present and current
+MODEL_BUNDLE_DIR = os.getenv("MODEL_BUNDLE_DIR", os.path.join(MODELS_DIR, "bundle"))
+# OpenMP threads per XGBoost prediction; 0 leaves XGBoost's default of every core
+XGBOOST_NTHREAD = int(os.getenv("XGBOOST_NTHREAD", 0))
+
+# Process-level model holder, shared by every thread of a gunicorn worker
+_models = None
+_models_lock = threading.Lock()
+_load_error = None
+_loaded_at = None
+_load_seconds = None
+_model_version = None
+_model_format = None
+
+WARMUP_TEXT = "Warm up the sentiment pipeline"
+
+
+MODEL_FILES = ("model_xgb.pkl", "scaler.pkl", "countVectorizer.pkl")
+
+
+def _load_pickle(filename):
+    with open(os.path.join(MODELS_DIR, filename), "rb") as f:
+        return pickle.load(f)
+
+
+def _compute_model_version():
+    """Short content hash of the model artifacts, used to key cached predictions"""
+    digest = hashlib.sha256()
+    for filename in MODEL_FILES:
+        with open(os.path.join(MODELS_DIR, filename), "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+def _bundle_is_current():
+    """Whether the bundle was exported from the pickles now in MODELS_DIR (if they are there at all)"""
+    sources = read_manifest(MODEL_BUNDLE_DIR)["source"]
+    for filename, checksum in sources.items():
+        path = os.path.join(MODELS_DIR, filename)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                if hashlib.sha256(f.read()).hexdigest() != checksum:
+                    return False
+    return True
+
+
+def _load_artifacts():
+    """(predictor, scaler, cv, version, format) from the bundle, or from the pickles without one"""
+    if bundle_exists(MODEL_BUNDLE_DIR):
+        try:
+            if _bundle_is_current():
+                predictor, scaler, cv, manifest = load_bundle(MODEL_BUNDLE_DIR)
+                return predictor, scaler, cv, manifest["model_version"], "bundle"
+            print(f"⚠️ Model bundle in {MODEL_BUNDLE_DIR} was not exported from the current pickles; "
+                  f"run python model_bundle.py export. Loading the pickles.")
+        except (BundleError, OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Could not load model bundle, loading the pickles: {e}")
+
+    predictor = _load_pickle("model_xgb.pkl")
+    scaler = _load_pickle("scaler.pkl")
+    cv = _load_pickle("countVectorizer.pkl")
+    return predictor, scaler, cv, _compute_model_version(), "pickle"
+
+
+def _set_nthread(predictor, nthread):
+    if nthread > 0:
+        predictor.set_params(n_jobs=nthread)
+        predictor.get_booster().set_param("nthread", nthread)
+
+
+def load_models():
+    """Load the predictor, scaler and vectorizer once per process and warm them up"""
+    global _models, _load_error, _loaded_at, _load_seconds, _model_version, _model_format
+
+    if _models is not None:
+        return _models
+
+    with _models_lock:
+        # Another thread may have finished loading while we waited for the lock
+        if _models is not None:
+            return _models
+
+        try:
+            start = time.perf_counter()
+            predictor, scaler, cv, version, model_format = _load_artifacts()
+            _set_nthread(predictor, XGBOOST_NTHREAD)
+
+            # Rewrite split default directions once so CSR input matches the dense pipeline
+            # (a no-op for bundles, which are exported already prepared)
+            prepare_sparse_predictor(predictor, scaler)
+
+            # Run one dummy prediction so the first real request doesn't pay for lazy initialization
+            sparse_predict_proba(predictor, scaler, cv, [WARMUP_TEXT])
+
+            _model_version = version
+            _model_format = model_format
+            _models = (predictor, scaler, cv)
+            _load_error = None
+            _loaded_at = time.time()
+            _load_seconds = time.perf_counter() - start
+            print(f"✅ Models loaded from {model_format} and warmed up in {_load_seconds:.2f}s")
+        except Exception as e:
+            _load_error = str(e)
+            print(f"❌ Error loading models: {e}")
+            raise
+
+    return _models
+
+
+def set_inference_threads(nthread):
+    """Resize XGBoost's thread pool, e.g. in a worker forked from a master that warmed up single-threaded"""
+    if _models is not None:
+        _set_nthread(_models[0], nthread)
+
+
+def get_models():
+    """Return (predictor, scaler, cv), loading them on first use"""
+    if _models is not None:
+        return _models
+    return load_models()
+
+
+def model_version():
+    """Version stamp of the loaded model artifacts"""
+    if _model_version is None:
+        load_models()
+    return _model_version
+
+
+def models_loaded():
+    """Whether the model artifacts are loaded in this process"""
+    return _models is not None
+
+
+def model_status():
+    """Readiness details for the model holder"""
+    return {
+        "models_loaded": _models is not None,
+        "loaded_at": _loaded_at,
+        "load_seconds": _load_seconds,
+        "model_version": _model_version,
+        "model_format": _model_format,
+        "error": _load_error,
+    }
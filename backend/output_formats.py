@@ -0,0 +1,221 @@
+import zlib
+from abc import ABC, abstractmethod
+
+# Bulk prediction output formats: name -> (mimetype, download filename)
+OUTPUT_FORMATS = {
+    "csv": ("text/csv", "Predictions.csv"),
+    "csv.gz": ("application/gzip", "Predictions.csv.gz"),
+    "ndjson": ("application/x-ndjson", "Predictions.ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "Predictions.parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "Predictions.arrows"),
+}
+
+# Alternative spellings accepted in ?format=
+FORMAT_ALIASES = {
+    "gzip": "csv.gz",
+    "csv+gzip": "csv.gz",
+    "gz": "csv.gz",
+    "jsonl": "ndjson",
+    "json-lines": "ndjson",
+    "pq": "parquet",
+    "ipc": "arrow",
+    "arrows": "arrow",
+}
+
+# Accept header media types, in order of preference when the client accepts anything
+ACCEPT_MIME_TYPES = {
+    "text/csv": "csv",
+    "application/gzip": "csv.gz",
+    "application/x-ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/vnd.apache.arrow.stream": "arrow",
+}
+
+# Compression level for csv.gz; 6 is gzip's own default
+CSV_GZIP_LEVEL = 6
+
+# Columns the prediction step adds as numbers; every other column is written as text in
+# Parquet/Arrow, since upload columns are inferred per chunk and may change type mid-file
+NUMERIC_OUTPUT_COLUMNS = ("confidence",)
+
+
+def negotiate_output_format(format_param, accept_mimetypes=None):
+    """Pick an output format from ?format= (wins) or a werkzeug Accept header.
+
+    Returns None when the client explicitly asked for a format we don't produce.
+    """
+    if format_param:
+        name = format_param.strip().lower()
+        name = FORMAT_ALIASES.get(name, name)
+        return name if name in OUTPUT_FORMATS else None
+    if not accept_mimetypes:
+        return "csv"
+    best = accept_mimetypes.best_match(list(ACCEPT_MIME_TYPES))
+    # Browsers send text/html,...;*/* - anything we don't recognise keeps the CSV default
+    return ACCEPT_MIME_TYPES.get(best, "csv")
+
+
+class CsvWriter:
+    """Prediction chunks as CSV with a single header row"""
+
+    def __init__(self):
+        self._header = True
+
+    def write(self, chunk):
+        data = chunk.to_csv(index=False, header=self._header).encode("utf-8")
+        self._header = False
+        return data
+
+    def close(self):
+        return b""
+
+
+class GzipCsvWriter(CsvWriter):
+    """CSV compressed into one gzip member as chunks arrive"""
+
+    def __init__(self, level=CSV_GZIP_LEVEL):
+        super().__init__()
+        # wbits=31 writes a gzip header and trailer rather than a raw zlib stream
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def write(self, chunk):
+        return self._compressor.compress(super().write(chunk))
+
+    def close(self):
+        return self._compressor.flush()
+
+
+class NdjsonWriter:
+    """One JSON object per row"""
+
+    def write(self, chunk):
+        if chunk.empty:
+            return b""
+        data = chunk.to_json(orient="records", lines=True, force_ascii=False)
+        if not data.endswith("\n"):
+            data += "\n"
+        return data.encode("utf-8")
+
+    def close(self):
+        return b""
+
+
+class _DrainableSink:
+    """Write-only file object whose buffered bytes can be taken out as they are produced.
+
+    Parquet records absolute offsets in its footer, so tell() keeps counting across drains.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+class _ArrowWriter(ABC):
+    """Shared logic for the pyarrow based formats; see NUMERIC_OUTPUT_COLUMNS for the schema"""
+
+    def __init__(self):
+        # Imported here so CSV-only deployments don't need pyarrow
+        import pyarrow
+        self._pa = pyarrow
+        self._sink = _DrainableSink()
+        self._schema = None
+        self._writer = None
+
+    @abstractmethod
+    def _open(self, sink, schema):
+        """Format writer for the sink, with write_table() and close()"""
+
+    def _table(self, chunk):
+        text_columns = [column for column in chunk.columns if column not in NUMERIC_OUTPUT_COLUMNS]
+        if self._schema is None:
+            self._schema = self._pa.schema([
+                (str(column), self._pa.string() if column in text_columns else self._pa.float64())
+                for column in chunk.columns
+            ])
+            self._writer = self._open(self._sink, self._schema)
+        # The "string" dtype keeps missing values as nulls rather than "nan"
+        frame = chunk.astype({column: "string" for column in text_columns})
+        return self._pa.Table.from_pandas(frame, schema=self._schema, preserve_index=False)
+
+    def write(self, chunk):
+        table = self._table(chunk)
+        self._writer.write_table(table)
+        return self._sink.drain()
+
+    def close(self):
+        if self._writer is None:
+            return b""
+        self._writer.close()
+        return self._sink.drain()
+
+
+class ParquetWriter(_ArrowWriter):
+    """Parquet file with one row group per chunk"""
+
+    def _open(self, sink, schema):
+        import pyarrow.parquet
+        return pyarrow.parquet.ParquetWriter(sink, schema, compression="snappy")
+
+
+class ArrowStreamWriter(_ArrowWriter):
+    """Arrow IPC stream with one record batch per chunk"""
+
+    def _open(self, sink, schema):
+        return self._pa.ipc.new_stream(sink, schema)
+
+
+_WRITERS = {
+    "csv": CsvWriter,
+    "csv.gz": GzipCsvWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter,
+    "arrow": ArrowStreamWriter,
+}
+
+
+def format_available(output_format):
+    """False for the pyarrow based formats when pyarrow isn't installed"""
+    if output_format not in ("parquet", "arrow"):
+        return True
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def create_writer(output_format):
+    """Incremental writer for an output format: write(chunk) and close() both return bytes"""
+    return _WRITERS[output_format]()
+
+
+def output_mimetype(output_format):
+    return OUTPUT_FORMATS[output_format][0]
+
+
+def output_filename(output_format):
+    return OUTPUT_FORMATS[output_format][1]
@@ -0,0 +1,58 @@
+import base64
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+# Page size for listings when ?limit is not given, and the most a client can ask for
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", 50))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", 200))
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def page_size(limit):
+    """Requested page size clamped to 1..PAGE_SIZE_MAX"""
+    if limit is None:
+        limit = PAGE_SIZE_DEFAULT
+    return max(1, min(int(limit), PAGE_SIZE_MAX))
+
+
+def encode_cursor(doc):
+    """Opaque cursor pointing just past doc in (created_at, _id) descending order"""
+    millis = (doc["created_at"] - _EPOCH) // _MILLISECOND
+    return base64.urlsafe_b64encode(f"{millis}.{doc['_id']}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(created_at, _id) encoded in a cursor; raises ValueError for anything malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        millis, object_id = raw.split(".")
+        return _EPOCH + int(millis) * _MILLISECOND, ObjectId(object_id)
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
+
+def keyset_page(collection, query, projection, cursor=None, limit=None):
+    """One page of documents matching query, newest first, and the cursor of the next page.
+
+    Pages are keyed on (created_at, _id) rather than skipped over, so with an index on
+    (clerk_user_id, created_at, _id) every page costs the same however deep it is. The
+    next cursor is None on the last page.
+    """
+    limit = page_size(limit)
+    if cursor:
+        created_at, object_id = decode_cursor(cursor)
+        query = dict(query, **{"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": object_id}},
+        ]})
+
+    # One extra document tells whether another page follows
+    docs = list(collection.find(query, dict(projection, created_at=1))
+                .sort([("created_at", -1), ("_id", -1)])
+                .limit(limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return docs[:limit], next_cursor
@@ -0,0 +1,250 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Backend: "memory" (per-process LRU), "disk" (SQLite file shared by all workers), "redis" or "off"
+PREDICTION_CACHE_BACKEND = os.getenv("PREDICTION_CACHE", "memory").lower()
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", 100000))
+PREDICTION_CACHE_TTL = int(os.getenv("PREDICTION_CACHE_TTL", 86400))
+PREDICTION_CACHE_PATH = os.getenv("PREDICTION_CACHE_PATH", "/tmp/prediction_cache.sqlite3")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Seconds to wait for Redis to connect or answer before treating the lookup as a miss; a slow
+# cache must not cost more than running the model
+PREDICTION_CACHE_REDIS_TIMEOUT = float(os.getenv("PREDICTION_CACHE_REDIS_TIMEOUT", 0.1))
+
+
+def cache_key(model_version, normalized_text):
+    """Cache key for a preprocessed token string under a given model version"""
+    return hashlib.sha1(f"{model_version}\0{normalized_text}".encode("utf-8")).hexdigest()
+
+
+class MemoryCacheBackend:
+    """In-process LRU with TTL"""
+
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                value, expires_at = entry
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = value
+        return found
+
+    def set_many(self, values):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (value, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskCacheBackend:
+    """SQLite file cache shared by every gunicorn worker on the host"""
+
+    def __init__(self, path=PREDICTION_CACHE_PATH, max_size=PREDICTION_CACHE_SIZE, ttl=PREDICTION_CACHE_TTL):
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local = threading.local()
+        # Connections are per thread, but the trim counter is shared by all of them
+        self._trim_lock = threading.Lock()
+        self._writes_since_trim = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, sentiment TEXT, confidence REAL, expires_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_expires_at ON predictions (expires_at)")
+        conn.commit()
+
+    def _connection(self):
+        # SQLite connections can't be shared between threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        conn = self._connection()
+        now = time.time()
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = conn.execute(
+                f"SELECT key, sentiment, confidence FROM predictions WHERE key IN ({placeholders}) AND expires_at >= ?",
+                (*batch, now),
+            )
+            for key, sentiment, confidence in rows:
+                found[key] = (sentiment, confidence)
+        return found
+
+    def set_many(self, values):
+        if not values:
+            return
+        expires_at = time.time() + self.ttl
+        conn = self._connection()
+        conn.executemany(
+            "INSERT OR REPLACE INTO predictions (key, sentiment, confidence, expires_at) VALUES (?, ?, ?, ?)",
+            [(key, sentiment, confidence, expires_at) for key, (sentiment, confidence) in values.items()],
+        )
+        conn.commit()
+
+        # Trim occasionally rather than on every write
+        with self._trim_lock:
+            self._writes_since_trim += len(values)
+            trim = self._writes_since_trim >= max(1, self.max_size // 10)
+            if trim:
+                self._writes_since_trim = 0
+        if trim:
+            self._trim(conn)
+
+    def _trim(self, conn):
+        conn.execute("DELETE FROM predictions WHERE expires_at < ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM predictions WHERE key IN ("
+            "SELECT key FROM predictions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+        conn.commit()
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class RedisCacheBackend:
+    """Redis (or any Redis-compatible server) cache; eviction beyond the TTL is left to the server"""
+
+    def __init__(self, url=REDIS_URL, ttl=PREDICTION_CACHE_TTL, timeout=PREDICTION_CACHE_REDIS_TIMEOUT):
+        import redis
+        self.ttl = ttl
+        # Timeouts raise, and PredictionCache counts them as errors and misses
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        if not keys:
+            return found
+        for key, value in zip(keys, self._client.mget([f"pred:{key}" for key in keys])):
+            if value is not None:
+                sentiment, confidence = value.decode("utf-8").split("|", 1)
+                found[key] = (sentiment, float(confidence))
+        return found
+
+    def set_many(self, values):
+        pipe = self._client.pipeline(transaction=False)
+        for key, (sentiment, confidence) in values.items():
+            pipe.set(f"pred:{key}", f"{sentiment}|{confidence!r}", ex=self.ttl)
+        pipe.execute()
+
+    def __len__(self):
+        return -1
+
+
+class PredictionCache:
+    """Prediction/confidence cache keyed on normalized review text and model version"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get_many(self, model_version, normalized_texts):
+        """Return {normalized_text: (sentiment, confidence)} for the cached texts"""
+        keys = {cache_key(model_version, text): text for text in normalized_texts}
+        try:
+            found = self.backend.get_many(keys.keys())
+        except Exception as e:
+            print(f"⚠️ Prediction cache read failed: {e}")
+            found = {}
+            with self._lock:
+                self.errors += 1
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return {keys[key]: value for key, value in found.items()}
+
+    def set_many(self, model_version, predictions):
+        """Store {normalized_text: (sentiment, confidence)}"""
+        try:
+            self.backend.set_many({
+                cache_key(model_version, text): (str(sentiment), float(confidence))
+                for text, (sentiment, confidence) in predictions.items()
+            })
+        except Exception as e:
+            print(f"⚠️ Prediction cache write failed: {e}")
+            with self._lock:
+                self.errors += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            size = len(self.backend)
+        except Exception:
+            size = None
+        return {
+            "enabled": True,
+            "backend": type(self.backend).__name__,
+            "size": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _create_backend(name):
+    if name == "disk":
+        return DiskCacheBackend()
+    if name == "redis":
+        try:
+            return RedisCacheBackend()
+        except ImportError:
+            print("⚠️ PREDICTION_CACHE=redis but the redis package is not installed (pip install -r requirements.txt); "
+                  "falling back to the in-process prediction cache")
+    return MemoryCacheBackend()
+
+
+def get_prediction_cache():
+    """Process-wide prediction cache, or None when PREDICTION_CACHE=off"""
+    global _cache
+    if PREDICTION_CACHE_BACKEND in ("off", "none", "false", "0"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = PredictionCache(_create_backend(PREDICTION_CACHE_BACKEND))
+    return _cache
@@ -0,0 +1,100 @@
+"""
+Startup-time benchmark: how long a fresh worker takes to import the app, load the models
+and serve its first prediction. Each run is a new interpreter; the median of the runs is
+checked against a budget and the script exits 1 when startup has regressed past it, or
+when importing the app (with model loading stubbed out) eagerly imports pandas or matplotlib.
+
+    python startup_benchmark.py [--runs 5] [--import-budget 2.0] [--boot-budget 4.0]
+
+MongoDB does not need to be running: importing the app never waits on the database.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Seconds; generous enough for a slow CI machine, tight enough to catch an eager heavy import
+STARTUP_IMPORT_BUDGET_S = float(os.getenv("STARTUP_IMPORT_BUDGET_S", 2.0))
+STARTUP_BOOT_BUDGET_S = float(os.getenv("STARTUP_BOOT_BUDGET_S", 4.0))
+
+_RUN = """
+import json, time
+start = time.perf_counter()
+import api
+imported = time.perf_counter()
+from model_loader import get_models, model_status
+from bulk import predict_texts
+predict_texts(*get_models(), ["The first review after boot"])
+done = time.perf_counter()
+models = model_status()["load_seconds"] or 0.0
+print(json.dumps({
+    "import_s": imported - start - models,
+    "models_s": models,
+    "first_prediction_s": done - imported,
+    "boot_s": done - start,
+}))
+"""
+
+# Modules the app must import only where they are used; model loading imports pandas on its own,
+# so it is stubbed out while checking
+LAZY_MODULES = ("pandas", "matplotlib")
+
+_IMPORTS = """
+import json, sys
+import model_loader
+model_loader.load_models = lambda: None
+import api
+print(json.dumps(sorted(name for name in sys.modules if name.split(".")[0] in %r)))
+""" % (LAZY_MODULES,)
+
+
+def _run(code):
+    # Measure the lazy imports on the first prediction rather than racing the preload thread
+    env = dict(os.environ, PRELOAD_IMPORTS="false")
+    result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, timeout=300)
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def eager_imports():
+    """Top-level LAZY_MODULES that a fresh interpreter has loaded after import api"""
+    return sorted({name.split(".")[0] for name in _run(_IMPORTS)})
+
+
+def run_once():
+    return _run(_RUN)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=STARTUP_IMPORT_BUDGET_S,
+                        help="max median seconds to import the app, excluding model loading")
+    parser.add_argument("--boot-budget", type=float, default=STARTUP_BOOT_BUDGET_S,
+                        help="max median seconds from interpreter start to the first prediction")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    medians = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    for key, value in medians.items():
+        print(f"{key:>20}: {value:.3f}s")
+
+    failures = [f"import api imported {module} eagerly" for module in eager_imports()]
+    if medians["import_s"] > args.import_budget:
+        failures.append(f"import took {medians['import_s']:.2f}s (budget {args.import_budget:.2f}s)")
+    if medians["boot_s"] > args.boot_budget:
+        failures.append(f"boot took {medians['boot_s']:.2f}s (budget {args.boot_budget:.2f}s)")
+    for failure in failures:
+        print(f"❌ Startup regression: {failure}")
+    if not failures:
+        print("✅ Startup within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
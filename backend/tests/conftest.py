@@ -0,0 +1,79 @@
+"""
+Shared test setup: the backend modules are imported from the parent directory, and the
+database module is replaced by one backed by mongomock so no MongoDB server is needed.
+"""
+
+import os
+import sys
+import types
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("MODELS_DIR", os.path.join(BACKEND_DIR, "Models"))
+
+import mongomock  # noqa: E402
+import mongomock.collection  # noqa: E402
+import mongomock.gridfs  # noqa: E402
+
+mongomock.gridfs.enable_gridfs_integration()
+# pymongo's GridFSBucket reads db.timeout, which mongomock would resolve to a collection
+mongomock.database.Database.timeout = None
+
+
+def _drop_sort(method):
+    # mongomock's bulk builder predates the sort option newer pymongo passes to every operation
+    def wrapper(self, *args, **kwargs):
+        kwargs.pop("sort", None)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+for _name in ("add_update", "add_replace", "add_delete"):
+    setattr(mongomock.collection.BulkOperationBuilder, _name,
+            _drop_sort(getattr(mongomock.collection.BulkOperationBuilder, _name)))
+
+client = mongomock.MongoClient()
+db = client["synapse_sentiment_test"]
+
+database = types.ModuleType("database")
+database.DATABASE_NAME = db.name
+database.client = client
+database.db = db
+database.users_collection = db.users
+database.reviews_collection = db.reviews
+database.analysis_sessions_collection = db.analysis_sessions
+database.user_preferences_collection = db.user_preferences
+database.bulk_jobs_collection = db.bulk_jobs
+database.ping = lambda: None
+database.create_indexes = lambda: True
+sys.modules["database"] = database
+
+
+@pytest.fixture
+def mongo_db():
+    """The mongomock database behind the database module, emptied after each test"""
+    yield db
+    for name in db.list_collection_names():
+        db.drop_collection(name)
+
+
+@pytest.fixture
+def api_client(monkeypatch, mongo_db):
+    """Flask test client of the API; "Authorization: Bearer <user id>" signs in as that user"""
+    import api
+    import auth
+
+    def verify(auth_header):
+        user_id = auth_header.split(" ", 1)[-1]
+        return user_id, f"{user_id}@example.com", user_id
+
+    monkeypatch.setattr(auth, "verify_clerk_token", verify)
+    monkeypatch.setattr(api, "get_or_create_user", lambda clerk_user_id, email=None, name=None: {})
+    return api.app.test_client()
+
+
+def as_user(clerk_user_id):
+    """Request headers that authenticate as clerk_user_id against api_client"""
+    return {"Authorization": f"Bearer {clerk_user_id}"}
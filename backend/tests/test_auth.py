@@ -0,0 +1,126 @@
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+import auth
+import jwks_cache
+
+ISSUER = "https://clerk.example.com"
+
+
+class FakeClerk:
+    """Serves a JWKS document in place of requests.get and signs tokens with its key"""
+
+    def __init__(self):
+        self.key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.kid = "key-1"
+        self.fetches = 0
+        self.down = False
+
+    def get(self, url, timeout=None):
+        assert url == f"{ISSUER}/.well-known/jwks.json"
+        self.fetches += 1
+        if self.down:
+            raise ConnectionError("clerk is unreachable")
+        return self
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        jwk = jwt.algorithms.RSAAlgorithm.to_jwk(self.key.public_key(), as_dict=True)
+        return {"keys": [dict(jwk, kid=self.kid, use="sig", alg="RS256")]}
+
+    def token(self, sub="user_a", issuer=ISSUER, kid=None, **claims):
+        payload = dict({"sub": sub, "iss": issuer, "exp": int(time.time()) + 60,
+                        "email": f"{sub}@example.com", "first_name": "Ada"}, **claims)
+        return jwt.encode(payload, self.key, algorithm="RS256", headers={"kid": kid or self.kid})
+
+
+@pytest.fixture
+def clerk(monkeypatch):
+    fake = FakeClerk()
+    monkeypatch.setattr(jwks_cache.requests, "get", fake.get)
+    monkeypatch.setattr(jwks_cache, "CLERK_ISSUERS", {ISSUER})
+    monkeypatch.setattr(jwks_cache, "jwks_cache", jwks_cache.JwksCache(ttl=3600, min_refresh_interval=30))
+    monkeypatch.setattr(jwks_cache, "token_cache", jwks_cache.VerifiedTokenCache())
+    monkeypatch.setattr(auth, "CLERK_SECRET_KEY", "sk_test_real")
+    monkeypatch.setattr(auth, "AUTH_DEV_MODE", False)
+    return fake
+
+
+def test_valid_token_is_verified_with_one_key_fetch(clerk):
+    for sub in ("user_a", "user_b", "user_c"):
+        assert auth.verify_clerk_token(f"Bearer {clerk.token(sub)}") == (sub, f"{sub}@example.com", "Ada")
+
+    assert clerk.fetches == 1
+    assert jwks_cache.jwks_cache.stats()["hits"] == 2
+
+
+def test_repeated_token_is_served_from_the_token_cache(clerk, monkeypatch):
+    token = clerk.token()
+    auth.verify_clerk_token(token)
+    monkeypatch.setattr(jwks_cache, "verify_token", pytest.fail)
+
+    assert auth.verify_clerk_token(token)[0] == "user_a"
+    assert jwks_cache.token_cache.stats()["hits"] == 1
+
+
+def test_expired_token_is_rejected(clerk):
+    assert auth.verify_clerk_token(clerk.token(exp=int(time.time()) - 10)) == (None, None, None)
+
+
+def test_token_from_another_issuer_is_rejected_without_a_fetch(clerk):
+    assert auth.verify_clerk_token(clerk.token(issuer="https://evil.example.com")) == (None, None, None)
+    assert clerk.fetches == 0
+
+
+def test_unknown_kids_refresh_the_keys_at_most_once_per_interval(clerk):
+    auth.verify_clerk_token(clerk.token())
+    jwks_cache.jwks_cache._issuers[ISSUER]["fetched_at"] -= 60
+
+    for i in range(5):
+        assert auth.verify_clerk_token(clerk.token(kid=f"bogus-{i}")) == (None, None, None)
+
+    assert clerk.fetches == 2
+
+
+def test_cached_keys_are_used_while_clerk_is_down(clerk):
+    auth.verify_clerk_token(clerk.token())
+    jwks_cache.jwks_cache._issuers[ISSUER]["fetched_at"] -= 7200
+    clerk.down = True
+
+    assert auth.verify_clerk_token(clerk.token("user_b"))[0] == "user_b"
+    assert jwks_cache.jwks_cache.stats()["refresh_failures"] == 1
+
+
+def test_unreachable_clerk_without_cached_keys_is_unavailable(clerk):
+    clerk.down = True
+
+    with pytest.raises(auth.AuthUnavailable):
+        auth.verify_clerk_token(clerk.token())
+
+
+def test_without_a_secret_key_tokens_are_rejected_unless_in_dev_mode(clerk, monkeypatch):
+    monkeypatch.setattr(auth, "CLERK_SECRET_KEY", None)
+    token = clerk.token()
+
+    assert auth.verify_clerk_token(token) == (None, None, None)
+
+    monkeypatch.setattr(auth, "AUTH_DEV_MODE", True)
+    clerk_user_id, email, name = auth.verify_clerk_token(token)
+    assert clerk_user_id.startswith("dev_user_")
+    assert email == "user_a@example.com"
+    assert clerk.fetches == 0
+
+
+def test_require_auth_answers_503_while_keys_cannot_be_fetched(clerk):
+    import api
+
+    clerk.down = True
+    response = api.app.test_client().get("/api/stats", headers={"Authorization": f"Bearer {clerk.token()}"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(auth.AUTH_RETRY_AFTER)
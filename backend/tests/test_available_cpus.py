@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import text_processing
+
+
+@pytest.fixture
+def cpu_max(monkeypatch, tmp_path):
+    """Point available_cpus at a fake cgroup cpu.max file with 8 cores of affinity"""
+    path = tmp_path / "cpu.max"
+    monkeypatch.setattr(text_processing, "CGROUP_CPU_MAX", str(path))
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    return path
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("max 100000\n", 8),
+    ("200000 100000\n", 2),
+    ("50000 100000\n", 1),
+    ("1600000 100000\n", 8),
+    ("garbage\n", 8),
+])
+def test_cgroup_quota_caps_the_affinity(cpu_max, content, expected):
+    cpu_max.write_text(content)
+    assert text_processing.available_cpus() == expected
+
+
+def test_no_cgroup_file_uses_the_affinity(cpu_max):
+    assert text_processing.available_cpus() == 8
+
+
+def test_gunicorn_defaults_to_a_capped_worker_count(monkeypatch):
+    import gc
+    import importlib
+
+    monkeypatch.setattr(text_processing, "available_cpus", lambda: 64)
+    # The config writes to the environment; keep that to this test
+    environ = {name: value for name, value in os.environ.items()
+               if name not in ("WEB_CONCURRENCY", "GUNICORN_MAX_WORKERS", "PRELOAD_APP", "XGBOOST_NTHREAD",
+                               "PREPROCESS_WORKERS")}
+    monkeypatch.setattr(os, "environ", dict(environ, GUNICORN_PRELOAD="true"))
+    try:
+        config = importlib.import_module("gunicorn_config")
+        config = importlib.reload(config)
+    finally:
+        gc.enable()
+
+    assert config.workers == 4
+    assert config.cores_per_worker == 16
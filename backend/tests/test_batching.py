@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from batching import MicroBatcher
+
+
+def _scored(texts):
+    return ["Positive" if "good" in text else "Negative" for text in texts], [len(text) / 100 for text in texts]
+
+
+def _submit_concurrently(batcher, texts):
+    barrier = threading.Barrier(len(texts))
+    results = [None] * len(texts)
+
+    def submit(i):
+        barrier.wait()
+        results[i] = batcher.submit(texts[i])
+
+    threads = [threading.Thread(target=submit, args=(i,)) for i in range(len(texts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_each_caller_gets_its_own_result():
+    batcher = MicroBatcher(_scored, window_ms=20)
+    texts = [f"{'good' if i % 2 else 'bad'} review {i}" for i in range(16)]
+
+    results = _submit_concurrently(batcher, texts)
+
+    assert results == [(sentiment, confidence) for sentiment, confidence in zip(*_scored(texts))]
+
+
+def test_concurrent_requests_are_coalesced_up_to_the_max_size():
+    calls = []
+
+    def predict(texts):
+        calls.append(len(texts))
+        return _scored(texts)
+
+    batcher = MicroBatcher(predict, window_ms=200, max_batch_size=5)
+    _submit_concurrently(batcher, [f"review {i}" for i in range(12)])
+
+    assert sum(calls) == 12
+    assert max(calls) <= 5
+    assert len(calls) < 12
+    stats = batcher.stats()
+    assert stats["items"] == 12
+    assert stats["batches"] == len(calls)
+
+
+def test_a_failed_batch_raises_in_every_caller():
+    def broken(texts):
+        raise RuntimeError("model exploded")
+
+    batcher = MicroBatcher(broken, window_ms=1)
+
+    with pytest.raises(RuntimeError, match="exploded"):
+        batcher.submit("a review")
+    # The scheduler survives and keeps serving
+    batcher.predict_fn = _scored
+    assert batcher.submit("good") == ("Positive", 0.04)
+
+
+def test_submit_times_out_when_nothing_answers():
+    ready = threading.Event()
+
+    def stuck(texts):
+        ready.wait(5)
+        return _scored(texts)
+
+    batcher = MicroBatcher(stuck, window_ms=1)
+    try:
+        with pytest.raises(TimeoutError):
+            batcher.submit("a review", timeout=0.05)
+    finally:
+        ready.set()
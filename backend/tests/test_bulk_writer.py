@@ -0,0 +1,110 @@
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+import bulk_writer
+import user_stats
+from bulk_storage import save_bulk_reviews
+from bulk_writer import BulkWriter
+
+
+class FlakyCollection:
+    """A collection whose first insert_many calls land half the batch and then drop the connection"""
+
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.failures = failures
+        self.calls = 0
+
+    def with_options(self, **kwargs):
+        return self
+
+    def insert_many(self, docs, ordered=True):
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            try:
+                self.collection.insert_many(docs[:len(docs) // 2], ordered=False)
+            except BulkWriteError:
+                pass  # landed on an earlier attempt
+            raise AutoReconnect("connection reset")
+        return self.collection.insert_many(docs, ordered=ordered)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bulk_writer, "BULK_WRITE_RETRY_BACKOFF_S", 0)
+
+
+def _docs(count):
+    return [{"_id": ObjectId(), "n": i} for i in range(count)]
+
+
+def test_inserts_are_split_into_batches_and_then_runs_once(mongo_db):
+    writer = BulkWriter(batch_size=100, threads=3)
+    called = []
+
+    writer.insert(mongo_db.reviews, _docs(250), key="s1", then=lambda: called.append("then"))
+
+    assert writer.flush(key="s1", timeout=5)
+    assert mongo_db.reviews.count_documents({}) == 250
+    assert called == ["then"]
+    assert writer.stats()["batches"] == 3
+
+
+def test_retried_batch_skips_rows_that_already_landed(mongo_db):
+    writer = BulkWriter(batch_size=10, threads=1, max_retries=3)
+    collection = FlakyCollection(mongo_db.reviews, failures=2)
+
+    writer.insert(collection, _docs(10), key="s1")
+    writer.flush(timeout=5)
+
+    assert mongo_db.reviews.count_documents({}) == 10
+    stats = writer.stats()
+    assert stats["retries"] == 2
+    assert stats["duplicates_skipped"] == 5
+    assert stats["documents_failed"] == 0
+
+
+def test_given_up_batch_runs_on_failure_instead_of_then(mongo_db):
+    writer = BulkWriter(batch_size=5, threads=2, max_retries=1)
+    collection = FlakyCollection(mongo_db.reviews, failures=100)
+    outcome = []
+
+    writer.insert_all([(mongo_db.analysis_sessions, _docs(1)), (collection, _docs(10))], key="s1",
+                      then=lambda: outcome.append("then"), on_failure=lambda: outcome.append("failed"))
+    writer.flush(timeout=5)
+
+    assert outcome == ["failed"]
+    assert writer.stats()["documents_failed"] > 0
+
+
+def test_flush_waits_only_for_its_own_key(mongo_db):
+    writer = BulkWriter(batch_size=10, threads=1)
+
+    writer.insert(mongo_db.reviews, _docs(5), key="s1")
+
+    assert writer.flush(key="other", timeout=0)
+    assert writer.flush(key="s1", timeout=5)
+    assert mongo_db.reviews.count_documents({}) == 5
+
+
+def test_lost_bulk_reviews_leave_the_counters_to_be_rebuilt(mongo_db, monkeypatch):
+    import pandas as pd
+
+    writer = BulkWriter(batch_size=2, threads=1, max_retries=0)
+    monkeypatch.setattr(bulk_writer, "_writer", writer)
+    mongo_db.users.insert_one(dict(user_stats.initial_counters(None), clerk_user_id="user_a"))
+    flaky = FlakyCollection(mongo_db.reviews, failures=1)
+    monkeypatch.setattr("bulk_storage.reviews_collection", flaky)
+    chunk = pd.DataFrame({"Sentence": ["a", "b", "c", "d"], "Predicted sentiment": ["Positive"] * 4,
+                          "confidence": [0.9] * 4})
+
+    save_bulk_reviews("user_a", ObjectId(), chunk)
+    writer.flush(timeout=5)
+
+    # One of the two batches lost a row, so nothing was added to the counters yet
+    assert mongo_db.users.find_one({"clerk_user_id": "user_a"})["total_reviews"] == 0
+    stats = user_stats.get_user_stats("user_a")
+    assert stats["total_reviews"] == mongo_db.reviews.count_documents({"clerk_user_id": "user_a"}) == 3
+    assert stats["positive_reviews"] == 3
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import clerk_profiles
+import users
+
+
+class FakeClerk:
+    """A local HTTP server answering GET /v1/users/<id> like the Clerk users API"""
+
+    def __init__(self):
+        self.profiles = {}
+        self.status = None
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                fake.requests.append(self.path)
+                clerk_user_id = self.path.rsplit("/", 1)[-1]
+                status = fake.status or (200 if clerk_user_id in fake.profiles else 404)
+                body = json.dumps(fake.profiles.get(clerk_user_id, {"errors": []})).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def add_user(self, clerk_user_id, email, first_name):
+        self.profiles[clerk_user_id] = {
+            "id": clerk_user_id,
+            "primary_email_address_id": "idn_2",
+            "email_addresses": [{"id": "idn_1", "email_address": "old@example.com"},
+                                {"id": "idn_2", "email_address": email}],
+            "first_name": first_name,
+            "last_name": None,
+        }
+
+
+@pytest.fixture
+def clerk(monkeypatch, mongo_db):
+    fake = FakeClerk()
+    monkeypatch.setattr(clerk_profiles, "CLERK_API_URL", fake.url)
+    monkeypatch.setattr(clerk_profiles, "_breaker", clerk_profiles.CircuitBreaker(threshold=3, reset_timeout=0.2))
+    monkeypatch.setattr(clerk_profiles, "_cache", clerk_profiles._ProfileCache())
+    monkeypatch.setattr(clerk_profiles, "_enricher", clerk_profiles.ProfileEnricher())
+    monkeypatch.setattr(users, "_cache", users._UserCache())
+    yield fake
+    fake.server.shutdown()
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_fetch_profile_uses_the_primary_email(clerk):
+    clerk.add_user("user_a", "ada@example.com", "Ada")
+
+    assert clerk_profiles.fetch_profile("user_a") == ("ada@example.com", "Ada")
+    assert clerk.requests == ["/v1/users/user_a"]
+
+
+def test_unknown_user_does_not_trip_the_breaker(clerk):
+    for _ in range(5):
+        assert clerk_profiles.fetch_profile("nobody") == (None, None)
+
+    assert len(clerk.requests) == 5
+    assert clerk_profiles._breaker.state() == "closed"
+
+
+def test_fetch_outcome_tells_missing_profiles_from_errors(clerk):
+    clerk.profiles["user_blank"] = {"id": "user_blank", "email_addresses": []}
+
+    assert clerk_profiles.fetch_profile_outcome("nobody") == ((None, None), clerk_profiles.PROFILE_NOT_FOUND)
+    assert clerk_profiles.fetch_profile_outcome("user_blank") == ((None, None), clerk_profiles.PROFILE_EMPTY)
+    clerk.status = 503
+    assert clerk_profiles.fetch_profile_outcome("nobody") == ((None, None), clerk_profiles.PROFILE_ERROR)
+
+
+def test_breaker_opens_after_repeated_errors_then_lets_one_trial_through(clerk):
+    clerk.add_user("user_a", "ada@example.com", "Ada")
+    clerk.status = 503
+    for _ in range(3):
+        clerk_profiles.fetch_profile("user_a")
+    assert clerk_profiles._breaker.state() == "open"
+
+    assert clerk_profiles.fetch_profile("user_a") == (None, None)
+    assert len(clerk.requests) == 3
+    assert clerk_profiles.clerk_retry_after() > 0
+
+    time.sleep(0.25)
+    clerk.status = None
+    assert clerk_profiles.fetch_profile("user_a") == ("ada@example.com", "Ada")
+    assert clerk_profiles._breaker.state() == "closed"
+
+
+def test_failed_trial_reopens_the_breaker(clerk):
+    clerk.status = 429
+    for _ in range(3):
+        clerk_profiles.fetch_profile("user_a")
+
+    time.sleep(0.25)
+    clerk_profiles.fetch_profile("user_a")
+
+    assert clerk_profiles._breaker.state() == "open"
+    assert len(clerk.requests) == 4
+
+
+def test_lookup_returns_at_once_and_enriches_in_the_background(clerk, mongo_db):
+    clerk.add_user("user_a", "ada@example.com", "Ada")
+    mongo_db.users.insert_one({"clerk_user_id": "user_a", "email": None, "name": None})
+
+    assert clerk_profiles.lookup_profile("user_a") == (None, None)
+
+    _wait_for(lambda: clerk_profiles.profile_stats()["enrichment"]["enriched"] == 1)
+    stored = mongo_db.users.find_one({"clerk_user_id": "user_a"})
+    assert (stored["email"], stored["name"]) == ("ada@example.com", "Ada")
+    assert clerk_profiles.lookup_profile("user_a") == ("ada@example.com", "Ada")
+    assert len(clerk.requests) == 1
+
+
+def test_complete_stored_profile_is_used_without_calling_clerk(clerk, mongo_db):
+    mongo_db.users.insert_one({"clerk_user_id": "user_a", "email": "ada@example.com", "name": "Ada"})
+
+    clerk_profiles.lookup_profile("user_a")
+
+    _wait_for(lambda: clerk_profiles._cache.get("user_a") is not None)
+    assert clerk_profiles.lookup_profile("user_a") == ("ada@example.com", "Ada")
+    assert clerk.requests == []
+
+
+def test_a_user_is_queued_once_however_often_it_is_looked_up(clerk, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(clerk_profiles, "_stored_profile", lambda clerk_user_id: release.wait(5) and (None, None))
+
+    for _ in range(20):
+        clerk_profiles.lookup_profile("user_a")
+    release.set()
+
+    _wait_for(lambda: len(clerk.requests) == 1)
+    assert clerk_profiles._enricher.stats()["dropped"] == 0
@@ -0,0 +1,66 @@
+from datetime import datetime
+
+import pytest
+
+import api
+import user_stats
+from conftest import as_user
+
+ENDPOINTS = ["/api/stats", "/api/reviews", "/api/sessions", "/api/user-data"]
+
+
+@pytest.fixture
+def user_a(api_client, mongo_db, monkeypatch):
+    monkeypatch.setattr(api, "write_behind", None)
+    mongo_db.users.insert_one(dict(user_stats.initial_counters(datetime(2024, 1, 1)), clerk_user_id="user_a",
+                                   created_at=datetime(2024, 1, 1)))
+    api.save_review("user_a", "great", "Positive", 0.9)
+    return api_client
+
+
+def _get(client, url, clerk_user_id="user_a", **headers):
+    return client.get(url, headers=dict(as_user(clerk_user_id), **headers))
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_unchanged_data_revalidates_with_304(user_a, url):
+    first = _get(user_a, url)
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    second = _get(user_a, url, **{"If-None-Match": first.headers["ETag"]})
+
+    assert second.status_code == 304
+    assert second.get_data() == b""
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+@pytest.mark.parametrize("url, vary", [
+    ("/api/stats", "Authorization"),
+    ("/api/reviews", "Authorization"),
+    ("/api/sessions", "Authorization"),
+    ("/api/user-data", "Authorization, Accept, Accept-Encoding"),
+])
+def test_304_keeps_the_caching_headers_of_the_200(user_a, url, vary):
+    first = _get(user_a, url)
+
+    second = _get(user_a, url, **{"If-None-Match": first.headers["ETag"]})
+
+    assert first.headers["Vary"] == second.headers["Vary"] == vary
+    assert second.headers["Cache-Control"] == first.headers["Cache-Control"]
+
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_a_new_review_changes_the_etag(user_a, url):
+    etag = _get(user_a, url).headers["ETag"]
+
+    api.save_review("user_a", "awful", "Negative", 0.8)
+
+    assert _get(user_a, url, **{"If-None-Match": etag}).status_code == 200
+
+
+def test_etags_differ_between_users_and_urls(user_a):
+    etag = _get(user_a, "/api/reviews").headers["ETag"]
+
+    assert _get(user_a, "/api/reviews", "user_b", **{"If-None-Match": etag}).status_code == 200
+    assert _get(user_a, "/api/reviews?limit=5", **{"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,144 @@
+import gzip
+import io
+import json
+import os
+import zipfile
+
+import pytest
+
+from conftest import BACKEND_DIR
+from ingest import (SNIFF_BYTES, SOURCE_FILE_COLUMN, _LimitedStream, detect_format, iter_review_chunks,
+                    read_reviews)
+
+
+def _read(data, filename, **kwargs):
+    return read_reviews(io.BytesIO(data), filename, **kwargs)
+
+
+@pytest.mark.parametrize("filename, head, expected", [
+    ("reviews.csv", b"Sentence\nok\n", "csv"),
+    ("reviews.tsv", b"Sentence\tid\n", "csv"),
+    ("reviews.jsonl", b'{"review": "ok"}\n', "ndjson"),
+    ("upload", b'  {"review": "ok"}\n', "ndjson"),
+    ("upload", b"Sentence\nok\n", "csv"),
+    ("reviews.csv", b"\x1f\x8b\x08\x00", "gzip"),
+    ("reviews.bin", b"PAR1\x15\x04", "parquet"),
+    ("reviews.zip", b"PK\x03\x04", "zip"),
+    ("reviews.xlsx", b"PK\x03\x04", "xlsx"),
+    ("reviews.xls", b"\xd0\xcf\x11\xe0", "xls"),
+])
+def test_detect_format(filename, head, expected):
+    assert detect_format(filename, head) == expected
+
+
+def test_unknown_extension_is_rejected():
+    with pytest.raises(ValueError):
+        detect_format("reviews.pdf", b"%PDF-1.4")
+
+
+def test_tsv_delimiter_is_sniffed():
+    with open(os.path.join(BACKEND_DIR, "Data", "amazon_alexa.tsv"), "rb") as f:
+        reviews = read_reviews(f, "amazon_alexa.tsv", chunksize=1000)
+
+    assert len(reviews) == 3150
+    assert list(reviews.columns) == ["rating", "date", "variation", "Sentence", "feedback"]
+
+
+@pytest.mark.parametrize("filename", ["reviews.csv", "upload"])
+def test_semicolon_delimiter_is_sniffed(filename):
+    reviews = _read(b'id;Review;stars\n1;"good, really";5\n2;bad;1\n', filename)
+
+    assert list(reviews.columns) == ["id", "Sentence", "stars"]
+    assert reviews["Sentence"].tolist() == ["good, really", "bad"]
+
+
+def test_single_column_with_delimiters_in_reviews():
+    reviews = _read(b'Sentence\n"I love it, really"\nmeh; ok\n', "reviews.csv")
+
+    assert reviews["Sentence"].tolist() == ["I love it, really", "meh; ok"]
+
+
+def test_quoted_header_with_newline():
+    reviews = _read(b'id,"Review\ntext"\n1,great\n', "reviews.csv")
+
+    assert reviews["Sentence"].tolist() == ["great"]
+
+
+def test_header_longer_than_the_sniff_sample_is_rejected():
+    with pytest.raises(ValueError, match="header row"):
+        _read(b"Sentence," + b"x" * SNIFF_BYTES + b"\nok\n", "reviews.csv")
+
+
+def test_missing_review_column_is_rejected():
+    with pytest.raises(ValueError, match="Could not find review column"):
+        _read(b"id,stars\n1,5\n", "reviews.csv")
+
+
+def test_keep_columns_false_parses_only_the_review_column():
+    reviews = _read(b"id,Review,stars\n1,good,5\n", "reviews.csv", keep_columns=False)
+
+    assert list(reviews.columns) == ["Sentence"]
+
+
+def test_passthrough_columns_keep_one_dtype_across_chunks():
+    rows = b"".join(b"%d,review %d,%s\n" % (i, i, b"5" if i < 4 else b"n/a") for i in range(8))
+    chunks = list(iter_review_chunks(io.BytesIO(b"id,Review,stars\n" + rows), "reviews.csv", chunksize=4))
+
+    assert len(chunks) == 2
+    assert [str(chunk["stars"].dtype) for chunk in chunks] == [str(chunks[1]["stars"].dtype)] * 2
+    assert chunks[0]["stars"].tolist() == ["5"] * 4
+
+
+def test_ndjson_chunks_with_different_dtypes_are_concatenated_as_text():
+    lines = [{"review": f"r{i}", "rating": i if i < 3 else f"x{i}"} for i in range(6)]
+    data = "\n".join(json.dumps(line) for line in lines).encode()
+
+    reviews = _read(data, "reviews.ndjson", chunksize=3)
+
+    assert reviews["rating"].tolist() == ["0", "1", "2", "x3", "x4", "x5"]
+
+
+def test_gzip_upload_is_decompressed():
+    reviews = _read(gzip.compress(b"Review\ngood\nbad\n"), "reviews.csv.gz")
+
+    assert reviews["Sentence"].tolist() == ["good", "bad"]
+
+
+def test_zip_with_several_files_records_the_source():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.csv", "Review\ngood\n")
+        zf.writestr("b.ndjson", '{"review": "bad"}\n')
+        zf.writestr("__MACOSX/._a.csv", "junk")
+
+    reviews = _read(archive.getvalue(), "reviews.zip")
+
+    assert reviews["Sentence"].tolist() == ["good", "bad"]
+    assert reviews[SOURCE_FILE_COLUMN].tolist() == ["a.csv", "b.ndjson"]
+
+
+def test_zip_members_with_different_columns_share_one_header():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.csv", "Review,id\ngood,1\nfine,2\n")
+        zf.writestr("b.ndjson", '{"review": "bad", "rating": 1}\n')
+
+    chunks = list(iter_review_chunks(io.BytesIO(archive.getvalue()), "reviews.zip", chunksize=1))
+
+    assert [chunk.columns.tolist() for chunk in chunks] == [["Sentence", "id", "rating", SOURCE_FILE_COLUMN]] * 3
+    assert chunks[2]["id"].isna().all()
+    assert chunks[0]["rating"].isna().all()
+
+
+def test_limited_stream_passes_data_up_to_the_limit():
+    stream = io.BufferedReader(_LimitedStream(io.BytesIO(b"x" * 100), limit=100))
+
+    assert stream.read() == b"x" * 100
+
+
+def test_limited_stream_raises_past_the_limit():
+    stream = io.BufferedReader(_LimitedStream(io.BytesIO(b"x" * 101), limit=100))
+
+    with pytest.raises(ValueError, match="larger than"):
+        stream.read()
+
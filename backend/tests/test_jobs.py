@@ -0,0 +1,213 @@
+import io
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import jobs
+
+UPLOAD = b"id,Review\n1,I love my Echo\n2,Terrible sound and it stopped working\n3,Works great\n"
+LONG_AGO = datetime.utcnow() - timedelta(days=1)
+
+
+@pytest.fixture
+def submitted(monkeypatch, mongo_db):
+    """Jobs handed to the pool; run synchronously by the tests instead of on pool threads"""
+    job_ids = []
+    monkeypatch.setattr(jobs, "submit_job", job_ids.append)
+    monkeypatch.setattr(jobs, "start_job_recovery", lambda: None)
+    return job_ids
+
+
+def _create_job(output_format="csv"):
+    return jobs.create_job("user_a", FileStorage(io.BytesIO(UPLOAD), "reviews.csv"), output_format)
+
+
+def _job(job_id):
+    return jobs.bulk_jobs_collection.find_one({"_id": job_id})
+
+
+def _make_stale(job_id, **fields):
+    jobs.bulk_jobs_collection.update_one({"_id": job_id}, {"$set": dict(fields, heartbeat_at=LONG_AGO)})
+
+
+def test_create_job_queues_it_for_this_worker(submitted):
+    job = _create_job()
+
+    assert submitted == [job["_id"]]
+    stored = _job(job["_id"])
+    assert stored["status"] == "queued"
+    assert stored["worker"] == jobs._worker_id()
+    assert stored["total_rows_estimate"] == 3
+
+
+def test_run_job_writes_the_result_and_the_reviews(submitted, mongo_db):
+    job = _create_job()
+
+    jobs.run_job(job["_id"])
+
+    stored = _job(job["_id"])
+    assert stored["status"] == "completed", stored["error"]
+    assert stored["attempts"] == 1
+    assert stored["rows_processed"] == 3
+    assert stored["summary"]["total_reviews"] == 3
+    assert stored["summary"]["positive_count"] + stored["summary"]["negative_count"] == 3
+    result = pd.read_csv(jobs.open_job_result(job["_id"]))
+    assert result.columns.tolist() == ["id", "Sentence", "Predicted sentiment", "confidence"]
+    assert len(result) == 3
+    assert mongo_db.reviews.count_documents({"session_id": stored["session_id"]}) == 3
+    session = mongo_db.analysis_sessions.find_one({"_id": stored["session_id"]})
+    assert session["status"] == "completed"
+
+
+def test_run_job_claims_a_job_only_once(submitted):
+    job = _create_job()
+    jobs.run_job(job["_id"])
+
+    jobs.run_job(job["_id"])
+
+    assert _job(job["_id"])["attempts"] == 1
+
+
+def test_run_job_leaves_a_job_queued_by_another_worker(submitted):
+    job = _create_job()
+    jobs.bulk_jobs_collection.update_one({"_id": job["_id"]}, {"$set": {"worker": "other-host:1:abcd"}})
+
+    jobs.run_job(job["_id"])
+
+    assert _job(job["_id"])["status"] == "queued"
+
+
+def test_heartbeat_keeps_held_queued_jobs_from_being_recovered(submitted):
+    job = _create_job()
+    _make_stale(job["_id"])
+
+    assert jobs.heartbeat_jobs() == 1
+    assert jobs.recover_stale_jobs() == 0
+    assert submitted == [job["_id"]]
+
+
+def test_stale_job_of_a_gone_worker_is_requeued_here(submitted):
+    job = _create_job()
+    _make_stale(job["_id"], status="running", worker="old-host:7:dead", run_token="old")
+
+    assert jobs.recover_stale_jobs() == 1
+
+    stored = _job(job["_id"])
+    assert stored["status"] == "queued"
+    assert stored["worker"] == jobs._worker_id()
+    assert stored["run_token"] is None
+    assert submitted == [job["_id"], job["_id"]]
+    jobs.run_job(job["_id"])
+    assert _job(job["_id"])["status"] == "completed"
+
+
+def test_heartbeat_does_not_touch_jobs_of_other_workers(submitted):
+    job = _create_job()
+    _make_stale(job["_id"], worker="old-host:7:dead")
+
+    assert jobs.heartbeat_jobs() == 0
+    assert jobs.recover_stale_jobs() == 1
+
+
+def test_job_out_of_attempts_fails_instead_of_requeueing(submitted):
+    job = _create_job()
+    _make_stale(job["_id"], status="running", worker="old-host:7:dead", attempts=jobs.BULK_JOB_MAX_ATTEMPTS)
+
+    assert jobs.recover_stale_jobs() == 0
+
+    stored = _job(job["_id"])
+    assert stored["status"] == "failed"
+    assert "attempts" in stored["error"]
+    assert submitted == [job["_id"]]
+
+
+def test_recovered_run_abandons_the_old_one(submitted, monkeypatch):
+    job = _create_job()
+    taken_over = []
+
+    def slow_flush(session_id):
+        # Another worker re-claims the job while this run waits for its reviews
+        jobs.bulk_jobs_collection.update_one({"_id": job["_id"]}, {"$set": {"run_token": "new-run"}})
+        taken_over.append(session_id)
+
+    monkeypatch.setattr(jobs, "wait_for_bulk_reviews", slow_flush)
+    jobs.run_job(job["_id"])
+
+    assert taken_over
+    assert _job(job["_id"])["status"] == "running"
+
+
+def test_heartbeats_keep_a_long_flush_from_being_recovered(submitted, monkeypatch):
+    monkeypatch.setattr(jobs, "BULK_JOB_STALE_SECONDS", 1)
+    job = _create_job()
+    recovered = []
+
+    def slow_flush(session_id):
+        deadline = time.monotonic() + 2.5
+        while time.monotonic() < deadline:
+            jobs.heartbeat_jobs()
+            time.sleep(0.2)
+            recovered.append(jobs.recover_stale_jobs())
+
+    monkeypatch.setattr(jobs, "wait_for_bulk_reviews", slow_flush)
+    jobs.run_job(job["_id"])
+
+    assert sum(recovered) == 0
+    assert _job(job["_id"])["status"] == "completed"
+
+
+def _has_file(file_id):
+    return jobs.db["bulk_job_files.files"].count_documents({"_id": file_id}) == 1
+
+
+def test_completed_job_drops_its_upload_and_keeps_the_result(submitted):
+    job = _create_job()
+    assert _has_file(jobs._upload_file_id(job["_id"]))
+
+    jobs.run_job(job["_id"])
+
+    assert not _has_file(jobs._upload_file_id(job["_id"]))
+    assert _has_file(jobs._result_file_id(job["_id"]))
+
+
+def test_failed_job_drops_its_upload_and_partial_result(submitted, monkeypatch):
+    def broken_models():
+        raise OSError("model_xgb.pkl is missing")
+
+    monkeypatch.setattr(jobs, "get_models", broken_models)
+    job = _create_job()
+
+    jobs.run_job(job["_id"])
+
+    assert _job(job["_id"])["status"] == "failed"
+    assert not _has_file(jobs._upload_file_id(job["_id"]))
+    assert not _has_file(jobs._result_file_id(job["_id"]))
+
+
+def test_job_given_up_on_drops_its_upload(submitted):
+    job = _create_job()
+    _make_stale(job["_id"], status="running", worker="old-host:7:dead", attempts=jobs.BULK_JOB_MAX_ATTEMPTS)
+
+    jobs.recover_stale_jobs()
+
+    assert not _has_file(jobs._upload_file_id(job["_id"]))
+
+
+def test_finished_jobs_expire_after_the_retention_period(submitted, monkeypatch):
+    monkeypatch.setattr(jobs, "BULK_JOB_RETENTION_HOURS", 12)
+    old, recent, running = _create_job(), _create_job(), _create_job()
+    jobs.run_job(old["_id"])
+    jobs.run_job(recent["_id"])
+    jobs.bulk_jobs_collection.update_one({"_id": old["_id"]}, {"$set": {"finished_at": LONG_AGO}})
+    _make_stale(running["_id"], status="running", started_at=LONG_AGO)
+
+    assert jobs.expire_finished_jobs() == 1
+
+    assert _job(old["_id"]) is None
+    assert not _has_file(jobs._result_file_id(old["_id"]))
+    assert _job(recent["_id"])["status"] == "completed"
+    assert _has_file(jobs._result_file_id(recent["_id"]))
+    assert _has_file(jobs._upload_file_id(running["_id"]))
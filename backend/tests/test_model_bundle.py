@@ -0,0 +1,92 @@
+import os
+import pickle
+import shutil
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bulk import predict_texts
+from conftest import BACKEND_DIR
+from inference import prepare_sparse_predictor
+from model_bundle import BundleError, export_bundle, load_bundle, read_manifest
+
+MODELS_DIR = os.path.join(BACKEND_DIR, "Models")
+BUNDLE_DIR = os.path.join(MODELS_DIR, "bundle")
+
+
+def _load_pickle(filename):
+    with warnings.catch_warnings():
+        # The pickles were written by older scikit-learn/XGBoost releases
+        warnings.simplefilter("ignore")
+        with open(os.path.join(MODELS_DIR, filename), "rb") as f:
+            return pickle.load(f)
+
+
+@pytest.fixture(scope="module")
+def pickled_models():
+    predictor = _load_pickle("model_xgb.pkl")
+    scaler = _load_pickle("scaler.pkl")
+    cv = _load_pickle("countVectorizer.pkl")
+    prepare_sparse_predictor(predictor, scaler)
+    return predictor, scaler, cv
+
+
+@pytest.fixture(scope="module")
+def alexa_reviews():
+    return pd.read_csv(os.path.join(BACKEND_DIR, "Data", "amazon_alexa.tsv"), sep="\t")["verified_reviews"]
+
+
+def test_bundle_predictions_match_the_pickles_exactly(pickled_models, alexa_reviews):
+    predictor, scaler, cv, _ = load_bundle(BUNDLE_DIR)
+
+    expected_labels, expected_confidences = predict_texts(*pickled_models, alexa_reviews)
+    labels, confidences = predict_texts(predictor, scaler, cv, alexa_reviews)
+
+    assert len(alexa_reviews) == len(labels) == 3150
+    assert int((labels != expected_labels).sum()) == 0
+    assert float(np.abs(confidences - expected_confidences).max()) == 0.0
+
+
+def test_bundle_matches_the_original_dense_pipeline(alexa_reviews):
+    from text_processing import normalize_series
+
+    predictor, scaler, cv, _ = load_bundle(BUNDLE_DIR)
+    corpus = normalize_series(alexa_reviews).tolist()
+    # The pipeline as it was before sparse inference: dense features through the unmodified pickles
+    features = _load_pickle("scaler.pkl").transform(_load_pickle("countVectorizer.pkl").transform(corpus).toarray())
+    expected = _load_pickle("model_xgb.pkl").predict_proba(features)
+
+    _, confidences = predict_texts(predictor, scaler, cv, alexa_reviews)
+
+    assert float(np.abs(confidences - expected.max(axis=1)).max()) == 0.0
+
+
+def test_export_round_trip(tmp_path, pickled_models, alexa_reviews):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        manifest = export_bundle(MODELS_DIR, str(tmp_path / "bundle"))
+    predictor, scaler, cv, loaded_manifest = load_bundle(str(tmp_path / "bundle"))
+
+    assert loaded_manifest == manifest
+    # Exports are deterministic, so the committed bundle is the one the current pickles produce
+    committed = read_manifest(BUNDLE_DIR)
+    assert {key: value for key, value in manifest.items() if key != "created_at"} == \
+        {key: value for key, value in committed.items() if key != "created_at"}
+    texts = alexa_reviews.head(200)
+    expected = predict_texts(*pickled_models, texts)
+    actual = predict_texts(predictor, scaler, cv, texts)
+    assert (actual[0] == expected[0]).all()
+    assert (actual[1] == expected[1]).all()
+
+
+def test_damaged_bundle_is_rejected(tmp_path):
+    bundle_dir = tmp_path / "bundle"
+    shutil.copytree(BUNDLE_DIR, bundle_dir)
+    with open(bundle_dir / "min.npy", "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\x00" if f.read(1) != b"\x00" else b"\x01")
+
+    with pytest.raises(BundleError, match="Checksum"):
+        load_bundle(str(bundle_dir))
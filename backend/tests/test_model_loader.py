@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+import model_loader
+
+
+@pytest.fixture
+def fresh_holder(monkeypatch):
+    """An empty model holder whose artifact loads are counted instead of read from disk"""
+    loads = []
+
+    def fake_load_artifacts():
+        loads.append(threading.get_ident())
+        return object(), object(), object(), "v-test", "pickle"
+
+    monkeypatch.setattr(model_loader, "_models", None)
+    monkeypatch.setattr(model_loader, "_model_version", None)
+    monkeypatch.setattr(model_loader, "_load_error", None)
+    monkeypatch.setattr(model_loader, "_load_artifacts", fake_load_artifacts)
+    monkeypatch.setattr(model_loader, "_set_nthread", lambda predictor, nthread: None)
+    monkeypatch.setattr(model_loader, "prepare_sparse_predictor", lambda predictor, scaler: None)
+    monkeypatch.setattr(model_loader, "sparse_predict_proba", lambda *args: None)
+    return loads
+
+
+def test_models_are_loaded_once_and_reused(fresh_holder):
+    first = model_loader.get_models()
+
+    assert model_loader.get_models() is first
+    assert model_loader.load_models() is first
+    assert model_loader.model_version() == "v-test"
+    assert len(fresh_holder) == 1
+
+
+def test_concurrent_first_requests_share_one_load(fresh_holder):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def first_request():
+        barrier.wait()
+        results.append(model_loader.get_models())
+
+    threads = [threading.Thread(target=first_request) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(fresh_holder) == 1
+    assert len({id(models) for models in results}) == 1
+
+
+def test_failed_load_is_reported_and_retried(fresh_holder, monkeypatch):
+    def broken_load():
+        raise OSError("model_xgb.pkl is missing")
+
+    working_load = model_loader._load_artifacts
+    monkeypatch.setattr(model_loader, "_load_artifacts", broken_load)
+    with pytest.raises(OSError):
+        model_loader.load_models()
+
+    status = model_loader.model_status()
+    assert status["models_loaded"] is False
+    assert "missing" in status["error"]
+
+    monkeypatch.setattr(model_loader, "_load_artifacts", working_load)
+    assert model_loader.load_models() is not None
+    assert len(fresh_holder) == 1
+    assert model_loader.model_status()["models_loaded"] is True
+
+
+def test_ready_reflects_the_model_holder(monkeypatch):
+    import api
+
+    client = api.app.test_client()
+    assert client.get("/ready").status_code == 200
+
+    monkeypatch.setattr(api, "model_status", lambda: {"models_loaded": False, "error": "still loading"})
+    response = client.get("/ready")
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "loading"
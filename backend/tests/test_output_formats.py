@@ -0,0 +1,126 @@
+import gzip
+import io
+import json
+import zipfile
+
+import pandas as pd
+import pytest
+from werkzeug.datastructures import MIMEAccept
+
+from ingest import SOURCE_FILE_COLUMN, iter_review_chunks
+from output_formats import _ArrowWriter, create_writer, negotiate_output_format
+
+pa = pytest.importorskip("pyarrow")
+pq = pytest.importorskip("pyarrow.parquet")
+
+
+def _chunk(**columns):
+    rows = len(next(iter(columns.values())))
+    return pd.DataFrame(dict(columns, **{
+        "Sentence": [f"review {i}" for i in range(rows)],
+        "Predicted sentiment": ["Positive"] * rows,
+        "confidence": [0.9] * rows,
+    }))
+
+
+def _write(output_format, chunks):
+    writer = create_writer(output_format)
+    return b"".join(writer.write(chunk) for chunk in chunks) + writer.close()
+
+
+def _read_table(output_format, data):
+    if output_format == "parquet":
+        return pq.read_table(io.BytesIO(data))
+    return pa.ipc.open_stream(data).read_all()
+
+
+@pytest.mark.parametrize("format_param, accept, expected", [
+    ("parquet", None, "parquet"),
+    ("JSONL", None, "ndjson"),
+    ("gzip", "application/x-ndjson", "csv.gz"),
+    ("xml", None, None),
+    (None, None, "csv"),
+    (None, "application/vnd.apache.arrow.stream", "arrow"),
+    (None, "text/html,*/*;q=0.8", "csv"),
+])
+def test_negotiate_output_format(format_param, accept, expected):
+    accept_mimetypes = MIMEAccept([(value, 1) for value in accept.split(",")]) if accept else None
+    assert negotiate_output_format(format_param, accept_mimetypes) == expected
+
+
+def test_csv_writes_the_header_once():
+    data = _write("csv", [_chunk(id=[1, 2]), _chunk(id=[3])])
+
+    assert data.decode().count("Predicted sentiment") == 1
+    assert len(pd.read_csv(io.BytesIO(data))) == 3
+
+
+def test_gzip_csv_is_one_valid_member():
+    data = _write("csv.gz", [_chunk(id=[1, 2]), _chunk(id=[3])])
+
+    assert len(pd.read_csv(io.BytesIO(gzip.decompress(data)))) == 3
+
+
+def test_ndjson_writes_one_object_per_row():
+    lines = _write("ndjson", [_chunk(id=[1, 2]), _chunk(id=[3])]).decode().splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == [1, 2, 3]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_passthrough_column_changing_type_between_chunks(output_format):
+    chunks = [_chunk(id=[1, 2], note=[None, None]), _chunk(id=["x3", "4"], note=["hi", None])]
+
+    table = _read_table(output_format, _write(output_format, chunks))
+
+    assert table.schema.field("id").type == pa.string()
+    assert table.schema.field("note").type == pa.string()
+    assert table.schema.field("confidence").type == pa.float64()
+    assert table.column("id").to_pylist() == ["1", "2", "x3", "4"]
+    assert table.column("note").to_pylist() == [None, None, "hi", None]
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+def test_every_chunk_has_the_same_schema(output_format):
+    chunks = [_chunk(stars=[5.0, 4.5]), _chunk(stars=["five", None]), _chunk(stars=[1, 2])]
+
+    data = _write(output_format, chunks)
+
+    if output_format == "parquet":
+        parquet_file = pq.ParquetFile(io.BytesIO(data))
+        assert parquet_file.num_row_groups == 3
+        schemas = {parquet_file.read_row_group(i).schema for i in range(3)}
+    else:
+        schemas = {batch.schema for batch in pa.ipc.open_stream(data)}
+    assert len(schemas) == 1
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow", "csv"])
+def test_zip_members_with_different_columns(output_format):
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.csv", "Review,id\ngood,1\n")
+        zf.writestr("b.csv", "Review,rating\nbad,5\n")
+    chunks = [
+        chunk.assign(**{"Predicted sentiment": "Positive", "confidence": 0.9})
+        for chunk in iter_review_chunks(io.BytesIO(archive.getvalue()), "reviews.zip", chunksize=1)
+    ]
+
+    data = _write(output_format, chunks)
+
+    if output_format == "csv":
+        table = pd.read_csv(io.BytesIO(data), dtype=str).to_dict("list")
+    else:
+        table = _read_table(output_format, data).to_pydict()
+    assert table["id"][0] == "1" and pd.isna(table["id"][1])
+    assert pd.isna(table["rating"][0]) and table["rating"][1] == "5"
+    assert table[SOURCE_FILE_COLUMN] == ["a.csv", "b.csv"]
+
+
+def test_empty_output_closes_cleanly():
+    assert create_writer("parquet").close() == b""
+
+
+def test_arrow_writer_requires_open():
+    with pytest.raises(TypeError):
+        _ArrowWriter()
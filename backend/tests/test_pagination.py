@@ -0,0 +1,79 @@
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from pagination import (PAGE_SIZE_DEFAULT, PAGE_SIZE_MAX, decode_cursor, encode_cursor, keyset_page,
+                        page_size)
+
+
+def _insert_reviews(collection, count, clerk_user_id="user_a", same_time_every=1):
+    start = datetime(2024, 1, 1)
+    docs = [
+        {"clerk_user_id": clerk_user_id, "text": f"review {i}",
+         "created_at": start + timedelta(seconds=i // same_time_every)}
+        for i in range(count)
+    ]
+    collection.insert_many(docs)
+    return docs
+
+
+def _all_pages(collection, query, limit):
+    seen, cursor = [], None
+    while True:
+        docs, cursor = keyset_page(collection, query, {"text": 1}, cursor=cursor, limit=limit)
+        seen.append(docs)
+        if cursor is None:
+            return seen
+
+
+def test_page_size_defaults_and_clamps():
+    assert page_size(None) == PAGE_SIZE_DEFAULT
+    assert page_size(0) == 1
+    assert page_size(PAGE_SIZE_MAX + 1) == PAGE_SIZE_MAX
+    assert page_size("7") == 7
+
+
+def test_cursor_round_trip_keeps_millisecond_precision():
+    doc = {"_id": ObjectId(), "created_at": datetime(2024, 5, 6, 7, 8, 9, 123456)}
+    created_at, object_id = decode_cursor(encode_cursor(doc))
+    assert created_at == datetime(2024, 5, 6, 7, 8, 9, 123000)
+    assert object_id == doc["_id"]
+
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", "MTIz", "YWJjLmRlZg"])
+def test_malformed_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_pages_cover_every_document_newest_first(mongo_db):
+    _insert_reviews(mongo_db.reviews, 23)
+    _insert_reviews(mongo_db.reviews, 5, clerk_user_id="user_b")
+
+    pages = _all_pages(mongo_db.reviews, {"clerk_user_id": "user_a"}, limit=10)
+
+    assert [len(page) for page in pages] == [10, 10, 3]
+    texts = [doc["text"] for page in pages for doc in page]
+    assert texts == [f"review {i}" for i in reversed(range(23))]
+
+
+def test_ties_on_created_at_are_broken_by_id(mongo_db):
+    # Four reviews share each timestamp, so page boundaries fall inside a tie
+    _insert_reviews(mongo_db.reviews, 20, same_time_every=4)
+
+    pages = _all_pages(mongo_db.reviews, {"clerk_user_id": "user_a"}, limit=3)
+
+    ids = [doc["_id"] for page in pages for doc in page]
+    assert len(ids) == len(set(ids)) == 20
+    keys = [(doc["created_at"], doc["_id"]) for page in pages for doc in page]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_last_full_page_has_no_next_cursor(mongo_db):
+    _insert_reviews(mongo_db.reviews, 10)
+
+    docs, cursor = keyset_page(mongo_db.reviews, {"clerk_user_id": "user_a"}, {"text": 1}, limit=10)
+
+    assert len(docs) == 10
+    assert cursor is None
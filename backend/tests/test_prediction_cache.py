@@ -0,0 +1,129 @@
+import socket
+import time
+
+import numpy as np
+import pytest
+
+import bulk
+from prediction_cache import DiskCacheBackend, MemoryCacheBackend, PredictionCache, RedisCacheBackend
+
+
+class Inferred(list):
+    """Batches of texts that reached the model"""
+    cache = None
+
+
+@pytest.fixture
+def inferred(monkeypatch):
+    """Texts that reached the model, with the cache swapped for a fresh in-memory one"""
+    seen = Inferred()
+
+    def fake_predict_proba(predictor, scaler, cv, corpus):
+        seen.append(list(corpus))
+        positive = np.array([0.9 if "good" in text else 0.2 for text in corpus])
+        return np.column_stack([1 - positive, positive])
+
+    cache = PredictionCache(MemoryCacheBackend(max_size=100, ttl=60))
+    monkeypatch.setattr(bulk, "sparse_predict_proba", fake_predict_proba)
+    monkeypatch.setattr(bulk, "get_prediction_cache", lambda: cache)
+    monkeypatch.setattr(bulk, "model_version", lambda: "v1")
+    seen.cache = cache
+    return seen
+
+
+def _predict(corpus):
+    return bulk.predict_corpus(None, None, None, corpus)
+
+
+def test_duplicates_in_a_batch_are_inferred_once(inferred):
+    sentiments, confidences = _predict(["good", "bad", "good", "good", "bad"])
+
+    assert inferred == [["good", "bad"]]
+    assert sentiments.tolist() == ["Positive", "Negative", "Positive", "Positive", "Negative"]
+    assert confidences.tolist() == pytest.approx([0.9, 0.8, 0.9, 0.9, 0.8])
+
+
+def test_cached_texts_skip_the_model(inferred):
+    _predict(["good", "bad"])
+
+    sentiments, _ = _predict(["bad", "good echo", "good"])
+
+    assert inferred == [["good", "bad"], ["good echo"]]
+    assert sentiments.tolist() == ["Negative", "Positive", "Positive"]
+    assert inferred.cache.stats()["hits"] == 2
+
+
+def test_a_new_model_version_misses_the_cache(inferred, monkeypatch):
+    _predict(["good"])
+    monkeypatch.setattr(bulk, "model_version", lambda: "v2")
+
+    _predict(["good"])
+
+    assert inferred == [["good"], ["good"]]
+
+
+def test_a_failing_backend_falls_back_to_the_model(inferred):
+    class Broken:
+        def get_many(self, keys):
+            raise ConnectionError("redis is down")
+
+        def set_many(self, values):
+            raise ConnectionError("redis is down")
+
+    inferred.cache.backend = Broken()
+
+    assert _predict(["good"])[0].tolist() == ["Positive"]
+    assert inferred.cache.stats()["errors"] == 2
+
+
+def test_an_unresponsive_redis_is_a_quick_miss():
+    pytest.importorskip("redis")
+    # Accepts connections (into the backlog) but never answers
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    try:
+        port = server.getsockname()[1]
+        cache = PredictionCache(RedisCacheBackend(url=f"redis://127.0.0.1:{port}/0", timeout=0.05))
+
+        started = time.monotonic()
+        assert cache.get_many("v1", ["good"]) == {}
+
+        assert time.monotonic() - started < 1
+        assert cache.stats()["errors"] == 1
+        assert cache.stats()["misses"] == 1
+    finally:
+        server.close()
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_size=2, ttl=60)
+    backend.set_many({"a": ("Positive", 0.9), "b": ("Negative", 0.8)})
+    backend.get_many(["a"])
+
+    backend.set_many({"c": ("Positive", 0.7)})
+
+    assert set(backend.get_many(["a", "b", "c"])) == {"a", "c"}
+
+
+def test_expired_entries_are_misses():
+    backend = MemoryCacheBackend(ttl=-1)
+    backend.set_many({"a": ("Positive", 0.9)})
+
+    assert backend.get_many(["a"]) == {}
+
+
+def test_disk_backend_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "predictions.sqlite3")
+    DiskCacheBackend(path=path, max_size=100, ttl=60).set_many({"a": ("Positive", 0.75)})
+
+    assert DiskCacheBackend(path=path).get_many(["a", "b"]) == {"a": ("Positive", 0.75)}
+
+
+def test_disk_backend_trims_to_its_max_size(tmp_path):
+    backend = DiskCacheBackend(path=str(tmp_path / "predictions.sqlite3"), max_size=10, ttl=60)
+
+    for i in range(30):
+        backend.set_many({f"key{i}": ("Positive", 0.5)})
+
+    assert len(backend) <= 10
@@ -0,0 +1,62 @@
+import io
+
+import api
+from conftest import as_user
+
+UPLOAD = b"Review\nI love my Echo\nTerrible sound and it stopped working\nWorks great\n"
+
+
+def _upload(api_client, query=""):
+    return api_client.post(f"/predict{query}", headers=as_user("user_a"),
+                           data={"file": (io.BytesIO(UPLOAD), "reviews.csv")})
+
+
+def test_summary_is_readable_right_after_the_bulk_response(api_client):
+    response = _upload(api_client, "?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["X-Graph-Exists"] == "false"
+
+    summary = api_client.get(response.headers["X-Summary-Url"], headers=as_user("user_a"))
+
+    assert summary.status_code == 200
+    body = summary.get_json()
+    assert body["total_reviews"] == 3
+    assert body["positive_count"] + body["negative_count"] == 3
+    assert body["chart"]["total"] == 3
+
+
+def test_chart_is_readable_right_after_the_bulk_response(api_client):
+    session_id = _upload(api_client, "?chart=none").headers["X-Session-Id"]
+
+    chart = api_client.get(f"/api/sessions/{session_id}/chart?format=json", headers=as_user("user_a"))
+
+    assert chart.status_code == 200
+    assert chart.get_json()["total"] == 3
+
+
+def test_session_still_being_written_is_pending(api_client, monkeypatch):
+    class StalledWriter:
+        def flush(self, key=None, timeout=None):
+            return False
+
+    monkeypatch.setattr(api, "get_bulk_writer", StalledWriter)
+
+    response = api_client.get("/api/sessions/0123456789abcdef01234567/summary", headers=as_user("user_a"))
+
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "pending"
+
+
+def test_other_users_session_is_not_found(api_client):
+    session_id = _upload(api_client).headers["X-Session-Id"]
+
+    response = api_client.get(f"/api/sessions/{session_id}/summary", headers=as_user("user_b"))
+
+    assert response.status_code == 404
+
+
+def test_json_chart_is_not_sent_in_headers(api_client):
+    response = _upload(api_client, "?chart=json")
+
+    assert response.status_code == 400
+    assert "X-Graph-Spec" not in response.headers
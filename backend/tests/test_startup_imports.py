@@ -0,0 +1,5 @@
+from startup_benchmark import eager_imports
+
+
+def test_importing_the_app_leaves_pandas_and_matplotlib_unloaded():
+    assert eager_imports() == []
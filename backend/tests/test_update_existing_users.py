@@ -0,0 +1,152 @@
+import threading
+import time
+
+import pytest
+from bson import ObjectId
+
+import update_existing_users as backfill
+from clerk_profiles import PROFILE_ERROR, PROFILE_NOT_FOUND
+
+
+class FakeClerkApi:
+    """Stands in for get_user_info_outcome: known users get a profile, the rest fail with `failure`"""
+
+    def __init__(self, known, crash_after=None, failure=PROFILE_ERROR):
+        self.known = set(known)
+        self.crash_after = crash_after
+        self.failure = failure
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, clerk_user_id):
+        with self._lock:
+            if self.crash_after is not None and len(self.calls) >= self.crash_after:
+                raise KeyboardInterrupt
+            self.calls.append(clerk_user_id)
+        if clerk_user_id in self.known:
+            return (f"{clerk_user_id}@example.com", clerk_user_id.title()), None
+        return (None, None), self.failure
+
+
+@pytest.fixture
+def seeded(mongo_db, monkeypatch, tmp_path):
+    monkeypatch.setattr(backfill, "users_collection", mongo_db.users)
+    monkeypatch.setattr(backfill, "clerk_retry_after", lambda: 0)
+    ids = [ObjectId() for _ in range(10)]
+    mongo_db.users.insert_many([{"_id": _id, "clerk_user_id": f"user_{i}", "email": None, "name": None}
+                                for i, _id in enumerate(ids)])
+    mongo_db.users.insert_many([
+        {"clerk_user_id": "dev_user_123", "email": None},
+        {"clerk_user_id": "user_done", "email": "done@example.com", "name": "Done"},
+    ])
+    return str(tmp_path / "checkpoint")
+
+
+def _run(monkeypatch, checkpoint, clerk, **kwargs):
+    monkeypatch.setattr(backfill, "get_user_info_outcome", clerk)
+    backfill.update_existing_users(workers=4, rate=10000, batch_size=3, checkpoint=checkpoint, **kwargs)
+
+
+def _missing(mongo_db):
+    return sorted(user["clerk_user_id"] for user in mongo_db.users.find({"email": None}))
+
+
+def test_every_incomplete_user_is_filled_in_once(seeded, mongo_db, monkeypatch):
+    clerk = FakeClerkApi(f"user_{i}" for i in range(10))
+
+    _run(monkeypatch, seeded, clerk)
+
+    assert sorted(clerk.calls) == sorted(f"user_{i}" for i in range(10))
+    assert _missing(mongo_db) == ["dev_user_123"]
+    assert mongo_db.users.find_one({"clerk_user_id": "user_4"})["name"] == "User_4"
+    last_id, failed = backfill.read_checkpoint(seeded)
+    assert last_id == max(user["_id"] for user in mongo_db.users.find({"clerk_user_id": {"$regex": "^user_\\d"}}))
+    assert failed == {}
+
+
+def test_an_interrupted_run_resumes_after_the_last_written_batch(seeded, mongo_db, monkeypatch):
+    everyone = [f"user_{i}" for i in range(10)]
+    with pytest.raises(KeyboardInterrupt):
+        _run(monkeypatch, seeded, FakeClerkApi(everyone, crash_after=7))
+    assert len(_missing(mongo_db)) == 1 + 10 - 6  # two batches of three were written
+
+    resumed = FakeClerkApi(everyone)
+    _run(monkeypatch, seeded, resumed)
+
+    assert sorted(resumed.calls) == everyone[6:]
+    assert _missing(mongo_db) == ["dev_user_123"]
+
+
+def test_failures_are_retried_in_the_run_and_then_by_the_next_run(seeded, mongo_db, monkeypatch):
+    flaky = FakeClerkApi(f"user_{i}" for i in range(10) if i != 5)
+
+    _run(monkeypatch, seeded, flaky)
+
+    assert flaky.calls.count("user_5") == 2
+    _, failed = backfill.read_checkpoint(seeded)
+    assert [entry["clerk_user_id"] for entry in failed.values()] == ["user_5"]
+    assert [entry["attempts"] for entry in failed.values()] == [2]
+
+    recovered = FakeClerkApi(["user_5"])
+    _run(monkeypatch, seeded, recovered)
+
+    assert recovered.calls == ["user_5"]
+    assert backfill.read_checkpoint(seeded)[1] == {}
+    assert _missing(mongo_db) == ["dev_user_123"]
+
+
+def test_users_clerk_has_no_profile_for_are_given_up_on(seeded, mongo_db, monkeypatch, capsys):
+    everyone_but_5 = [f"user_{i}" for i in range(10) if i != 5]
+
+    for _ in range(3):
+        _run(monkeypatch, seeded, FakeClerkApi(everyone_but_5, failure=PROFILE_NOT_FOUND), max_attempts=3)
+    final = FakeClerkApi(everyone_but_5, failure=PROFILE_NOT_FOUND)
+    _run(monkeypatch, seeded, final, max_attempts=3)
+
+    # Two tries in the first run, one in the second, none after that
+    assert final.calls == []
+    _, failed = backfill.read_checkpoint(seeded)
+    assert [(entry["clerk_user_id"], entry["attempts"], entry["kind"]) for entry in failed.values()] == [
+        ("user_5", 3, PROFILE_NOT_FOUND)]
+    summary = capsys.readouterr().out.splitlines()[-1]
+    assert summary.startswith("⚠️ Gave up on 1 users") and summary.endswith("user_5")
+
+
+def test_transient_failures_keep_being_retried(seeded, monkeypatch):
+    everyone_but_5 = [f"user_{i}" for i in range(10) if i != 5]
+    for _ in range(3):
+        _run(monkeypatch, seeded, FakeClerkApi(everyone_but_5), max_attempts=2)
+
+    final = FakeClerkApi(everyone_but_5)
+    _run(monkeypatch, seeded, final, max_attempts=2)
+
+    assert final.calls == ["user_5"]
+
+
+def test_checkpoint_listing_only_ids_is_still_read(tmp_path):
+    path = tmp_path / "checkpoint"
+    user_id = ObjectId()
+    path.write_text(f'{{"last_id": null, "failed": ["{user_id}"]}}')
+
+    last_id, failed = backfill.read_checkpoint(str(path))
+
+    assert last_id is None
+    assert failed == {user_id: {"clerk_user_id": None, "attempts": 1, "kind": PROFILE_ERROR}}
+
+
+def test_restart_ignores_the_checkpoint(seeded, mongo_db, monkeypatch):
+    backfill.write_checkpoint(seeded, ObjectId("f" * 24), {})
+    clerk = FakeClerkApi(f"user_{i}" for i in range(10))
+
+    _run(monkeypatch, seeded, clerk, restart=True)
+
+    assert len(clerk.calls) == 10
+
+
+def test_rate_limiter_spaces_out_requests():
+    limiter = backfill.RateLimiter(rate=50, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+
+    assert time.monotonic() - start >= 0.09
@@ -0,0 +1,91 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import user_export
+from conftest import as_user
+from content_encoding import encode_stream
+
+
+@pytest.fixture
+def reviews(mongo_db):
+    start = datetime(2024, 3, 1)
+    mongo_db.reviews.insert_many([
+        {"_id": ObjectId(), "clerk_user_id": "user_a", "text": f"review {i}",
+         "predicted_sentiment": "Positive" if i % 2 else "Negative", "confidence": 0.5 + i / 100,
+         "created_at": start + timedelta(days=i)}
+        for i in range(10)
+    ])
+    mongo_db.reviews.insert_one({"_id": ObjectId(), "clerk_user_id": "user_b", "text": "not yours",
+                                 "predicted_sentiment": "Positive", "created_at": start})
+
+
+def _get(api_client, query="", **headers):
+    return api_client.get(f"/api/user-data{query}", headers=dict(as_user("user_a"), **headers))
+
+
+def test_json_export_lists_only_the_users_reviews_newest_first(api_client, reviews):
+    body = _get(api_client).get_json()
+
+    assert body["total"] == 10
+    assert [review["Sentence"] for review in body["reviews"]] == [f"review {i}" for i in reversed(range(10))]
+    assert set(body["reviews"][0]) == {"Sentence", "Predicted sentiment", "confidence"}
+
+
+def test_ndjson_is_negotiated_from_accept(api_client, reviews):
+    response = _get(api_client, Accept="application/x-ndjson")
+
+    assert response.mimetype == "application/x-ndjson"
+    assert len(response.get_data(as_text=True).splitlines()) == 10
+
+
+def test_date_and_field_filters(api_client, reviews):
+    body = _get(api_client, "?since=2024-03-03&until=2024-03-05&fields=Sentence,created_at").get_json()
+
+    assert [review["Sentence"] for review in body["reviews"]] == ["review 4", "review 3", "review 2"]
+    assert set(body["reviews"][0]) == {"Sentence", "created_at"}
+
+
+@pytest.mark.parametrize("query", ["?fields=clerk_user_id", "?since=yesterday", "?format=xml"])
+def test_bad_parameters_are_rejected(api_client, reviews, query):
+    assert _get(api_client, query).status_code == 400
+
+
+def test_gzip_is_negotiated_and_streamed(api_client, reviews, monkeypatch):
+    monkeypatch.setattr(user_export, "USER_DATA_FLUSH_BYTES", 64)
+    response = _get(api_client, **{"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert json.loads(gzip.decompress(response.get_data()))["total"] == 10
+
+
+def test_uncompressed_without_accept_encoding(api_client, reviews):
+    response = _get(api_client)
+
+    assert "Content-Encoding" not in response.headers
+    assert response.get_json()["total"] == 10
+
+
+def test_json_is_flushed_in_pieces_and_stays_valid(monkeypatch):
+    monkeypatch.setattr(user_export, "USER_DATA_FLUSH_BYTES", 50)
+    docs = [{"text": f"review {i}", "predicted_sentiment": "Positive"} for i in range(20)]
+
+    pieces = list(user_export.iter_user_data(iter(docs), ["Sentence", "Predicted sentiment"]))
+
+    assert len(pieces) > 5
+    assert json.loads(b"".join(pieces))["total"] == 20
+
+
+def test_empty_export_is_valid_json():
+    assert json.loads(b"".join(user_export.iter_user_data(iter([]), ["Sentence"]))) == {"reviews": [], "total": 0}
+
+
+def test_gzip_stream_decodes_to_the_input():
+    chunks = [b"abc" * 1000, b"", b"xyz" * 500]
+
+    assert gzip.decompress(b"".join(encode_stream(iter(chunks), "gzip"))) == b"".join(chunks)
+    assert list(encode_stream(iter(chunks), None)) == chunks
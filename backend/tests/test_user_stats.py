@@ -0,0 +1,84 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import api
+import user_stats
+from conftest import as_user
+from user_stats import DATA_VERSION_FIELD, RECONCILED_FIELD
+
+
+def _reviews(mongo_db, clerk_user_id, sentiments, **fields):
+    mongo_db.reviews.insert_many([dict({"_id": ObjectId(), "clerk_user_id": clerk_user_id,
+                                        "predicted_sentiment": sentiment}, **fields) for sentiment in sentiments])
+
+
+@pytest.fixture
+def user_a(mongo_db):
+    mongo_db.users.insert_one(dict(user_stats.initial_counters(datetime(2024, 1, 1)), clerk_user_id="user_a",
+                                   created_at=datetime(2024, 1, 1)))
+
+
+def _user(mongo_db, clerk_user_id="user_a"):
+    return mongo_db.users.find_one({"clerk_user_id": clerk_user_id})
+
+
+def test_review_increments_count_by_sentiment():
+    assert user_stats.review_increments(["Positive", "Negative", "Positive"]) == {
+        "total_reviews": 3, "positive_reviews": 2, "negative_reviews": 1, DATA_VERSION_FIELD: 1}
+
+
+def test_legacy_user_is_reconciled_on_first_read(mongo_db):
+    mongo_db.users.insert_one({"clerk_user_id": "user_a", "created_at": datetime(2023, 1, 1)})
+    _reviews(mongo_db, "user_a", ["Positive", "Positive", "Negative"])
+    _reviews(mongo_db, "user_b", ["Negative"])
+    mongo_db.analysis_sessions.insert_many([{"clerk_user_id": "user_a"}, {"clerk_user_id": "user_b"}])
+
+    stats = user_stats.get_user_stats("user_a")
+
+    assert (stats["total_reviews"], stats["positive_reviews"], stats["negative_reviews"]) == (3, 2, 1)
+    assert stats["total_sessions"] == 1
+    assert RECONCILED_FIELD in _user(mongo_db)
+    # Later reads come straight from the stored counters
+    assert user_stats.get_user_stats("user_a")["total_reviews"] == 3
+
+
+def test_deleting_reviews_takes_them_off_the_counters(mongo_db, user_a):
+    session_id = ObjectId()
+    _reviews(mongo_db, "user_a", ["Positive", "Negative", "Negative"], session_id=session_id)
+    _reviews(mongo_db, "user_a", ["Positive"])
+    user_stats.reconcile_user_stats("user_a")
+    version = _user(mongo_db)[DATA_VERSION_FIELD]
+
+    assert user_stats.delete_reviews("user_a", {"session_id": session_id}) == 3
+
+    user = _user(mongo_db)
+    assert (user["total_reviews"], user["positive_reviews"], user["negative_reviews"]) == (1, 1, 0)
+    assert user[DATA_VERSION_FIELD] == version + 1
+
+
+def test_delete_never_touches_another_users_reviews(mongo_db, user_a):
+    _reviews(mongo_db, "user_b", ["Positive"])
+
+    assert user_stats.delete_reviews("user_a", {}) == 0
+    assert mongo_db.reviews.count_documents({"clerk_user_id": "user_b"}) == 1
+
+
+def test_stale_counters_are_rebuilt_on_the_next_read(mongo_db, user_a):
+    _reviews(mongo_db, "user_a", ["Negative", "Negative"])
+
+    user_stats.mark_stats_stale("user_a")
+
+    assert user_stats.get_user_stats("user_a")["negative_reviews"] == 2
+
+
+def test_stats_endpoint_reads_the_counters_kept_by_writes(api_client, mongo_db, user_a, monkeypatch):
+    monkeypatch.setattr(api, "write_behind", None)
+    api.save_review("user_a", "great", "Positive", 0.9)
+    api.save_review_batch("user_a", ["bad", "awful"], ["Negative", "Negative"], [0.8, 0.7])
+
+    body = api_client.get("/api/stats", headers=as_user("user_a")).get_json()
+
+    assert (body["total_reviews"], body["positive_reviews"], body["negative_reviews"]) == (3, 1, 2)
+    assert body["total_reviews"] == mongo_db.reviews.count_documents({"clerk_user_id": "user_a"})
@@ -0,0 +1,97 @@
+import pytest
+
+import users
+from user_stats import COUNTER_FIELDS, DATA_VERSION_FIELD
+
+
+class CountingCollection:
+    """Counts the round trips made through a collection"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = 0
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return method(*args, **kwargs)
+        return counted
+
+
+@pytest.fixture
+def collection(monkeypatch, mongo_db):
+    counting = CountingCollection(mongo_db.users)
+    monkeypatch.setattr(users, "users_collection", counting)
+    monkeypatch.setattr(users, "_cache", users._UserCache(ttl=300))
+    return counting
+
+
+def _stored(mongo_db, clerk_user_id="user_a"):
+    return mongo_db.users.find_one({"clerk_user_id": clerk_user_id})
+
+
+def test_new_user_is_created_with_zeroed_counters_in_one_write(collection, mongo_db):
+    user = users.get_or_create_user("user_a", email="a@example.com", name="Ada")
+
+    assert collection.calls == 1
+    assert user["email"] == "a@example.com"
+    stored = _stored(mongo_db)
+    assert stored["name"] == "Ada"
+    assert stored["created_at"] == user["created_at"]
+    assert all(stored[field] == 0 for field in COUNTER_FIELDS + (DATA_VERSION_FIELD,))
+
+
+def test_repeat_requests_are_served_from_the_cache(collection):
+    users.get_or_create_user("user_a", email="a@example.com", name="Ada")
+
+    for _ in range(5):
+        assert users.get_or_create_user("user_a", email="a@example.com", name="Ada")["name"] == "Ada"
+
+    assert collection.calls == 1
+    assert users.user_cache_stats()["hits"] == 5
+
+
+def test_missing_name_is_filled_in_without_touching_the_rest(collection, mongo_db):
+    mongo_db.users.insert_one({"clerk_user_id": "user_a", "email": "old@example.com", "name": "",
+                               "total_reviews": 7, "created_at": users.datetime(2024, 1, 1)})
+
+    user = users.get_or_create_user("user_a", email="new@example.com", name="Ada")
+
+    stored = _stored(mongo_db)
+    assert (user["email"], user["name"]) == ("old@example.com", "Ada")
+    assert (stored["email"], stored["name"]) == ("old@example.com", "Ada")
+    assert stored["total_reviews"] == 7
+    assert stored["created_at"] == users.datetime(2024, 1, 1)
+
+
+def test_cached_user_missing_a_name_is_written_once_one_is_known(collection, mongo_db):
+    users.get_or_create_user("user_a")
+    users.get_or_create_user("user_a")
+    assert collection.calls == 1
+
+    users.get_or_create_user("user_a", name="Ada")
+
+    assert collection.calls == 2
+    assert _stored(mongo_db)["name"] == "Ada"
+
+
+def test_activity_is_written_again_after_the_interval(collection, mongo_db, monkeypatch):
+    users.get_or_create_user("user_a")
+    first_seen = _stored(mongo_db)["updated_at"]
+    monkeypatch.setattr(users, "USER_ACTIVITY_INTERVAL", 0)
+
+    users.get_or_create_user("user_a")
+
+    assert collection.calls == 2
+    assert _stored(mongo_db)["updated_at"] >= first_seen
+
+
+def test_refresh_user_overwrites_and_recaches(collection, mongo_db):
+    users.get_or_create_user("user_a", email="a@example.com", name="Ada")
+
+    users.refresh_user("user_a", name="Ada Lovelace")
+
+    assert _stored(mongo_db)["name"] == "Ada Lovelace"
+    assert users.cached_profile("user_a") == ("a@example.com", "Ada Lovelace")
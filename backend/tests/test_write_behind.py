@@ -0,0 +1,183 @@
+import threading
+import time
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError, OperationFailure
+
+import user_stats
+from user_stats import DATA_VERSION_FIELD, RECONCILED_FIELD
+from write_behind import WriteBehindBuffer
+
+
+class Outage:
+    """Wraps a collection so its writes fail while down is set"""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.down = threading.Event()
+        self.writer_threads = set()
+
+    def insert_many(self, docs, ordered=True):
+        self.writer_threads.add(threading.current_thread().name)
+        if self.down.is_set():
+            raise AutoReconnect("connection refused")
+        return self.collection.insert_many(docs, ordered=ordered)
+
+
+def _review(clerk_user_id="user_a"):
+    return {"_id": ObjectId(), "clerk_user_id": clerk_user_id, "predicted_sentiment": "Positive"}
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def users(mongo_db):
+    mongo_db.users.insert_many([{"clerk_user_id": "user_a", "total_reviews": 0},
+                                {"clerk_user_id": "user_b", "total_reviews": 0}])
+    return mongo_db.users
+
+
+def test_buffered_reviews_and_merged_increments_are_written(mongo_db, users):
+    buffer = WriteBehindBuffer(mongo_db.reviews, users, interval_ms=1)
+
+    for clerk_user_id in ("user_a", "user_a", "user_b"):
+        assert buffer.add(clerk_user_id, [_review(clerk_user_id)], total_reviews=1)
+    _wait_for(lambda: buffer.stats()["reviews_written"] == 3)
+
+    assert mongo_db.reviews.count_documents({}) == 3
+    assert users.find_one({"clerk_user_id": "user_a"})["total_reviews"] == 2
+    assert users.find_one({"clerk_user_id": "user_b"})["total_reviews"] == 1
+
+
+def test_failed_flush_requeues_without_sleeping(mongo_db, users):
+    reviews = Outage(mongo_db.reviews)
+    reviews.down.set()
+    buffer = WriteBehindBuffer(reviews, users, interval_ms=10_000, retry_backoff_ms=10_000)
+    buffer._ensure_started = lambda: None
+    buffer.add("user_a", [_review()], total_reviews=1)
+
+    start = time.monotonic()
+    buffer.flush()
+
+    assert time.monotonic() - start < 0.5
+    assert buffer.stats()["buffered_reviews"] == 1
+    assert buffer.stats()["requeued_reviews"] == 1
+
+
+def test_full_buffer_during_an_outage_drops_instead_of_writing_inline(mongo_db, users):
+    reviews = Outage(mongo_db.reviews)
+    reviews.down.set()
+    buffer = WriteBehindBuffer(reviews, users, interval_ms=1, max_items=2, max_buffer=4, max_wait_ms=20,
+                               retry_backoff_ms=50)
+
+    start = time.monotonic()
+    accepted = [buffer.add("user_a", [_review()], total_reviews=1) for _ in range(10)]
+
+    assert time.monotonic() - start < 2
+    assert reviews.writer_threads <= {"write-behind"}
+    stats = buffer.stats()
+    assert accepted.count(False) == stats["rejected_reviews"] > 0
+    assert stats["buffered_reviews"] <= 4
+
+    # Once the server is back, what was accepted is written and counted exactly once
+    reviews.down.clear()
+    _wait_for(lambda: buffer.stats()["buffered_reviews"] == 0)
+    assert mongo_db.reviews.count_documents({}) == accepted.count(True)
+    assert users.find_one({"clerk_user_id": "user_a"})["total_reviews"] == accepted.count(True)
+
+
+def test_writer_waiting_for_room_gets_in_once_the_flusher_drains(mongo_db, users):
+    buffer = WriteBehindBuffer(mongo_db.reviews, users, interval_ms=1, max_items=1, max_buffer=1,
+                               max_wait_ms=2000)
+    buffer._ensure_started = lambda: None
+    buffer.add("user_a", [_review()])
+
+    threading.Timer(0.1, buffer.flush).start()
+
+    assert buffer.add("user_a", [_review()])
+    assert buffer.stats()["rejected_reviews"] == 0
+
+
+class Failing:
+    """Wraps a collection so the next calls of method raise the given errors, then go through"""
+
+    def __init__(self, collection, method, *errors):
+        self.collection = collection
+        self.method = method
+        self.errors = list(errors)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.collection, name)
+        if name != self.method:
+            return attribute
+
+        def call(*args, **kwargs):
+            if self.errors:
+                raise self.errors.pop(0)
+            return attribute(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def reconciled_users(mongo_db):
+    for clerk_user_id in ("user_a", "user_b"):
+        mongo_db.users.insert_one(dict(user_stats.initial_counters(datetime(2024, 1, 1)), clerk_user_id=clerk_user_id))
+    return mongo_db.users
+
+
+def _is_stale(users, clerk_user_id):
+    user = users.find_one({"clerk_user_id": clerk_user_id})
+    return RECONCILED_FIELD not in user and user[DATA_VERSION_FIELD] > 0
+
+
+def test_rejected_reviews_leave_their_users_counters_to_be_rebuilt(mongo_db, reconciled_users):
+    kept, rejected = _review("user_a"), _review("user_b")
+    error = BulkWriteError({"writeErrors": [{"index": 1, "code": 121, "errmsg": "Document failed validation"}]})
+    reviews = Failing(mongo_db.reviews, "insert_many", error)
+    buffer = WriteBehindBuffer(reviews, reconciled_users)
+    buffer._ensure_started = lambda: None
+    mongo_db.reviews.insert_one(kept)  # what the server applied before rejecting the other one
+    buffer.add("user_a", [kept], total_reviews=1)
+    buffer.add("user_b", [rejected], total_reviews=1)
+
+    buffer.flush()
+
+    assert _is_stale(reconciled_users, "user_b")
+    assert not _is_stale(reconciled_users, "user_a")
+    assert buffer.stats()["dropped_reviews"] == 1
+    assert user_stats.get_user_stats("user_b")["total_reviews"] == 0
+
+
+def test_failed_counter_update_leaves_the_counters_to_be_rebuilt(mongo_db, reconciled_users):
+    users = Failing(reconciled_users, "bulk_write", OperationFailure("write conflict"))
+    buffer = WriteBehindBuffer(mongo_db.reviews, users)
+    buffer._ensure_started = lambda: None
+    buffer.add("user_a", [_review("user_a")], total_reviews=1, positive_reviews=1)
+
+    buffer.flush()
+
+    assert _is_stale(reconciled_users, "user_a")
+    assert buffer.stats()["stale_users_marked"] == 1
+    stats = user_stats.get_user_stats("user_a")
+    assert (stats["total_reviews"], stats["positive_reviews"]) == (1, 1)
+
+
+def test_stale_marks_are_retried_when_they_fail_too(mongo_db, reconciled_users):
+    users = Failing(reconciled_users, "bulk_write", OperationFailure("write conflict"),
+                    AutoReconnect("connection reset"))
+    buffer = WriteBehindBuffer(mongo_db.reviews, users, retry_backoff_ms=0)
+    buffer._ensure_started = lambda: None
+    buffer.add("user_a", [_review("user_a")], total_reviews=1)
+
+    buffer.flush()
+    assert not _is_stale(reconciled_users, "user_a")
+
+    buffer.flush()
+    assert _is_stale(reconciled_users, "user_a")
@@ -0,0 +1,152 @@
+import multiprocessing
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from stopwords import ENGLISH_STOPWORDS
+
+# pandas and nltk are imported where they are used rather than at startup: both are slow to
+# import, and nltk's package import also pulls in scipy.stats and sklearn
+STOPWORDS = ENGLISH_STOPWORDS
+
+# Review vocabularies are very repetitive, so each distinct token is stemmed once per process
+STEM_CACHE_SIZE = int(os.getenv("STEM_CACHE_SIZE", 100000))
+
+# cgroup v2 CPU quota of the container ("<quota> <period>" or "max <period>")
+CGROUP_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+
+
+def available_cpus():
+    """Cores this process may use: its CPU affinity, capped by the container's CPU quota"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open(CGROUP_CPU_MAX) as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+# Process pool for large uploads; below the row threshold preprocessing stays in-process.
+# Defaults to every available core; gunicorn_config.py sets it to the cores per gunicorn worker.
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", available_cpus()))
+PARALLEL_PREPROCESS_MIN_ROWS = int(os.getenv("PARALLEL_PREPROCESS_MIN_ROWS", 20000))
+
+_NON_LETTERS = re.compile("[^a-zA-Z]+")
+_stemmer = None
+
+
+def get_stemmer():
+    """NLTK's Porter stemmer, imported on first use"""
+    global _stemmer
+    if _stemmer is None:
+        from nltk.stem.porter import PorterStemmer
+        _stemmer = PorterStemmer()
+    return _stemmer
+
+
+@lru_cache(maxsize=STEM_CACHE_SIZE)
+def stem_token(word):
+    return get_stemmer().stem(word)
+
+
+def preload():
+    """Import pandas and the stemmer now, e.g. from a background thread once a worker is up"""
+    import pandas  # noqa: F401
+    get_stemmer()
+
+
+def tokenize(text):
+    """Split text into lowercase alphabetic tokens"""
+    return _NON_LETTERS.sub(" ", text).lower().split()
+
+
+def normalize_text(text):
+    """Preprocess a single review: keep letters, lowercase, drop stopwords and stem"""
+    if text is None:
+        return ""
+    if not isinstance(text, str):
+        import pandas as pd
+        if pd.isna(text):
+            return ""
+    tokens = tokenize(str(text))
+    return " ".join([stem_token(word) for word in tokens if word not in STOPWORDS])
+
+
+def normalize_series(texts):
+    """Preprocess a whole pandas Series of reviews, returning a Series of token strings"""
+    import pandas as pd
+
+    texts = pd.Series(texts)
+
+    # Tokenize every row with vectorized string operations
+    tokens = (
+        texts.fillna("")
+        .astype(str)
+        .str.replace(_NON_LETTERS, " ", regex=True)
+        .str.lower()
+        .str.split()
+    )
+
+    # Stem each distinct non-stopword token once for the whole batch
+    vocabulary = set()
+    for row_tokens in tokens:
+        vocabulary.update(row_tokens)
+    stems = {word: stem_token(word) for word in vocabulary if word not in STOPWORDS}
+
+    corpus = [" ".join([stems[word] for word in row_tokens if word in stems]) for row_tokens in tokens]
+    return pd.Series(corpus, index=texts.index, dtype=object)
+
+
+def normalize_texts(texts):
+    """Process-pool entry point: normalize a list of raw texts into a list of token strings"""
+    import pandas as pd
+
+    return normalize_series(pd.Series(texts, dtype=object)).tolist()
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_preprocess_pool():
+    """Shared preprocessing process pool, or None when only one worker is configured"""
+    global _pool, _pool_pid
+    if PREPROCESS_WORKERS <= 1:
+        return None
+    # A pool inherited across fork belongs to the parent, so each process creates its own
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                # forkserver avoids forking a multi-threaded worker; fall back to spawn elsewhere
+                method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                context = multiprocessing.get_context(method)
+                if method == "forkserver":
+                    context.set_forkserver_preload(["text_processing"])
+                _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, mp_context=context)
+                _pool_pid = os.getpid()
+                print(f"✅ Started preprocessing pool with {PREPROCESS_WORKERS} {method} workers")
+    return _pool
+
+
+def normalize_series_parallel(texts):
+    """normalize_series for large inputs, sharded across the preprocessing pool"""
+    import pandas as pd
+
+    texts = pd.Series(texts)
+    pool = get_preprocess_pool() if len(texts) >= PARALLEL_PREPROCESS_MIN_ROWS else None
+    if pool is None:
+        return normalize_series(texts)
+
+    shard_size = -(-len(texts) // PREPROCESS_WORKERS)
+    values = texts.tolist()
+    shards = [values[start:start + shard_size] for start in range(0, len(values), shard_size)]
+    corpus = []
+    for shard_corpus in pool.map(normalize_texts, shards):
+        corpus.extend(shard_corpus)
+    return pd.Series(corpus, index=texts.index, dtype=object)
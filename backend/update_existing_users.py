@@ -1,16 +1,149 @@
 """
 Script to update existing users with email and name from Clerk API
 Run this script to update users that have null email/name values
+
+Users are streamed from the database in _id order and their profiles fetched concurrently
+(bounded by --workers and --rate). Updates go out as one unordered bulk_write per batch,
+after which the last _id is written to the checkpoint file, so an interrupted run picks up
+where it stopped. Users whose profile couldn't be fetched are retried once at the end of the
+run; those still failing are kept in the checkpoint and retried first by the next run.
+Users Clerk doesn't know or has no email/name for are given up on after --max-attempts
+tries and listed at the end of each run. Use --restart to ignore the checkpoint and go through every user again.
 """
 
+import argparse
+import json
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from bson import ObjectId
+from pymongo import UpdateOne
 from database import users_collection
-from auth import get_user_info_from_clerk
+from auth import get_user_info_outcome
+from clerk_profiles import PERMANENT_PROFILE_FAILURES, PROFILE_EMPTY, clerk_retry_after
 
 load_dotenv()
 
-def update_existing_users():
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 8))
+# Clerk API requests per second across all workers
+BACKFILL_RATE = float(os.getenv("BACKFILL_RATE", 10))
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", 200))
+# Tries before a user Clerk has no profile for (404 or no email/name) stops being retried
+BACKFILL_MAX_ATTEMPTS = int(os.getenv("BACKFILL_MAX_ATTEMPTS", 3))
+BACKFILL_CHECKPOINT = os.getenv("BACKFILL_CHECKPOINT", os.path.join(os.path.dirname(__file__), ".update_existing_users.checkpoint"))
+
+
+class RateLimiter:
+    """Token bucket shared by the worker threads"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_checkpoint(path):
+    """(last processed _id, {_id: {"clerk_user_id", "attempts", "kind"}} of users whose profile couldn't be fetched)"""
+    try:
+        with open(path) as f:
+            value = f.read().strip()
+    except FileNotFoundError:
+        return None, {}
+    if not value:
+        return None, {}
+    state = json.loads(value)
+    last_id = state.get("last_id")
+    failed = state.get("failed", {})
+    if isinstance(failed, list):
+        # Checkpoints from before attempts were counted only listed the _ids
+        failed = {user_id: {"clerk_user_id": None, "attempts": 1, "kind": "error"} for user_id in failed}
+    return (ObjectId(last_id) if last_id else None), {ObjectId(user_id): entry for user_id, entry in failed.items()}
+
+
+def write_checkpoint(path, last_id, failed):
+    # Written to a temporary file first so a crash never leaves a half-written checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_id": str(last_id) if last_id else None,
+                   "failed": {str(user_id): entry for user_id, entry in failed.items()}}, f)
+    os.replace(tmp_path, path)
+
+
+def given_up(entry, max_attempts):
+    """Whether a failed user is no longer worth retrying"""
+    return entry["kind"] in PERMANENT_PROFILE_FAILURES and entry["attempts"] >= max_attempts
+
+
+def record_failures(failed, failures):
+    """Count another attempt for each of failures ({_id: (clerk_user_id, kind)})"""
+    for user_id, (clerk_user_id, kind) in failures.items():
+        attempts = failed.get(user_id, {}).get("attempts", 0) + 1
+        failed[user_id] = {"clerk_user_id": clerk_user_id, "attempts": attempts, "kind": kind}
+
+
+def fetch_user_info(clerk_user_id, limiter):
+    """((email, name), failure kind or None) of one user, waiting out the rate limit and any open circuit breaker"""
+    wait = clerk_retry_after()
+    while wait > 0:
+        time.sleep(wait)
+        wait = clerk_retry_after()
+    limiter.acquire()
+    return get_user_info_outcome(clerk_user_id)
+
+
+def iter_batches(cursor, batch_size):
+    batch = []
+    for user in cursor:
+        batch.append(user)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def update_batch(pool, batch, limiter):
+    """Fetch and store the profiles of a batch of users; returns (users updated, {_id: (clerk_user_id, kind)} that failed)"""
+    users = [user for user in batch if user.get("clerk_user_id")]
+    # map keeps the batch in order; at most batch_size profile fetches are in flight
+    profiles = pool.map(lambda user: fetch_user_info(user["clerk_user_id"], limiter), users)
+
+    operations = []
+    failures = {}
+    for user, ((email, name), kind) in zip(users, profiles):
+        update_fields = {}
+        if email:
+            update_fields["email"] = email
+        if name:
+            update_fields["name"] = name
+        if update_fields:
+            operations.append(UpdateOne({"_id": user["_id"]}, {"$set": update_fields}))
+        else:
+            failures[user["_id"]] = (user["clerk_user_id"], kind or PROFILE_EMPTY)
+            print(f"  ⚠️ Could not fetch email/name from Clerk API for {user['clerk_user_id']}")
+
+    updated = users_collection.bulk_write(operations, ordered=False).modified_count if operations else 0
+    return updated, failures
+
+
+def update_existing_users(workers=BACKFILL_WORKERS, rate=BACKFILL_RATE, batch_size=BACKFILL_BATCH_SIZE,
+                          checkpoint=BACKFILL_CHECKPOINT, restart=False, max_attempts=BACKFILL_MAX_ATTEMPTS):
     """Update all users with null email or name"""
     try:
         # Test if collection is accessible
@@ -18,55 +151,93 @@ def update_existing_users():
     except Exception as e:
         print(f"❌ Database not available: {e}")
         return
-    
+
     # Find all users with null email or name
-    users_to_update = list(users_collection.find({
+    query = {
         "$or": [
             {"email": None},
             {"email": {"$exists": False}},
             {"name": None},
             {"name": {"$exists": False}}
-        ]
-    }))
-    
-    print(f"Found {len(users_to_update)} users to update")
-    
-    updated_count = 0
-    for user in users_to_update:
-        clerk_user_id = user.get("clerk_user_id")
-        if not clerk_user_id:
-            continue
-        
-        print(f"\nUpdating user: {clerk_user_id}")
-        
-        # Skip dev users (can't fetch from Clerk API)
-        if clerk_user_id.startswith("dev_user_"):
-            print(f"  ⚠️ Skipping dev user (can't fetch from Clerk API)")
-            continue
-        
-        # Fetch user info from Clerk API
-        email, name = get_user_info_from_clerk(clerk_user_id)
-        
-        if email or name:
-            update_fields = {}
-            if email:
-                update_fields["email"] = email
-                print(f"  ✅ Email: {email}")
-            if name:
-                update_fields["name"] = name
-                print(f"  ✅ Name: {name}")
-            
-            if update_fields:
-                users_collection.update_one(
-                    {"clerk_user_id": clerk_user_id},
-                    {"$set": update_fields}
-                )
-                updated_count += 1
-        else:
-            print(f"  ⚠️ Could not fetch email/name from Clerk API")
-    
+        ],
+        # Dev users can't be fetched from the Clerk API
+        "clerk_user_id": {"$not": {"$regex": "^dev_user_"}},
+    }
+    last_id, failed = (None, {}) if restart else read_checkpoint(checkpoint)
+    limiter = RateLimiter(rate)
+    processed = updated_count = 0
+    start = time.monotonic()
+
+    def retry(user_ids):
+        """Run the users again, updating failed: those fixed (or since dropped out of the query) leave it"""
+        nonlocal updated_count
+        still_failing = {}
+        cursor = users_collection.find(dict(query, _id={"$in": user_ids}), {"clerk_user_id": 1}).sort("_id", 1)
+        for batch in iter_batches(cursor, batch_size):
+            updated, failures = update_batch(pool, batch, limiter)
+            updated_count += updated
+            still_failing.update(failures)
+        for user_id in user_ids:
+            if user_id not in still_failing:
+                failed.pop(user_id, None)
+        record_failures(failed, still_failing)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        retry_ids = [user_id for user_id, entry in failed.items() if not given_up(entry, max_attempts)]
+        if retry_ids:
+            print(f"Retrying {len(retry_ids)} users that failed in the previous run")
+            # The checkpoint keeps listing them until the retry is done, so a crash here loses nothing
+            retry(retry_ids)
+            write_checkpoint(checkpoint, last_id, failed)
+
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+            print(f"Resuming after user {last_id} (checkpoint {checkpoint})")
+
+        print(f"Found {users_collection.count_documents(query)} users to update")
+        cursor = users_collection.find(query, {"clerk_user_id": 1}).sort("_id", 1).batch_size(batch_size)
+        query.pop("_id", None)
+        new_failures = []
+
+        for batch in iter_batches(cursor, batch_size):
+            updated, failures = update_batch(pool, batch, limiter)
+            updated_count += updated
+            record_failures(failed, failures)
+            new_failures += failures
+            last_id = batch[-1]["_id"]
+            write_checkpoint(checkpoint, last_id, failed)
+
+            processed += len(batch)
+            elapsed = time.monotonic() - start
+            print(f"  {processed} users processed, {updated_count} updated, {len(failed)} failed "
+                  f"({processed / elapsed if elapsed else 0:.1f} users/s)")
+
+        # Failures from this run are often transient (rate limits, an open circuit); try them once more
+        new_failures = [user_id for user_id in new_failures if not given_up(failed[user_id], max_attempts)]
+        if new_failures:
+            print(f"Retrying {len(new_failures)} users whose profile could not be fetched")
+            retry(new_failures)
+            write_checkpoint(checkpoint, last_id, failed)
+
     print(f"\n✅ Updated {updated_count} users")
+    abandoned = sorted(entry["clerk_user_id"] or str(user_id)
+                       for user_id, entry in failed.items() if given_up(entry, max_attempts))
+    retrying = len(failed) - len(abandoned)
+    if retrying:
+        print(f"⚠️ {retrying} users could not be fetched; they are retried first on the next run")
+    if abandoned:
+        print(f"⚠️ Gave up on {len(abandoned)} users Clerk has no profile for after {max_attempts} attempts: "
+              f"{', '.join(abandoned)}")
 
-if __name__ == "__main__":
-    update_existing_users()
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="concurrent Clerk API requests")
+    parser.add_argument("--rate", type=float, default=BACKFILL_RATE, help="Clerk API requests per second")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="users per bulk write and checkpoint")
+    parser.add_argument("--checkpoint", default=BACKFILL_CHECKPOINT, help="file recording the last processed user")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first user")
+    parser.add_argument("--max-attempts", type=int, default=BACKFILL_MAX_ATTEMPTS,
+                        help="tries before a user Clerk has no profile for is given up on")
+    args = parser.parse_args()
+    update_existing_users(args.workers, args.rate, args.batch_size, args.checkpoint, args.restart, args.max_attempts)
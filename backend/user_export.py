@@ -0,0 +1,111 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+# Fields a user-data export can contain: output name -> review document field
+USER_DATA_FIELDS = {
+    "Sentence": "text",
+    "Predicted sentiment": "predicted_sentiment",
+    "confidence": "confidence",
+    "created_at": "created_at",
+}
+DEFAULT_USER_DATA_FIELDS = ("Sentence", "Predicted sentiment", "confidence")
+
+# Reviews fetched per Mongo round trip; bounds how many documents are held at once
+USER_DATA_BATCH_SIZE = int(os.getenv("USER_DATA_BATCH_SIZE", 1000))
+# Serialized reviews are collected into pieces of about this size before being sent
+USER_DATA_FLUSH_BYTES = int(os.getenv("USER_DATA_FLUSH_BYTES", 64 * 1024))
+
+USER_DATA_MIME_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def parse_fields(fields_param):
+    """Output fields from a comma-separated ?fields= value; raises ValueError for unknown ones"""
+    if not fields_param:
+        return list(DEFAULT_USER_DATA_FIELDS)
+    fields = [field.strip() for field in fields_param.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in USER_DATA_FIELDS]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}. Use any of: {', '.join(USER_DATA_FIELDS)}.")
+    return fields
+
+
+def parse_date(value, end=False):
+    """Datetime from an ISO date or datetime; a bare date used as an end bound covers that whole day"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}. Use YYYY-MM-DD or an ISO 8601 datetime.")
+    if parsed.tzinfo is not None:
+        # Stored timestamps are naive UTC
+        parsed = (parsed - parsed.utcoffset()).replace(tzinfo=None)
+    if end and "T" not in value and " " not in value.strip():
+        parsed += timedelta(days=1)
+    return parsed
+
+
+def user_data_query(clerk_user_id, since=None, until=None):
+    """Review filter for one user, optionally limited to created_at in [since, until)"""
+    query = {"clerk_user_id": clerk_user_id}
+    created_at = {}
+    if since is not None:
+        created_at["$gte"] = since
+    if until is not None:
+        created_at["$lt"] = until
+    if created_at:
+        query["created_at"] = created_at
+    return query
+
+
+def user_data_projection(fields):
+    projection = {USER_DATA_FIELDS[field]: 1 for field in fields}
+    projection["_id"] = 0
+    return projection
+
+
+def format_review(review, fields):
+    """A review document in the shape the dashboard expects (ReviewData)"""
+    formatted = {}
+    for field in fields:
+        source = USER_DATA_FIELDS[field]
+        if field == "Sentence":
+            formatted[field] = review.get(source, "")
+        elif field == "Predicted sentiment":
+            formatted[field] = review.get(source, "Unknown")
+        elif source in review:
+            value = review[source]
+            formatted[field] = value.isoformat() if isinstance(value, datetime) else value
+    return formatted
+
+
+def iter_user_data(reviews, fields, output_format="json"):
+    """Serialize reviews as they come off the cursor, yielding bytes in pieces of ~USER_DATA_FLUSH_BYTES.
+
+    json produces the same {"reviews": [...], "total": n} document as before, written
+    incrementally; ndjson produces one review per line.
+    """
+    ndjson = output_format == "ndjson"
+    buffer = [] if ndjson else ['{"reviews": [']
+    size = 0
+    total = 0
+    for review in reviews:
+        line = json.dumps(format_review(review, fields))
+        if ndjson:
+            line += "\n"
+        elif total:
+            line = ", " + line
+        buffer.append(line)
+        size += len(line)
+        total += 1
+        if size >= USER_DATA_FLUSH_BYTES:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if not ndjson:
+        buffer.append(f'], "total": {total}}}')
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
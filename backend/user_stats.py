@@ -0,0 +1,143 @@
+"""Per-user review/session counters kept on the users document.
+
+Every write path increments (or, for deletions, decrements) these counters, so /api/stats
+reads one document instead of counting reviews. reconcile_user_stats rebuilds them from
+the reviews and analysis_sessions collections when they may have drifted:
+
+    python user_stats.py                 # every user
+    python user_stats.py <clerk_user_id> # one user
+"""
+import sys
+from datetime import datetime
+
+import numpy as np
+
+# Import database module
+try:
+    from database import users_collection, reviews_collection, analysis_sessions_collection
+    DB_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: Database modules not available: {e}")
+    DB_AVAILABLE = False
+
+COUNTER_FIELDS = ("total_reviews", "positive_reviews", "negative_reviews", "total_sessions")
+
+# Bumped whenever a user's reviews or sessions change; read endpoints derive their ETags from it
+DATA_VERSION_FIELD = "data_version"
+
+# Users created before the counters existed lack this field and are reconciled on first read
+RECONCILED_FIELD = "stats_reconciled_at"
+
+
+def initial_counters(now):
+    """Counter fields for a brand-new user ($setOnInsert)"""
+    return dict({field: 0 for field in COUNTER_FIELDS}, **{DATA_VERSION_FIELD: 0, RECONCILED_FIELD: now})
+
+
+def review_increments(sentiments):
+    """$inc amounts for newly saved reviews with the given predicted sentiments"""
+    sentiments = np.asarray(sentiments, dtype=object)
+    positive = int(np.count_nonzero(sentiments == "Positive"))
+    negative = int(np.count_nonzero(sentiments == "Negative"))
+    return {"total_reviews": len(sentiments), "positive_reviews": positive, "negative_reviews": negative,
+            DATA_VERSION_FIELD: 1}
+
+
+def bump_data_version(clerk_user_id):
+    """Mark a user's data as changed when no counter update does it already"""
+    users_collection.update_one({"clerk_user_id": clerk_user_id}, {"$inc": {DATA_VERSION_FIELD: 1}})
+
+
+def mark_stats_stale(clerk_user_id):
+    """Have a user's counters rebuilt on their next read, e.g. after some of their writes were lost"""
+    users_collection.update_one(
+        {"clerk_user_id": clerk_user_id},
+        {"$unset": {RECONCILED_FIELD: ""}, "$inc": {DATA_VERSION_FIELD: 1}}
+    )
+
+
+def get_data_version(clerk_user_id):
+    """Current data version of a user (0 before their first write)"""
+    user = users_collection.find_one({"clerk_user_id": clerk_user_id}, {DATA_VERSION_FIELD: 1, "_id": 0})
+    return (user or {}).get(DATA_VERSION_FIELD, 0)
+
+
+def delete_reviews(clerk_user_id, query):
+    """Delete some of a user's reviews and take them off the user's counters"""
+    query = dict(query, clerk_user_id=clerk_user_id)  # User isolation enforced
+    counts = {
+        row["_id"]: row["count"]
+        for row in reviews_collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": "$predicted_sentiment", "count": {"$sum": 1}}},
+        ])
+    }
+    result = reviews_collection.delete_many(query)
+    if result.deleted_count:
+        users_collection.update_one(
+            {"clerk_user_id": clerk_user_id},
+            {"$inc": {
+                "total_reviews": -result.deleted_count,
+                "positive_reviews": -counts.get("Positive", 0),
+                "negative_reviews": -counts.get("Negative", 0),
+                DATA_VERSION_FIELD: 1,
+            }}
+        )
+    return result.deleted_count
+
+
+def get_user_stats(clerk_user_id):
+    """Counters and creation date of a user from a single document read"""
+    user = users_collection.find_one(
+        {"clerk_user_id": clerk_user_id},
+        {field: 1 for field in COUNTER_FIELDS + ("created_at", DATA_VERSION_FIELD, RECONCILED_FIELD)}
+    )
+    if user is not None and RECONCILED_FIELD not in user:
+        user.update(reconcile_user_stats(clerk_user_id))
+        user[DATA_VERSION_FIELD] = user.get(DATA_VERSION_FIELD, 0) + 1
+    return user
+
+
+def reconcile_user_stats(clerk_user_id):
+    """Recompute a user's counters from their reviews (one $facet aggregation) and sessions"""
+    facets = next(reviews_collection.aggregate([
+        {"$match": {"clerk_user_id": clerk_user_id}},
+        {"$facet": {
+            "total": [{"$count": "count"}],
+            "by_sentiment": [{"$group": {"_id": "$predicted_sentiment", "count": {"$sum": 1}}}],
+        }},
+    ]), {"total": [], "by_sentiment": []})
+    by_sentiment = {row["_id"]: row["count"] for row in facets["by_sentiment"]}
+
+    counters = {
+        "total_reviews": facets["total"][0]["count"] if facets["total"] else 0,
+        "positive_reviews": by_sentiment.get("Positive", 0),
+        "negative_reviews": by_sentiment.get("Negative", 0),
+        "total_sessions": analysis_sessions_collection.count_documents({"clerk_user_id": clerk_user_id}),
+    }
+    users_collection.update_one(
+        {"clerk_user_id": clerk_user_id},
+        {"$set": dict(counters, **{RECONCILED_FIELD: datetime.utcnow()}), "$inc": {DATA_VERSION_FIELD: 1}}
+    )
+    return counters
+
+
+def reconcile_all_user_stats():
+    """Rebuild the counters of every user; returns how many users were reconciled"""
+    reconciled = 0
+    for user in users_collection.find({}, {"clerk_user_id": 1}):
+        try:
+            reconcile_user_stats(user["clerk_user_id"])
+            reconciled += 1
+        except Exception as e:
+            print(f"❌ Error reconciling stats for user {user['clerk_user_id']}: {e}")
+    return reconciled
+
+
+if __name__ == "__main__":
+    if not DB_AVAILABLE:
+        sys.exit(1)
+    if len(sys.argv) > 1:
+        print(reconcile_user_stats(sys.argv[1]))
+    else:
+        print(f"✅ Reconciled stats for {reconcile_all_user_stats()} users")
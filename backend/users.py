@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from user_stats import initial_counters
+
+# Import database module
+try:
+    from database import users_collection
+    DB_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: Database modules not available: {e}")
+    DB_AVAILABLE = False
+
+# Users seen recently are resolved from memory without touching the database
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", 300))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+# updated_at (last activity) is written at most once per user per interval
+USER_ACTIVITY_INTERVAL = int(os.getenv("USER_ACTIVITY_INTERVAL", 300))
+
+# Fields kept in the cache; counters are not, since other writers change them
+_CACHED_FIELDS = {"clerk_user_id": 1, "email": 1, "name": 1, "created_at": 1}
+
+
+class _UserCache:
+    """Small per-process LRU of user documents with a TTL"""
+
+    def __init__(self, max_size=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clerk_user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(clerk_user_id)
+            if entry is None or entry["expires_at"] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(clerk_user_id)
+            self.hits += 1
+            return entry
+
+    def put(self, user, activity_at):
+        with self._lock:
+            self._entries[user["clerk_user_id"]] = {
+                "user": {field: user.get(field) for field in _CACHED_FIELDS},
+                "expires_at": time.monotonic() + self.ttl,
+                "activity_at": activity_at,
+            }
+            self._entries.move_to_end(user["clerk_user_id"])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_cache = _UserCache()
+
+
+def _missing(value):
+    return value is None or value == ""
+
+
+def _new_user_fields(email, name, now):
+    return dict(initial_counters(now), email=email, name=name, created_at=now)
+
+
+def _get_or_create_pipeline(email, name, now):
+    """Update pipeline that creates the user or records activity, filling in a missing email/name.
+
+    Insert-only fields are written when the document has no created_at yet (i.e. it is being
+    upserted); email/name keep a stored value and otherwise take the one from the token.
+    """
+    is_new = {"$eq": [{"$ifNull": ["$created_at", None]}, None]}
+    fields = {field: {"$cond": [is_new, {"$literal": value}, f"${field}"]}
+              for field, value in _new_user_fields(email, name, now).items() if field not in ("email", "name")}
+    for field, value in (("email", email), ("name", name)):
+        if value:
+            fields[field] = {"$cond": [{"$in": [{"$ifNull": [f"${field}", ""]}, [""]]}, {"$literal": value}, f"${field}"]}
+        else:
+            fields[field] = {"$ifNull": [f"${field}", None]}
+    fields["updated_at"] = now
+    return [{"$set": fields}]
+
+
+def get_or_create_user(clerk_user_id, email=None, name=None):
+    """Get existing user or create new one, filling in email/name if missing.
+
+    Recently resolved users come from the in-process cache. Otherwise a single upsert creates
+    the user, records activity and fills in a stored email/name that is missing, returning the
+    document as it was so creations and fills can be told apart.
+    """
+    if not DB_AVAILABLE:
+        return None
+
+    try:
+        # Mongo keeps millisecond precision; truncating keeps the cached created_at equal to the stored one
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        entry = _cache.get(clerk_user_id)
+        if entry is not None:
+            user = entry["user"]
+            stale_activity = time.monotonic() - entry["activity_at"] >= USER_ACTIVITY_INTERVAL
+            needs_info = (_missing(user.get("email")) and email) or (_missing(user.get("name")) and name)
+            if not stale_activity and not needs_info:
+                return user
+
+        # Create the user, bump last activity and fill in email/name in one write
+        before = users_collection.find_one_and_update(
+            {"clerk_user_id": clerk_user_id},
+            _get_or_create_pipeline(email, name, now),
+            projection=_CACHED_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        if before is None:
+            user = {"clerk_user_id": clerk_user_id, "email": email, "name": name, "created_at": now}
+            print(f"✅ Created new user: {clerk_user_id} (email: {email}, name: {name})")
+        else:
+            user = before
+            for field, value in (("email", email), ("name", name)):
+                if value and _missing(user.get(field)):
+                    user[field] = value
+                    print(f"✅ Updated {field} for user: {clerk_user_id} -> {value}")
+
+        _cache.put(user, time.monotonic())
+        return user
+    except Exception as e:
+        print(f"Error in get_or_create_user: {e}")
+        return None
+
+
+def refresh_user(clerk_user_id, email=None, name=None):
+    """Overwrite email/name with the given values (creating the user if needed) and return the user"""
+    if not DB_AVAILABLE:
+        return None
+
+    now = datetime.utcnow()
+    update_fields = {"updated_at": now}
+    if email:
+        update_fields["email"] = email
+    if name:
+        update_fields["name"] = name
+    insert_fields = {field: value for field, value in _new_user_fields(email, name, now).items()
+                     if field not in update_fields}
+
+    user = users_collection.find_one_and_update(
+        {"clerk_user_id": clerk_user_id},
+        {"$setOnInsert": insert_fields, "$set": update_fields},
+        projection=_CACHED_FIELDS,
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    _cache.put(user, time.monotonic())
+    return user
+
+
+def cached_profile(clerk_user_id):
+    """(email, name) of a user resolved recently in this process, or None; never touches the database"""
+    entry = _cache.get(clerk_user_id)
+    if entry is None:
+        return None
+    return entry["user"].get("email"), entry["user"].get("name")
+
+
+def user_cache_stats():
+    return _cache.stats()
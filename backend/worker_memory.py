@@ -0,0 +1,122 @@
+"""
+Memory report for a gunicorn master and its workers. USS (pages only that process maps) is
+what each extra worker really costs; PSS splits shared pages between the processes sharing
+them, so the PSS column adds up to the total footprint.
+
+    python worker_memory.py [--pid <gunicorn master pid>] [--json]
+
+Without --pid the gunicorn master is looked up in /proc. Linux only.
+"""
+
+import argparse
+import json
+import os
+
+# Fields of /proc/<pid>/smaps_rollup, in kB
+_SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def process_memory(pid="self"):
+    """rss, pss, uss and shared memory of a process in MB, or None where /proc isn't available"""
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                key = parts[0].rstrip(":") if parts else None
+                if key in _SMAPS_FIELDS:
+                    values[_SMAPS_FIELDS[key]] = int(parts[1])
+    except (FileNotFoundError, ProcessLookupError, PermissionError):
+        return None
+    if not values:
+        return None
+    uss = values.get("private_clean", 0) + values.get("private_dirty", 0)
+    shared = values.get("shared_clean", 0) + values.get("shared_dirty", 0)
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_mb": round(values.get("rss", 0) / 1024, 1),
+        "pss_mb": round(values.get("pss", 0) / 1024, 1),
+        "uss_mb": round(uss / 1024, 1),
+        "shared_mb": round(shared / 1024, 1),
+    }
+
+
+def _is_gunicorn(pid):
+    """Whether the process runs gunicorn itself (directly or as python .../gunicorn)"""
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            argv = f.read().decode(errors="replace").split("\0")
+    except OSError:
+        return False
+    return any(os.path.basename(arg).startswith("gunicorn") for arg in argv[:2])
+
+
+def _parent_pid(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # The command name may contain spaces; fields after it are space separated
+            return int(f.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def child_pids(pid):
+    pids = []
+    for entry in os.listdir("/proc"):
+        if entry.isdigit() and _parent_pid(entry) == int(pid):
+            pids.append(int(entry))
+    return sorted(pids)
+
+
+def find_gunicorn_master():
+    """PID of a running gunicorn master (a gunicorn process whose parent isn't one), or None"""
+    gunicorns = {int(entry) for entry in os.listdir("/proc") if entry.isdigit() and _is_gunicorn(entry)}
+    masters = sorted(pid for pid in gunicorns if _parent_pid(pid) not in gunicorns)
+    return masters[0] if masters else None
+
+
+def memory_report(master_pid):
+    """Memory of the master and each worker plus totals; the PSS total is the real footprint"""
+    master = process_memory(master_pid)
+    workers = [memory for memory in map(process_memory, child_pids(master_pid)) if memory]
+    processes = ([master] if master else []) + workers
+    return {
+        "master": master,
+        "workers": workers,
+        "total_rss_mb": round(sum(p["rss_mb"] for p in processes), 1),
+        "total_pss_mb": round(sum(p["pss_mb"] for p in processes), 1),
+        "worker_uss_mb": round(sum(p["uss_mb"] for p in workers) / len(workers), 1) if workers else None,
+    }
+
+
+def print_report(report):
+    print(f"{'process':<16}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'uss MB':>10}{'shared MB':>11}")
+    rows = [("master", report["master"])] if report["master"] else []
+    rows += [(f"worker {i}", worker) for i, worker in enumerate(report["workers"], 1)]
+    for name, p in rows:
+        print(f"{name:<16}{p['pid']:>8}{p['rss_mb']:>10}{p['pss_mb']:>10}{p['uss_mb']:>10}{p['shared_mb']:>11}")
+    print(f"\nTotal RSS {report['total_rss_mb']} MB, total PSS {report['total_pss_mb']} MB, "
+          f"unique per worker {report['worker_uss_mb']} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pid", type=int, help="gunicorn master pid (found automatically when omitted)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+
+    master_pid = args.pid or find_gunicorn_master()
+    if master_pid is None:
+        raise SystemExit("❌ No gunicorn master found; pass --pid")
+    report = memory_report(master_pid)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,284 @@
+import atexit
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError, ServerSelectionTimeoutError
+
+from user_stats import DATA_VERSION_FIELD, RECONCILED_FIELD
+
+# On by default: single-text predictions return before their review is written
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", 5))
+# Flush right away once this many reviews are buffered
+WRITE_BEHIND_MAX_ITEMS = int(os.getenv("WRITE_BEHIND_MAX_ITEMS", 500))
+# Past this depth (e.g. while Mongo is unreachable) writers wait up to WRITE_BEHIND_MAX_WAIT_MS for
+# the flusher to make room, then their reviews are dropped (and counted) rather than buffered
+WRITE_BEHIND_MAX_BUFFER = int(os.getenv("WRITE_BEHIND_MAX_BUFFER", 50000))
+WRITE_BEHIND_MAX_WAIT_MS = float(os.getenv("WRITE_BEHIND_MAX_WAIT_MS", 50))
+# Pause of the flusher after a failed write, so an unreachable server isn't hammered every few ms
+WRITE_BEHIND_RETRY_BACKOFF_MS = float(os.getenv("WRITE_BEHIND_RETRY_BACKOFF_MS", 500))
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class WriteBehindBuffer:
+    """Buffers review inserts and per-user counter increments and writes them in the background.
+
+    Each flush is one unordered insert_many of the buffered reviews plus one bulk_write with a
+    single merged $inc per user. Reviews carry their _id, so a flush retried after a network
+    error can't insert a review twice. Users whose reviews or increments had to be dropped get
+    their counters marked stale (as user_stats.mark_stats_stale does), so they are rebuilt on
+    the next stats read.
+    """
+
+    def __init__(self, reviews_collection, users_collection, interval_ms=WRITE_BEHIND_INTERVAL_MS,
+                 max_items=WRITE_BEHIND_MAX_ITEMS, max_buffer=WRITE_BEHIND_MAX_BUFFER,
+                 max_wait_ms=WRITE_BEHIND_MAX_WAIT_MS, retry_backoff_ms=WRITE_BEHIND_RETRY_BACKOFF_MS):
+        self.reviews_collection = reviews_collection
+        self.users_collection = users_collection
+        self.interval = interval_ms / 1000.0
+        self.max_items = max(1, max_items)
+        self.max_buffer = max(self.max_items, max_buffer)
+        self.max_wait = max_wait_ms / 1000.0
+        self.retry_backoff = retry_backoff_ms / 1000.0
+
+        self._lock = threading.Lock()
+        # Signalled when a flush takes the buffer, so writers waiting for room can re-check
+        self._space = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._retry_at = 0.0
+        self._has_items = threading.Event()
+        self._full = threading.Event()
+        self._reviews = []
+        self._increments = {}
+        self._stale_users = set()
+        self._thread = None
+        self._thread_pid = None
+
+        self._stats_lock = threading.Lock()
+        self._flushes = 0
+        self._reviews_written = 0
+        self._increments_written = 0
+        self._errors = 0
+        self._requeued = 0
+        self._dropped = 0
+        self._rejected = 0
+        self._stale_marked = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def _ensure_started(self):
+        # Started lazily (and again after fork) so the flusher thread belongs to the worker
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def add(self, clerk_user_id, reviews=(), **increments):
+        """Buffer review documents and counter increments for one user.
+
+        Returns False when the buffer stayed full for max_wait and nothing was buffered.
+        """
+        self._ensure_started()
+        with self._lock:
+            if len(self._reviews) >= self.max_buffer:
+                # The flusher is falling behind; give it a moment rather than write on the request thread
+                self._full.set()
+                if not self._space.wait_for(lambda: len(self._reviews) < self.max_buffer, self.max_wait):
+                    with self._stats_lock:
+                        self._rejected += len(reviews)
+                    return False
+            self._reviews.extend(reviews)
+            counters = self._increments.setdefault(clerk_user_id, Counter())
+            counters.update({field: value for field, value in increments.items() if value})
+            self._has_items.set()
+            if len(self._reviews) >= self.max_items:
+                self._full.set()
+        return True
+
+    def _run(self):
+        while True:
+            # Idle until something is buffered, then give concurrent requests a few ms to join
+            self._has_items.wait()
+            self._full.wait(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"❌ Error in write-behind flush: {e}")
+            # After a failed write, wait before retrying; only the flusher sleeps, never with a lock held
+            delay = self._retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def flush(self):
+        """Write everything buffered so far"""
+        with self._flush_lock:
+            with self._lock:
+                reviews, increments, stale_users = self._reviews, self._increments, self._stale_users
+                self._reviews, self._increments, self._stale_users = [], {}, set()
+                self._has_items.clear()
+                self._full.clear()
+                self._space.notify_all()
+            if not reviews and not increments and not stale_users:
+                return
+
+            start = time.perf_counter()
+            written, dropped_users = self._write_reviews(reviews)
+            merged, failed_users = self._write_increments(increments)
+            # After the increments, so a rebuild can't be overtaken by counters it already includes
+            self._mark_stale(stale_users | dropped_users | failed_users)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            with self._stats_lock:
+                self._flushes += 1
+                self._reviews_written += written
+                self._increments_written += merged
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                self._total_flush_ms += elapsed_ms
+
+    def _write_reviews(self, reviews):
+        """(reviews written, users some of whose reviews were dropped)"""
+        if not reviews:
+            return 0, set()
+        try:
+            self.reviews_collection.insert_many(reviews, ordered=False)
+            return len(reviews), set()
+        except BulkWriteError as e:
+            # Duplicates were written by an earlier attempt; anything else can't be fixed by retrying
+            errors = e.details.get("writeErrors", [])
+            failed = [error for error in errors if error.get("code") != DUPLICATE_KEY_ERROR]
+            if failed:
+                print(f"❌ Write-behind dropped {len(failed)} reviews: {failed[0].get('errmsg')}")
+                self._count_error(dropped=len(failed))
+            # Their increments are still applied, so those users' counters have to be rebuilt
+            return len(reviews) - len(errors), {reviews[error["index"]]["clerk_user_id"] for error in failed}
+        except PyMongoError as e:
+            print(f"⚠️ Write-behind review insert failed, will retry: {e}")
+            self._requeue(reviews=reviews)
+            return 0, set()
+
+    def _write_increments(self, increments):
+        """(counter updates written, users whose increments may be lost)"""
+        if not increments:
+            return 0, set()
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne({"clerk_user_id": clerk_user_id}, {"$inc": dict(counters), "$set": {"updated_at": now}})
+            if counters else
+            UpdateOne({"clerk_user_id": clerk_user_id}, {"$set": {"updated_at": now}})
+            for clerk_user_id, counters in increments.items()
+        ]
+        try:
+            self.users_collection.bulk_write(operations, ordered=False)
+            return len(operations), set()
+        except ServerSelectionTimeoutError as e:
+            # Nothing was sent, so the increments can safely be applied later
+            print(f"⚠️ Write-behind counter update failed, will retry: {e}")
+            self._requeue(increments=increments)
+        except PyMongoError as e:
+            # The server may have applied some of them; retrying could double count, so the
+            # counters are rebuilt from the reviews instead
+            print(f"❌ Write-behind counter update failed: {e}")
+            self._count_error()
+            return 0, set(increments)
+        return 0, set()
+
+    def _mark_stale(self, clerk_user_ids):
+        """Have the users' counters rebuilt on their next read and bump their data version"""
+        if not clerk_user_ids:
+            return
+        operations = [
+            UpdateOne({"clerk_user_id": clerk_user_id},
+                      {"$unset": {RECONCILED_FIELD: ""}, "$inc": {DATA_VERSION_FIELD: 1}})
+            for clerk_user_id in clerk_user_ids
+        ]
+        try:
+            self.users_collection.bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            # Marking twice is harmless, so keep them for the next flush
+            print(f"⚠️ Write-behind could not mark {len(operations)} users for a stats rebuild, will retry: {e}")
+            with self._lock:
+                self._stale_users.update(clerk_user_ids)
+                self._has_items.set()
+            self._retry_at = time.monotonic() + self.retry_backoff
+            self._count_error()
+            return
+        with self._stats_lock:
+            self._stale_marked += len(operations)
+
+    def _requeue(self, reviews=(), increments=None):
+        # Put back in front of what was buffered meanwhile; add() keeps that below max_buffer, so
+        # the buffer stays bounded without dropping reviews whose counters may already be written
+        with self._lock:
+            self._reviews[:0] = reviews
+            for clerk_user_id, counters in (increments or {}).items():
+                self._increments.setdefault(clerk_user_id, Counter()).update(counters)
+            self._has_items.set()
+        self._retry_at = time.monotonic() + self.retry_backoff
+        self._count_error(requeued=len(reviews))
+
+    def _count_error(self, requeued=0, dropped=0):
+        with self._stats_lock:
+            self._errors += 1
+            self._requeued += requeued
+            self._dropped += dropped
+
+    def stats(self):
+        """Buffer depth and flush latency for tuning the interval"""
+        with self._lock:
+            buffered_reviews = len(self._reviews)
+            buffered_users = len(self._increments)
+        with self._stats_lock:
+            return {
+                "enabled": True,
+                "interval_ms": self.interval * 1000,
+                "max_items": self.max_items,
+                "buffered_reviews": buffered_reviews,
+                "buffered_users": buffered_users,
+                "flushes": self._flushes,
+                "reviews_written": self._reviews_written,
+                "counter_updates_written": self._increments_written,
+                "errors": self._errors,
+                "requeued_reviews": self._requeued,
+                "dropped_reviews": self._dropped,
+                "rejected_reviews": self._rejected,
+                "stale_users_marked": self._stale_marked,
+                "last_flush_ms": self._last_flush_ms,
+                "max_flush_ms": self._max_flush_ms,
+                "avg_flush_ms": self._total_flush_ms / self._flushes if self._flushes else 0.0,
+            }
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_write_behind(reviews_collection, users_collection):
+    """Process-wide write-behind buffer, or None when WRITE_BEHIND=false"""
+    global _buffer
+    if not WRITE_BEHIND_ENABLED:
+        return None
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = WriteBehindBuffer(reviews_collection, users_collection)
+                atexit.register(flush_write_behind)
+    return _buffer
+
+
+def flush_write_behind():
+    """Write out whatever is buffered, e.g. on graceful shutdown"""
+    if _buffer is not None:
+        try:
+            _buffer.flush()
+        except Exception as e:
+            print(f"❌ Error flushing write-behind buffer on shutdown: {e}")
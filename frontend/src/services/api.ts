@@ -106,7 +106,8 @@ export const predictBulkSentiment = async (file: File, token: string | null): Pr
     const formData = new FormData();
     formData.append('file', file);
 
-    const response = await fetch(`${API_BASE_URL}/predict`, {
+    // The dashboard draws its own charts from the CSV, so skip server-side chart rendering
+    const response = await fetch(`${API_BASE_URL}/predict?chart=none`, {
       method: 'POST',
       headers: getAuthHeaders(token),
       body: formData,
@@ -228,11 +229,17 @@ export const getUserData = async (token: string | null): Promise<UserDataRespons
 };
 
 /**
- * Get user reviews
+ * Get a page of user reviews, newest first; pass next_cursor back in to get the following page
  */
-export const getUserReviews = async (token: string | null, limit = 50, skip = 0): Promise<{ reviews: UserReview[] }> => {
+export const getUserReviews = async (
+  token: string | null,
+  limit = 50,
+  cursor: string | null = null
+): Promise<{ reviews: UserReview[]; next_cursor: string | null }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/reviews?limit=${limit}&skip=${skip}`, {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/api/reviews?${params}`, {
       headers: getAuthHeaders(token),
     });
 
@@ -249,11 +256,17 @@ export const getUserReviews = async (token: string | null, limit = 50, skip = 0)
 };
 
 /**
- * Get user analysis sessions
+ * Get a page of user analysis sessions, newest first; pass next_cursor back in to get the following page
  */
-export const getUserSessions = async (token: string | null): Promise<{ sessions: UserSession[] }> => {
+export const getUserSessions = async (
+  token: string | null,
+  limit = 50,
+  cursor: string | null = null
+): Promise<{ sessions: UserSession[]; next_cursor: string | null }> => {
   try {
-    const response = await fetch(`${API_BASE_URL}/api/sessions`, {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${API_BASE_URL}/api/sessions?${params}`, {
       headers: getAuthHeaders(token),
     });
 